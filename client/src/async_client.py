@@ -0,0 +1,249 @@
+import asyncio
+import json
+import ssl
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .client import (
+    BIND_IP,
+    BIND_PORT,
+    BUSY_RESPONSE,
+    MAX_IDLE,
+    PIPELINE_WINDOW,
+    POOL_SIZE,
+    READY_COMMAND,
+    RESPONSES,
+    RETRIES,
+    SSL_ENABLED,
+    STATS_COMMAND,
+    TIMEOUT,
+    _SingleShot,
+    _check_query,
+    create_context,
+    parse_count,
+    parse_response,
+)
+
+"""
+asyncio variant of the client library.
+
+Same behavior as `SearchClient`: a pool of persistent connections,
+pipelined `exists_many`, timeouts, retries on fresh connections and the
+fallback to one connection per query for single-shot servers.
+"""
+
+Streams = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class AsyncConnection:
+    """One persistent connection to the server."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.last_used: float = time.monotonic()
+
+    async def request(self, queries: List[bytes], timeout: float) -> List[str]:
+        """Send newline-terminated queries at once and read their answers."""
+        self.writer.write(b"".join(query + b"\n" for query in queries))
+        await asyncio.wait_for(self.writer.drain(), timeout or None)
+        answers: List[str] = []
+        for _ in queries:
+            line: bytes = await asyncio.wait_for(self.reader.readline(), timeout or None)
+            if not line.endswith(b"\n"):
+                response: str = line.decode("utf-8", "replace").strip()
+                if response in RESPONSES:
+                    raise _SingleShot(response)
+                if response == BUSY_RESPONSE:
+                    raise ConnectionError("Server busy")
+                raise ConnectionError(
+                    f"Connection closed by the server{': ' + response if response else ''}"
+                )
+            answers.append(line[:-1].decode("utf-8", "replace"))
+        self.last_used = time.monotonic()
+        return answers
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+
+class AsyncSearchClient:
+    """
+    asyncio client of the string search server.
+
+    Args:
+        host: Server address
+        port: Server port
+        ssl_context: Context for TLS connections, or None for plain TCP
+        pool_size: Maximum number of open connections
+        timeout: Seconds allowed to connect and to receive an answer
+        retries: Attempts on a fresh connection after a failure
+        pipeline_window: Queries sent at once before reading their answers
+        max_idle: Seconds after which an idle connection is not reused
+    """
+
+    def __init__(
+        self,
+        host: str = BIND_IP,
+        port: int = BIND_PORT,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        pool_size: int = POOL_SIZE,
+        timeout: float = TIMEOUT,
+        retries: int = RETRIES,
+        pipeline_window: int = PIPELINE_WINDOW,
+        max_idle: float = MAX_IDLE,
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.timeout: float = timeout
+        self.retries: int = retries
+        self.pipeline_window: int = max(1, pipeline_window)
+        self.max_idle: float = max_idle
+        # Whether the server answers one query per connection, None until
+        # its first answer shows it
+        self.single_shot: Optional[bool] = None
+        self._idle: List[AsyncConnection] = []
+        # Created on first use, inside the running event loop
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pool_size: int = max(1, pool_size)
+
+    async def __aenter__(self) -> "AsyncSearchClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def exists(self, query: str) -> bool:
+        """Check whether a string exists on the server."""
+        return parse_response((await self.request([query]))[0])
+
+    async def exists_many(self, queries: Iterable[str]) -> List[bool]:
+        """Check many strings, pipelined over one connection."""
+        return [parse_response(answer) for answer in await self.request(list(queries))]
+
+    async def count_prefix(self, prefix: str) -> int:
+        """Count the records starting with a prefix."""
+        return parse_count((await self.request([f"PREFIX {prefix}"]))[0])
+
+    async def count_field(self, field: int, value: str) -> int:
+        """Count the records whose field at a position (from 1) equals a value."""
+        return parse_count((await self.request([f"FIELD {field}={value}"]))[0])
+
+    async def stats(self) -> Dict[str, Any]:
+        """Return the server metrics answered to the STATS command."""
+        return json.loads((await self.request([STATS_COMMAND]))[0])
+
+    async def ready(self) -> bool:
+        """Whether the server has loaded its data and answers queries."""
+        return (await self.request([READY_COMMAND]))[0].startswith(READY_COMMAND)
+
+    async def request(self, queries: List[str]) -> List[str]:
+        """Send raw queries and return the raw answers, in order."""
+        encoded: List[bytes] = [_check_query(query) for query in queries]
+        answers: List[str] = []
+        if self.single_shot is None and encoded:
+            # A single-shot server would read pipelined queries as one, so
+            # the first query goes alone
+            answers.extend(await self._with_retries(encoded[:1]))
+            encoded = encoded[1:]
+        window: int = self.pipeline_window
+        for start in range(0, len(encoded), window):
+            answers.extend(await self._with_retries(encoded[start : start + window]))
+        return answers
+
+    async def _with_retries(self, queries: List[bytes]) -> List[str]:
+        attempt: int = 0
+        while True:
+            try:
+                if self.single_shot:
+                    return [await self._single_shot(query) for query in queries]
+                return await self._pipelined(queries)
+            except (OSError, asyncio.TimeoutError):
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                await asyncio.sleep(min(0.05 * 2 ** (attempt - 1), 1.0))
+
+    async def _open(self) -> Streams:
+        return await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host,
+                self.port,
+                ssl=self.ssl_context,
+                server_hostname=self.host if self.ssl_context else None,
+            ),
+            self.timeout or None,
+        )
+
+    async def _acquire(self) -> AsyncConnection:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._pool_size)
+        await asyncio.wait_for(self._slots.acquire(), self.timeout or None)
+        now: float = time.monotonic()
+        while self._idle:
+            connection: AsyncConnection = self._idle.pop()
+            if now - connection.last_used < self.max_idle:
+                return connection
+            await connection.close()
+        try:
+            return AsyncConnection(*await self._open())
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release(self, connection: AsyncConnection, reuse: bool = True) -> None:
+        if reuse:
+            self._idle.append(connection)
+        else:
+            await connection.close()
+        self._slots.release()
+
+    async def _pipelined(self, queries: List[bytes]) -> List[str]:
+        connection: AsyncConnection = await self._acquire()
+        try:
+            answers: List[str] = await connection.request(queries, self.timeout)
+        except _SingleShot as e:
+            await self._release(connection, reuse=False)
+            self.single_shot = True
+            return [e.response] + [
+                await self._single_shot(query) for query in queries[1:]
+            ]
+        except BaseException:
+            await self._release(connection, reuse=False)
+            raise
+        await self._release(connection)
+        self.single_shot = False
+        return answers
+
+    async def _single_shot(self, query: bytes) -> str:
+        """Send one query without a newline on its own connection."""
+        reader, writer = await self._open()
+        connection: AsyncConnection = AsyncConnection(reader, writer)
+        try:
+            writer.write(query)
+            await writer.drain()
+            data: bytes = await asyncio.wait_for(reader.read(), self.timeout or None)
+        finally:
+            await connection.close()
+        response: str = data.decode("utf-8", "replace").strip()
+        if response == BUSY_RESPONSE:
+            raise ConnectionError("Server busy")
+        return response
+
+    async def close(self) -> None:
+        """Close the pooled connections."""
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await connection.close()
+
+
+def create_async_client() -> AsyncSearchClient:
+    """Create an asyncio client for the server in config.ini."""
+    return AsyncSearchClient(
+        BIND_IP, BIND_PORT, create_context() if SSL_ENABLED else None
+    )
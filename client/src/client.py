@@ -1,51 +1,417 @@
+import json
+import os
 import socket
 import ssl
-from typing import Optional
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Union
 from . import config_loader
 
 CONFIG: dict = config_loader.load_config()
 BIND_IP: str = CONFIG["host"]
 BIND_PORT: int = CONFIG["port"]
 SSL_ENABLED: bool = CONFIG["ssl_enabled"]
+SSL_CERT: str = CONFIG["ssl_certificate"]
+SSL_KEY: str = CONFIG["ssl_private_key"]
+POOL_SIZE: int = CONFIG["pool_size"]
+TIMEOUT: float = CONFIG["timeout"]
+RETRIES: int = CONFIG["retries"]
+PIPELINE_WINDOW: int = CONFIG["pipeline_window"]
+MAX_IDLE: float = CONFIG["max_idle"]
 
+# Relative certificate paths are relative to the client directory
+client_dir: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SSL_CERT and not os.path.isabs(SSL_CERT):
+    SSL_CERT = os.path.abspath(os.path.join(client_dir, SSL_CERT))
+if SSL_KEY and not os.path.isabs(SSL_KEY):
+    SSL_KEY = os.path.abspath(os.path.join(client_dir, SSL_KEY))
+
+# Wire protocol responses
+RESPONSES: Dict[str, bool] = {"STRING EXISTS": True, "STRING NOT EXIST": False}
+BUSY_RESPONSE: str = "SERVER BUSY"
+STATS_COMMAND: str = "STATS"
+READY_COMMAND: str = "READY"
+RECV_SIZE: int = 65536
 
 """
-Create an SSL context with a specified protocol and load the
-certificate chain and key for the server.
-@param ssl.PROTOCOL_TLS_SERVER - The protocol to use for the SSL context.
-@param "../security/server.crt" - The path to the server certificate.
-@param "../security/server.key" - The path to the server key file.
+Client library for the string search server.
+
+`SearchClient` keeps a thread-safe pool of persistent connections, so
+queries skip the TCP and TLS setup that used to dominate their latency,
+and new TLS connections resume the session of the previous one.
+`exists_many` pipelines its queries: a window of newline-terminated
+queries is written at once and the answers are read back in order.
+
+Servers that answer only one query per connection (single-shot) are
+detected from their first answer, which comes without a newline before
+the connection closes; the client then opens a connection per query.
+Queries are idempotent, so failed connections are retried on a fresh one.
 """
-context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-context.check_hostname = False
-context.verify_mode = ssl.CERT_NONE
-context.minimum_version = ssl.TLSVersion.TLSv1_2
-context.maximum_version = ssl.TLSVersion.TLSv1_3
-
-context.load_cert_chain(
-    certfile="../security/server.crt", keyfile="../security/server.key"
-)
-
-# Create a new socket using the AF_INET address family and SOCK_STREAM socket type.
-client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-data: str = ""
-
-# Wrap the given socket for SSL/TLS encryption in server mode within a context manager.
-while True:
-    data = input()
-    with socket.create_connection((BIND_IP, BIND_PORT)) as sock:
+
+
+class ClientError(Exception):
+    """The server answered a query with an error."""
+
+
+def create_context(cert_file: str = SSL_CERT, key_file: str = SSL_KEY) -> ssl.SSLContext:
+    """
+    Create the client SSL context for the server's self-signed certificate.
+
+    Args:
+        cert_file: Client certificate to present, if any
+        key_file: Private key of the client certificate
+
+    Returns:
+        ssl.SSLContext: A TLS 1.2 to 1.3 context without certificate checks.
+    """
+    context: ssl.SSLContext = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.maximum_version = ssl.TLSVersion.TLSv1_3
+    if cert_file and key_file and os.path.exists(cert_file):
+        context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+    return context
+
+
+def parse_response(response: str) -> bool:
+    """
+    Convert an answer of the server to whether the string exists.
+
+    Raises:
+        ClientError: If the server answered with an error.
+    """
+    try:
+        return RESPONSES[response]
+    except KeyError:
+        raise ClientError(response or "Empty response") from None
+
+
+def parse_count(response: str) -> int:
+    """
+    Read the number of matching records from a PREFIX or FIELD answer.
+
+    Raises:
+        ClientError: If the server answered with an error.
+    """
+    answer, _, count = response.rpartition(" ")
+    if answer not in RESPONSES or not count.isdigit():
+        raise ClientError(response or "Empty response")
+    return int(count)
+
+
+def _check_query(query: str) -> bytes:
+    """Encode a query, which must fit on one line of the protocol."""
+    if "\n" in query:
+        raise ValueError(f"Query contains a newline: {query!r}")
+    return query.encode()
+
+
+class _SingleShot(Exception):
+    """The server closed the connection after answering one query."""
+
+    def __init__(self, response: str) -> None:
+        super().__init__(response)
+        self.response: str = response
+
+
+class Connection:
+    """One persistent connection to the server."""
+
+    def __init__(self, sock: Union[socket.socket, ssl.SSLSocket]) -> None:
+        self.sock: Union[socket.socket, ssl.SSLSocket] = sock
+        self.last_used: float = time.monotonic()
+        self._buffer: bytes = b""
+
+    def request(self, queries: List[bytes]) -> List[str]:
+        """
+        Send newline-terminated queries at once and read their answers.
+
+        Raises:
+            _SingleShot: If the server answered the first query without a
+                newline and closed the connection.
+            ConnectionError: If the connection closed before all answers.
+        """
+        self.sock.sendall(b"".join(query + b"\n" for query in queries))
+        answers: List[str] = [self._read_line() for _ in queries]
+        self.last_used = time.monotonic()
+        return answers
+
+    def _read_line(self) -> str:
+        while b"\n" not in self._buffer:
+            chunk: bytes = self.sock.recv(RECV_SIZE)
+            if not chunk:
+                response: str = self._buffer.decode("utf-8", "replace").strip()
+                if response in RESPONSES:
+                    raise _SingleShot(response)
+                if response == BUSY_RESPONSE:
+                    raise ConnectionError("Server busy")
+                raise ConnectionError(
+                    f"Connection closed by the server{': ' + response if response else ''}"
+                )
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode("utf-8", "replace")
+
+    def close(self) -> None:
         try:
-            ssock: Optional[ssl.SSLSocket] = None
-            if SSL_ENABLED:
-                ssock = context.wrap_socket(sock, server_hostname=BIND_IP)
-                ssock.sendall(data.encode())
-                response = ssock.recv(1024)
-                print(response.decode())
-
-            else:
-                sock.sendall(data.encode())
-                response = sock.recv(1024)
-                print(response.decode())
-        finally:
-            # Closing socket
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of persistent connections to one server.
+
+    Args:
+        host: Server address
+        port: Server port
+        ssl_context: Context for TLS connections, or None for plain TCP
+        size: Maximum number of open connections
+        timeout: Seconds allowed to connect, to receive an answer and to
+            wait for a free connection
+        max_idle: Seconds after which an idle connection is not reused, as
+            the server may have closed it
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        size: int = POOL_SIZE,
+        timeout: float = TIMEOUT,
+        max_idle: float = MAX_IDLE,
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.timeout: float = timeout
+        self.max_idle: float = max_idle
+        self._idle: List[Connection] = []
+        self._slots = threading.BoundedSemaphore(max(1, size))
+        self._lock = threading.Lock()
+        # Last TLS session, offered again by new connections
+        self._session: Optional[ssl.SSLSession] = None
+
+    def open_socket(self) -> Union[socket.socket, ssl.SSLSocket]:
+        """Open a new socket to the server, resuming the last TLS session."""
+        sock: Union[socket.socket, ssl.SSLSocket] = socket.create_connection(
+            (self.host, self.port), timeout=self.timeout
+        )
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.ssl_context is None:
+            return sock
+        try:
+            return self.ssl_context.wrap_socket(
+                sock, server_hostname=self.host, session=self._session
+            )
+        except (OSError, ValueError):
             sock.close()
+            raise
+
+    def keep_session(self, sock: Union[socket.socket, ssl.SSLSocket]) -> None:
+        """Remember the TLS session of a socket that has received data."""
+        if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+            self._session = sock.session
+
+    def acquire(self) -> Connection:
+        """
+        Take an idle connection, or open one if the pool is not full.
+
+        Raises:
+            TimeoutError: If no connection frees up within the timeout.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No free connection in the pool")
+        now: float = time.monotonic()
+        with self._lock:
+            while self._idle:
+                connection: Connection = self._idle.pop()
+                if now - connection.last_used < self.max_idle:
+                    return connection
+                connection.close()
+        try:
+            return Connection(self.open_socket())
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection: Connection, reuse: bool = True) -> None:
+        """Return a connection to the pool, or close it if it is broken."""
+        if reuse:
+            self.keep_session(connection.sock)
+            with self._lock:
+                self._idle.append(connection)
+        else:
+            connection.close()
+        self._slots.release()
+
+    def close(self) -> None:
+        """Close the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class SearchClient:
+    """
+    Client of the string search server.
+
+    Args:
+        host: Server address
+        port: Server port
+        ssl_context: Context for TLS connections, or None for plain TCP
+        pool_size: Maximum number of open connections
+        timeout: Seconds allowed to connect and to receive an answer
+        retries: Attempts on a fresh connection after a failure
+        pipeline_window: Queries sent at once before reading their answers
+    """
+
+    def __init__(
+        self,
+        host: str = BIND_IP,
+        port: int = BIND_PORT,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        pool_size: int = POOL_SIZE,
+        timeout: float = TIMEOUT,
+        retries: int = RETRIES,
+        pipeline_window: int = PIPELINE_WINDOW,
+    ) -> None:
+        self.pool: ConnectionPool = ConnectionPool(
+            host, port, ssl_context, pool_size, timeout
+        )
+        self.retries: int = retries
+        self.pipeline_window: int = max(1, pipeline_window)
+        # Whether the server answers one query per connection, None until
+        # its first answer shows it
+        self.single_shot: Optional[bool] = None
+
+    def __enter__(self) -> "SearchClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def exists(self, query: str) -> bool:
+        """
+        Check whether a string exists on the server.
+
+        Raises:
+            ClientError: If the server answered with an error.
+            OSError: If the server could not be reached after the retries.
+        """
+        return parse_response(self.request([query])[0])
+
+    def exists_many(self, queries: Iterable[str]) -> List[bool]:
+        """
+        Check many strings, pipelined over one connection.
+
+        Returns:
+            List[bool]: Whether each string exists, in the same order.
+        """
+        return [parse_response(answer) for answer in self.request(list(queries))]
+
+    def count_prefix(self, prefix: str) -> int:
+        """Count the records starting with a prefix."""
+        return parse_count(self.request([f"PREFIX {prefix}"])[0])
+
+    def count_field(self, field: int, value: str) -> int:
+        """Count the records whose field at a position (from 1) equals a value."""
+        return parse_count(self.request([f"FIELD {field}={value}"])[0])
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the server metrics answered to the STATS command."""
+        return json.loads(self.request([STATS_COMMAND])[0])
+
+    def ready(self) -> bool:
+        """Whether the server has loaded its data and answers queries."""
+        return self.request([READY_COMMAND])[0].startswith(READY_COMMAND)
+
+    def request(self, queries: List[str]) -> List[str]:
+        """Send raw queries and return the raw answers, in order."""
+        encoded: List[bytes] = [_check_query(query) for query in queries]
+        answers: List[str] = []
+        if self.single_shot is None and encoded:
+            # A single-shot server would read pipelined queries as one, so
+            # the first query goes alone
+            answers.extend(self._with_retries(encoded[:1]))
+            encoded = encoded[1:]
+        window: int = self.pipeline_window
+        for start in range(0, len(encoded), window):
+            answers.extend(self._with_retries(encoded[start : start + window]))
+        return answers
+
+    def _with_retries(self, queries: List[bytes]) -> List[str]:
+        """Send a window of queries, retrying on fresh connections."""
+        attempt: int = 0
+        while True:
+            try:
+                if self.single_shot:
+                    return [self._single_shot(query) for query in queries]
+                return self._pipelined(queries)
+            except OSError:
+                # Includes timeouts and connections closed by the server
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                time.sleep(min(0.05 * 2 ** (attempt - 1), 1.0))
+
+    def _pipelined(self, queries: List[bytes]) -> List[str]:
+        connection: Connection = self.pool.acquire()
+        try:
+            answers: List[str] = connection.request(queries)
+        except _SingleShot as e:
+            self.pool.release(connection, reuse=False)
+            self.single_shot = True
+            # The first query was answered, the rest go one per connection
+            return [e.response] + [self._single_shot(query) for query in queries[1:]]
+        except BaseException:
+            self.pool.release(connection, reuse=False)
+            raise
+        self.pool.release(connection)
+        self.single_shot = False
+        return answers
+
+    def _single_shot(self, query: bytes) -> str:
+        """Send one query without a newline on its own connection."""
+        with self.pool.open_socket() as sock:
+            sock.sendall(query)
+            chunks: List[bytes] = []
+            while True:
+                chunk: bytes = sock.recv(RECV_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            self.pool.keep_session(sock)
+        response: str = b"".join(chunks).decode("utf-8", "replace").strip()
+        if response == BUSY_RESPONSE:
+            raise ConnectionError("Server busy")
+        return response
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.pool.close()
+
+
+def create_client() -> SearchClient:
+    """Create a client for the server in config.ini."""
+    return SearchClient(
+        BIND_IP, BIND_PORT, create_context() if SSL_ENABLED else None
+    )
+
+
+def run() -> None:
+    """Read queries from stdin, one per line, and print the answers."""
+    with create_client() as client:
+        while True:
+            try:
+                data: str = input()
+            except EOFError:
+                break
+            try:
+                print(client.request([data])[0])
+            except (ValueError, OSError) as e:
+                print(f"Error: {e}")
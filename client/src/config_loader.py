@@ -19,6 +19,11 @@ def load_config() -> Dict[str, Any]:
             "ssl_enabled": config.getboolean("SSL", "SSL_ENABLED", fallback=False),
             "ssl_certificate": config.get("SSL", "SSL_CERT", fallback=""),
             "ssl_private_key": config.get("SSL", "SSL_KEY", fallback=""),
+            "pool_size": config.getint("CLIENT", "POOL_SIZE", fallback=4),
+            "timeout": config.getfloat("CLIENT", "TIMEOUT", fallback=5.0),
+            "retries": config.getint("CLIENT", "RETRIES", fallback=2),
+            "pipeline_window": config.getint("CLIENT", "PIPELINE_WINDOW", fallback=256),
+            "max_idle": config.getfloat("CLIENT", "MAX_IDLE", fallback=25.0),
         }
     except Exception as e:
         print(f"Error loading configuration: {e}")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import argparse
+import configparser
+import os
+import sys
+
+# Make the server package importable when run as `python data/shard_data.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.server.sharding import split_file, write_instance_config  # noqa: E402
+
+BASE_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server", "config.ini"
+)
+
+
+def shard_data(input_file, shards, replicas, output_dir, base_config, host, base_port):
+    # Split the data file by a stable hash of each line
+    partitions = split_file(input_file, shards, output_dir)
+
+    # One config file per replica of each shard, on consecutive ports, and
+    # one for the router listening on the port of the base config
+    addresses = [[] for _ in range(shards)]
+    configs = []
+    for replica in range(replicas):
+        for shard, (path, _) in enumerate(partitions):
+            port = base_port + replica * shards + shard
+            config_path = os.path.join(output_dir, f"shard{shard}-replica{replica}.ini")
+            write_instance_config(base_config, config_path, port, data_file=path)
+            addresses[shard].append((host, port))
+            configs.append(config_path)
+    router_config = os.path.join(output_dir, "router.ini")
+    router_port = _base_port(base_config, 8080)
+    write_instance_config(base_config, router_config, router_port, shards=addresses)
+    return partitions, configs, router_config
+
+
+def _base_port(base_config, default):
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(base_config)
+    return config.getint("SERVER", "PORT", fallback=default)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Split a data file into hash partitions for a sharded deployment"
+    )
+    parser.add_argument("input_file", nargs="?", default="data/200k.txt")
+    parser.add_argument("--shards", type=int, required=True, help="number of partitions")
+    parser.add_argument(
+        "--replicas", type=int, default=1, help="servers per partition (default 1)"
+    )
+    parser.add_argument("--output-dir", default="data/shards")
+    parser.add_argument(
+        "--config", default=BASE_CONFIG, help="config the instance configs derive from"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="host of the shard servers")
+    parser.add_argument(
+        "--base-port", type=int, help="port of the first shard server (default: router port + 1)"
+    )
+    args = parser.parse_args()
+
+    base_port = args.base_port or _base_port(args.config, 8080) + 1
+    partitions, configs, router_config = shard_data(
+        args.input_file,
+        args.shards,
+        args.replicas,
+        args.output_dir,
+        args.config,
+        args.host,
+        base_port,
+    )
+    for path, count in partitions:
+        print(f"{count} records saved to {path}")
+    print("Start the shard servers and the router from the server directory:")
+    for config_path in configs + [router_config]:
+        print(f"  SEARCH_SERVER_CONFIG={os.path.abspath(config_path)} python main.py")
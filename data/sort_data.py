@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
+import argparse
+import os
+import sys
+
+# Make the server package importable when run as `python data/sort_data.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.server.index_file import write_index_file  # noqa: E402
+
 
 def sort_data(input_file, output_file):
     # Read all lines from the input file
     with open(input_file, 'r') as f:
         lines = f.readlines()
-    
+
     # Parse each line and prepare for sorting
     # We'll convert the first value to an integer for proper numerical sorting
     parsed_lines = []
@@ -20,17 +29,38 @@ def sort_data(input_file, output_file):
                 except ValueError:
                     # If conversion fails, just use the line as is
                     continue
-    
+
     # Sort the lines based on the first value (numerically)
     sorted_lines = sorted(parsed_lines, key=lambda x: x[0])
-    
+
     # Write the sorted lines to the output file
     with open(output_file, 'w') as f:
         for _, line in sorted_lines:
             f.write(line + '\n')
 
+
+def build_index(input_file, index_file):
+    # Write the binary index the server maps at startup: the sorted,
+    # deduplicated lines plus an offset table and a header holding the
+    # size, modification time and checksum of the input file
+    count = write_index_file(input_file, index_file)
+    return count
+
+
 if __name__ == "__main__":
-    input_file = "data/200k.txt"
-    output_file = "data/200k_sorted.txt"
-    sort_data(input_file, output_file)
-    print(f"Data sorted and saved to {output_file}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sort a data file or build its index")
+    parser.add_argument("input_file", nargs="?", default="data/200k.txt")
+    parser.add_argument("output_file", nargs="?", default="data/200k_sorted.txt")
+    parser.add_argument(
+        "--index",
+        metavar="INDEX_FILE",
+        help="build the binary index file for the server instead of sorting",
+    )
+    args = parser.parse_args()
+
+    if args.index:
+        count = build_index(args.input_file, args.index)
+        print(f"Index of {count} records saved to {args.index}")
+    else:
+        sort_data(args.input_file, args.output_file)
+        print(f"Data sorted and saved to {args.output_file}")
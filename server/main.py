@@ -1,5 +1,8 @@
 from server import server
+from server import async_server
+from server import prefork
 from server import config_loader
+from server import router
 
 """
 Load the configuration file and extract the host and port values to bind the IP and port.
@@ -10,6 +13,9 @@ CONFIG: dict = config_loader.load_config()
 BIND_IP: str = CONFIG["host"]
 BIND_PORT: int = CONFIG["port"]
 DEBUG: bool= CONFIG["debug"]
+ENGINE: str = CONFIG["engine"]
+PROCESSES: int = CONFIG["processes"]
+ROLE: str = CONFIG["role"]
 
 if __name__ == '__main__':
     """
@@ -18,5 +24,18 @@ if __name__ == '__main__':
     @param BIND_IP - The IP address to bind the server to.
     @param BIND_PORT - The port number to bind the server to.
     @param DEBUG - Boolean flag indicating whether to run the server in debug mode.
+    @param ENGINE - The server engine to run, "threaded" or "asyncio".
+    @param PROCESSES - The number of pre-forked worker processes.
+    @param ROLE - "search" to serve the data file, "router" to forward queries to the shards.
     """
-    server.start_server(host=BIND_IP, port=BIND_PORT, debug=DEBUG)
+    server.configure_logging()
+    if ROLE == "router":
+        router.start_router(host=BIND_IP, port=BIND_PORT, debug=DEBUG)
+    elif PROCESSES > 1:
+        prefork.start_prefork_server(
+            host=BIND_IP, port=BIND_PORT, debug=DEBUG, processes=PROCESSES
+        )
+    elif ENGINE == "asyncio":
+        async_server.start_async_server(host=BIND_IP, port=BIND_PORT, debug=DEBUG)
+    else:
+        server.start_server(host=BIND_IP, port=BIND_PORT, debug=DEBUG)
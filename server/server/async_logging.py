@@ -0,0 +1,220 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import List, Optional, TextIO
+
+"""
+Asynchronous, batched logging.
+
+Request threads only put log records on a queue; a background writer
+formats them and writes them to the log file (or stderr) in batches,
+with one write and one flush per batch. Records are queued unformatted,
+so the cost of building messages is paid by the writer, and not at all
+for levels that are disabled. The queue is bounded: when the writer falls
+behind, new records are dropped instead of piling up in memory, and the
+writer logs how many were lost.
+"""
+
+LOG_FORMAT: str = "[%(asctime)s] %(levelname)s: %(message)s"
+# Maximum number of records written at once
+BATCH_SIZE: int = 256
+# Seconds the writer waits for more records before flushing a batch
+FLUSH_INTERVAL: float = 0.05
+# Records waiting for the writer at most
+QUEUE_SIZE: int = 10000
+
+_STOP = object()
+
+# Writer installed by `setup_logging` in this process
+_WRITER: Optional["BatchLogWriter"] = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves message formatting to the writer thread and
+    drops records while the queue is full.
+    """
+
+    def __init__(self, records: queue.Queue) -> None:
+        super().__init__(records)
+        self.dropped: int = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def take_dropped(self) -> int:
+        """Return the records dropped since the last call."""
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats the message here, in the request
+        # thread; only tracebacks must be rendered before the frames go away
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info
+                )
+            record.exc_info = None
+        return record
+
+
+class BatchLogWriter:
+    """
+    Background thread writing queued log records in batches.
+
+    Args:
+        log_file: Path of the file to append to, or empty for stderr
+        batch_size: Maximum number of records per write
+        flush_interval: Seconds to wait for more records before writing
+        queue_size: Maximum number of records waiting to be written
+    """
+
+    def __init__(
+        self,
+        log_file: str = "",
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        queue_size: int = QUEUE_SIZE,
+    ) -> None:
+        self.log_file: str = log_file
+        self.batch_size: int = max(1, batch_size)
+        self.flush_interval: float = flush_interval
+        self.queue_size: int = max(1, queue_size)
+        self.formatter: logging.Formatter = logging.Formatter(LOG_FORMAT)
+        self.handler: _DeferredQueueHandler = _DeferredQueueHandler(
+            queue.Queue(self.queue_size)
+        )
+        self.stream: Optional[TextIO] = (
+            open(log_file, "a", encoding="utf-8") if log_file else None
+        )
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the writer thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write the queued records and stop the writer thread."""
+        if self._thread is not None and self._thread.is_alive():
+            # Waits for room rather than being dropped
+            self.handler.queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+
+    def restart_after_fork(self) -> None:
+        """
+        Give a forked child its own queue and writer thread.
+
+        Threads do not survive fork, and the queue may have been locked by
+        one of the parent threads when it forked.
+        """
+        self.handler.queue = queue.Queue(self.queue_size)
+        self.handler.dropped = 0
+        self.start()
+
+    def _run(self) -> None:
+        """Drain the queue in batches until stopped."""
+        records: queue.Queue = self.handler.queue
+        while True:
+            batch: List[logging.LogRecord] = [records.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(records.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            stop: bool = _STOP in batch
+            self._write([record for record in batch if record is not _STOP])
+            if stop:
+                return
+
+    def _write(self, batch: List[logging.LogRecord]) -> None:
+        """Format a batch of records and write them at once."""
+        lines: List[str] = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                # Same behavior as logging.Handler for a bad format string
+                self.handler.handleError(record)
+        dropped: int = self.handler.take_dropped()
+        if dropped:
+            lines.append(
+                self.formatter.format(
+                    logging.makeLogRecord(
+                        {
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": f"Log queue full, {dropped} records dropped",
+                        }
+                    )
+                )
+            )
+        if not lines:
+            return
+        # Looked up on each write, as sys.stderr may be replaced at runtime
+        stream: TextIO = self.stream or sys.stderr
+        try:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except (OSError, ValueError):
+            self.handler.handleError(batch[-1])
+
+
+def setup_logging(
+    debug: bool,
+    log_file: str = "",
+    batch_size: int = BATCH_SIZE,
+    flush_interval: float = FLUSH_INTERVAL,
+    queue_size: int = QUEUE_SIZE,
+) -> BatchLogWriter:
+    """
+    Route the root logger through an asynchronous batch writer.
+
+    Args:
+        debug: Whether to log at DEBUG instead of INFO level
+        log_file: Path of the log file, or empty to log to stderr
+        batch_size: Maximum number of records per write
+        flush_interval: Seconds to wait for more records before writing
+        queue_size: Maximum number of records waiting to be written
+
+    Returns:
+        BatchLogWriter: The running writer.
+    """
+    global _WRITER
+    writer: BatchLogWriter = BatchLogWriter(
+        log_file, batch_size, flush_interval, queue_size
+    )
+    root: logging.Logger = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(writer.handler)
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+    writer.start()
+    atexit.register(writer.stop)
+    os.register_at_fork(after_in_child=writer.restart_after_fork)
+    _WRITER = writer
+    return writer
+
+
+def stop_logging() -> None:
+    """
+    Write the queued records and stop the writer of `setup_logging`, if any.
+
+    For processes leaving through `os._exit`, which skips atexit.
+    """
+    if _WRITER is not None:
+        _WRITER.stop()
@@ -0,0 +1,364 @@
+import asyncio
+import select
+import socket
+import ssl
+import logging
+import traceback
+from timeit import default_timer as timer
+from typing import Any, Callable, Dict, Optional, Set
+
+from .metrics import MetricsRegistry
+from .protocol import ClientSession
+from .tls import record_handshake
+from .server import (
+    BACKLOG,
+    BUSY_RESPONSE,
+    CLIENT_TIMEOUT,
+    DRAIN_TIMEOUT,
+    IDLE_TIMEOUT,
+    MAX_CONNECTIONS,
+    MAX_PAYLOAD,
+    SERVER_ERROR_RESPONSE,
+    SSL_ENABLED,
+    StringSearchServer,
+    gather_more,
+    server_context,
+)
+
+logger = logging.getLogger(__name__)
+
+"""
+asyncio engine serving the same wire protocol as `server.start_server`
+from a single event loop instead of one thread per connection.
+"""
+
+
+class AsyncStringSearchServer:
+    """
+    Serve string search queries from a single asyncio event loop.
+
+    All connections share one `StringSearchServer`, so the protocol handling
+    and metrics are the same as for the threaded engine. Requests that may
+    wait on the data file, such as RELOAD, are answered in the default
+    executor so the other connections are still served meanwhile. At most
+    `max_connections` connections are served at once; any connection over
+    the limit is answered with the busy response and closed. With
+    `ssl_context`, connections are accepted as plain TCP and upgraded to
+    TLS by the handler, so the handshake is timed as in the threaded engine.
+    After `drain`, persistent connections are closed once they are idle.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = MAX_CONNECTIONS,
+        search_server: Optional[StringSearchServer] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ) -> None:
+        self.search_server: StringSearchServer = search_server or StringSearchServer()
+        # Waiting for the data would block the event loop, so queries get
+        # the warming response at once until it is loaded
+        self.search_server.warmup_wait = 0.0
+        self.max_connections: int = max_connections
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        # Only touched from the event loop thread, so no lock is needed
+        self.active_connections: int = 0
+        self.draining: bool = False
+        # Connections waiting for their next query, with their socket
+        self._idle: Dict[asyncio.StreamWriter, Any] = {}
+        # One task per connection accepted by `listen`, until it is closed
+        self._connections: Set[asyncio.Task] = set()
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Handle a client connection by receiving requests, processing them,
+        and sending the responses.
+
+        Args:
+            reader: The stream to read the request from
+            writer: The stream to write the response to
+        """
+        metrics: MetricsRegistry = self.search_server.metrics
+        if self.ssl_context is not None:
+            start: float = timer()
+            try:
+                await writer.start_tls(
+                    self.ssl_context, ssl_handshake_timeout=CLIENT_TIMEOUT or None
+                )
+            except (ConnectionError, ssl.SSLError, asyncio.TimeoutError) as e:
+                logger.debug("TLS handshake failed: %s", e)
+                await self._close(writer)
+                return
+            record_handshake(
+                metrics, writer.get_extra_info("ssl_object"), timer() - start
+            )
+        if self.active_connections >= self.max_connections:
+            metrics.inc("rejected_connections")
+            logger.warning(
+                "Connection limit of %d reached, rejecting %s",
+                self.max_connections,
+                writer.get_extra_info("peername"),
+            )
+            await self._send_and_close(writer, BUSY_RESPONSE)
+            return
+
+        self.active_connections += 1
+        metrics.inc("connections")
+        metrics.gauges["active_connections"].inc()
+        session: ClientSession = self.search_server.new_session()
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        sock: Any = writer.get_extra_info("socket")
+        try:
+            while not session.closed:
+                # Waiting for the next query of an idle connection is not
+                # receive time
+                timed: bool = not session.keep_alive or len(session.buffer) > 0
+                if not timed:
+                    if self.draining and not _readable(sock):
+                        break
+                    self._idle[writer] = sock
+                start = timer()
+                try:
+                    nbytes: int = await self._receive(reader, sock, session)
+                except asyncio.TimeoutError:
+                    logger.debug("Connection timed out")
+                    break
+                finally:
+                    self._idle.pop(writer, None)
+                if timed:
+                    metrics.record("recv", timer() - start)
+                response: bytes
+                if self.search_server.may_block(session):
+                    # Reloads and index builds would stall every connection
+                    response = await loop.run_in_executor(
+                        None, session.process, not nbytes
+                    )
+                else:
+                    response = session.process(eof=not nbytes)
+                if response:
+                    start = timer()
+                    writer.write(response)
+                    await writer.drain()
+                    metrics.record("send", timer() - start)
+                    logger.debug("Response sent: %r", response)
+        except (ConnectionError, ssl.SSLError) as e:
+            logger.debug("Connection closed: %s", e)
+        except Exception:
+            metrics.inc("errors")
+            logger.error("Unexpected error:\n%s", traceback.format_exc())
+            writer.write(SERVER_ERROR_RESPONSE.encode())
+        finally:
+            self.active_connections -= 1
+            metrics.gauges["active_connections"].dec()
+            await self._close(writer)
+
+    def listen(self, listener: socket.socket) -> None:
+        """
+        Serve the connections of a listening socket from the running loop.
+
+        Connections are accepted in the readiness callback of the socket,
+        so each one is tracked from the moment it is accepted.
+        """
+        listener.setblocking(False)
+        asyncio.get_running_loop().add_reader(
+            listener.fileno(), self._accept, listener
+        )
+
+    def _accept(self, listener: socket.socket) -> None:
+        """Start serving every connection queued on the listener."""
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.error("Accept error: %s", e)
+                return
+            task: asyncio.Task = loop.create_task(self._serve_accepted(conn))
+            self._connections.add(task)
+            task.add_done_callback(self._connections.discard)
+
+    async def _serve_accepted(self, conn: socket.socket) -> None:
+        """Serve an accepted connection through a stream reader and writer."""
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        served: asyncio.Future = loop.create_future()
+
+        async def handle(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            try:
+                await self.handle_client(reader, writer)
+            finally:
+                served.set_result(None)
+
+        try:
+            await loop.connect_accepted_socket(
+                lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader(), handle),
+                conn,
+            )
+        except OSError as e:
+            logger.debug("Connection closed early: %s", e)
+            conn.close()
+            return
+        await served
+
+    async def drain(
+        self, listener: socket.socket, timeout: float = DRAIN_TIMEOUT
+    ) -> bool:
+        """
+        Stop accepting, then close the connections once they are idle.
+
+        Args:
+            listener: The socket passed to `listen`
+            timeout: Seconds to wait for the requests (0 = no limit)
+
+        Returns:
+            bool: True if every connection was served and closed in time.
+        """
+        asyncio.get_running_loop().remove_reader(listener.fileno())
+        # Connections queued on a closed socket would be reset
+        self._accept(listener)
+        listener.close()
+        self.draining = True
+        for writer, sock in list(self._idle.items()):
+            if not _readable(sock):
+                writer.close()
+        if not self._connections:
+            return True
+        _, pending = await asyncio.wait(
+            set(self._connections), timeout=timeout or None
+        )
+        return not pending
+
+    async def _receive(
+        self, reader: asyncio.StreamReader, sock: Any, session: ClientSession
+    ) -> int:
+        """
+        Receive into the session buffer, gathering a single-shot query
+        split in several pieces as `StringSearchServer._receive` does.
+
+        Args:
+            reader: The stream to read from
+            sock: The socket under the transport
+            session: The protocol state of the connection
+
+        Returns:
+            The number of bytes received, 0 on end of stream
+
+        Raises:
+            asyncio.TimeoutError: If the client sent nothing in time.
+        """
+        timeout: Optional[float] = (
+            IDLE_TIMEOUT if session.keep_alive else CLIENT_TIMEOUT
+        ) or None
+        data: bytes = await asyncio.wait_for(reader.read(MAX_PAYLOAD), timeout)
+        session.buffer.write(data)
+        total: int = len(data)
+        while gather_more(session, len(data), total, sock):
+            data = await asyncio.wait_for(
+                reader.read(MAX_PAYLOAD), CLIENT_TIMEOUT or None
+            )
+            session.buffer.write(data)
+            total += len(data)
+        return total
+
+    async def _send_and_close(
+        self, writer: asyncio.StreamWriter, response: str
+    ) -> None:
+        """Send the response and close the connection, ignoring disconnects."""
+        try:
+            writer.write(response.encode())
+            await writer.drain()
+        except (ConnectionError, ssl.SSLError) as e:
+            logger.debug("Connection closed early: %s", e)
+        await self._close(writer)
+
+    async def _close(self, writer: asyncio.StreamWriter) -> None:
+        """Close the connection, ignoring errors from disconnected clients."""
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, ssl.SSLError) as e:
+            logger.debug("Connection closed early: %s", e)
+
+
+def _readable(sock: Any) -> bool:
+    """Check whether a socket has data, or connections, to read at once."""
+    return bool(select.select([sock], [], [], 0)[0])
+
+
+async def serve(
+    host: str,
+    port: int,
+    debug: bool,
+    ssl_context: Optional[ssl.SSLContext] = None,
+    reuse_port: bool = False,
+    search_server: Optional[AsyncStringSearchServer] = None,
+    on_listening: Optional[Callable[[], None]] = None,
+    stop: Optional[asyncio.Event] = None,
+) -> None:
+    """
+    Bind the listener and serve connections until cancelled, or until
+    `stop` is set and the connections were drained.
+
+    Args:
+        host: The host address to bind to
+        port: The port number to listen on
+        debug: Whether to print debug information
+        ssl_context: The server TLS context, or None for plain TCP
+        reuse_port: Whether to share the port with other processes
+            (SO_REUSEPORT), as the pre-fork workers do
+        search_server: The connection handler, created if None
+        on_listening: Called once connections are accepted
+        stop: Set to drain the connections and return, None to serve forever
+    """
+    if search_server is None:
+        search_server = AsyncStringSearchServer()
+    # The handler runs the TLS handshake, to time it
+    search_server.ssl_context = ssl_context
+    listener: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listener.bind((host, port))
+        listener.listen(BACKLOG)
+        search_server.listen(listener)
+        logger.info(
+            f"Async server listening on {host}:{port} "
+            f"{'(SSL) ' if ssl_context else ''}{'(DEBUG MODE)' if debug else ''}"
+        )
+        # Load the data now that connections are accepted
+        search_server.search_server.start_loading()
+        if on_listening is not None:
+            on_listening()
+        if stop is None:
+            await asyncio.get_running_loop().create_future()
+        await stop.wait()
+        logger.info("Stopped accepting, draining the open connections")
+        if not await search_server.drain(listener):
+            logger.warning(
+                f"Connections still open after {DRAIN_TIMEOUT}s, closing them"
+            )
+    finally:
+        listener.close()
+
+
+def start_async_server(host: str, port: int, debug: bool) -> None:
+    """
+    Start the asyncio engine and handle incoming client connections.
+
+    Args:
+        host: The host address to bind to
+        port: The port number to listen on
+        debug: Whether to print debug information
+    """
+    try:
+        asyncio.run(
+            serve(host, port, debug, server_context() if SSL_ENABLED else None)
+        )
+    except Exception as e:
+        logger.error(f"Server error: {e}")
+        raise
@@ -0,0 +1,310 @@
+import math
+import mmap
+import os
+import hashlib
+import struct
+import logging
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .index_file import source_checksum, source_matches
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+"""
+Bloom filter in front of the exact index, for fast negative answers.
+
+Most queries are misses. The filter answers "definitely not present" for
+almost all of them from a few bits per key, so only filter positives reach
+the exact index or the mapped data file. The filter is saved next to the
+data file with the size, modification time and checksum of its source, and
+mapped back at startup while it is up to date.
+
+Layout of the saved filter (little endian): header with magic, format
+version, number of hash functions, number of bits, number of keys, target
+false-positive rate, and source size, mtime and checksum; then the bits.
+"""
+
+MAGIC: bytes = b"TSSBLM\x00\x01"
+# Version 2 hashes keys with BLAKE2b; version 1 filters are rebuilt
+VERSION: int = 2
+# magic, version, hashes, bits, keys, target fp rate, source size,
+# source mtime_ns, checksum
+HEADER = struct.Struct("<8sIIQQdQq16s")
+
+
+def _hashes(key: bytes) -> Tuple[int, int]:
+    """
+    Two independent 32-bit hashes of a key for double hashing, stable
+    across processes.
+
+    Both halves come from one 8-byte BLAKE2b digest. Deriving the second
+    hash from the first would leave only 32 bits per key, so distinct keys
+    sharing them would collide on every probe and the false-positive rate
+    could not drop below about n / 2**32.
+    """
+    digest: int = int.from_bytes(
+        hashlib.blake2b(key, digest_size=8).digest(), "little"
+    )
+    return digest & 0xFFFFFFFF, digest >> 32 | 1
+
+
+class BloomFilter:
+    """
+    Bloom filter over byte strings with double hashing.
+
+    Args:
+        keys: Number of keys the filter is sized for
+        fp_rate: Target false-positive rate at that number of keys
+    """
+
+    def __init__(self, keys: int, fp_rate: float = 0.01) -> None:
+        if not 0 < fp_rate < 1:
+            raise ValueError(f"False-positive rate must be in (0, 1): {fp_rate}")
+        keys = max(1, keys)
+        self.fp_rate: float = fp_rate
+        self.bits: int = max(
+            64, math.ceil(-keys * math.log(fp_rate) / math.log(2) ** 2)
+        )
+        self.hashes: int = max(1, round(self.bits / keys * math.log(2)))
+        self.keys: int = 0
+        self._data: Union[bytearray, memoryview] = bytearray((self.bits + 7) // 8)
+
+    @classmethod
+    def from_keys(
+        cls, keys: Sequence[bytes], fp_rate: float = 0.01
+    ) -> "BloomFilter":
+        """Build a filter holding the given keys."""
+        bloom: BloomFilter = cls(len(keys), fp_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def add(self, key: bytes) -> None:
+        """Add a key to the filter."""
+        data = self._data
+        h1, h2 = _hashes(key)
+        for i in range(self.hashes):
+            position: int = (h1 + i * h2) % self.bits
+            data[position >> 3] |= 1 << (position & 7)
+        self.keys += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        """False if the key was never added; True if it probably was."""
+        data = self._data
+        bits: int = self.bits
+        h1, h2 = _hashes(key)
+        for i in range(self.hashes):
+            position: int = (h1 + i * h2) % bits
+            if not data[position >> 3] >> (position & 7) & 1:
+                return False
+        return True
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._data)
+
+    @property
+    def mapped(self) -> bool:
+        """Whether the bits are mapped from a saved filter file."""
+        return isinstance(self._data, memoryview)
+
+    @property
+    def bits_per_key(self) -> float:
+        return self.bits / self.keys if self.keys else 0.0
+
+    @property
+    def expected_fp_rate(self) -> float:
+        """False-positive rate expected from the keys actually added."""
+        return (1 - math.exp(-self.hashes * self.keys / self.bits)) ** self.hashes
+
+    def save(self, path: str, source_path: str) -> None:
+        """
+        Write the filter next to its source data file.
+
+        Args:
+            path: Path of the filter file
+            source_path: Path of the data file the filter was built from
+        """
+        stat: os.stat_result = os.stat(source_path)
+        temp_path: str = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    self.hashes,
+                    self.bits,
+                    self.keys,
+                    self.fp_rate,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    source_checksum(source_path),
+                )
+            )
+            f.write(self._data)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_path: str) -> Optional["BloomFilter"]:
+        """
+        Map a saved filter if it was built from the current source file.
+
+        Args:
+            path: Path of the filter file
+            source_path: Path of the data file
+
+        Returns:
+            Optional[BloomFilter]: The filter, or None if it is missing,
+            invalid or stale.
+        """
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                data: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(data) < HEADER.size:
+                raise ValueError("file too short")
+            (
+                magic,
+                version,
+                hashes,
+                bits,
+                keys,
+                fp_rate,
+                size,
+                mtime_ns,
+                checksum,
+            ) = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"not a version {VERSION} filter file")
+            if len(data) != HEADER.size + (bits + 7) // 8:
+                raise ValueError("truncated filter")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring filter file {path}: {e}")
+            return None
+        if not source_matches(source_path, size, mtime_ns, checksum):
+            logger.warning(f"Filter file {path} is stale, rebuilding")
+            return None
+        bloom: BloomFilter = cls.__new__(cls)
+        bloom.fp_rate = fp_rate
+        bloom.bits = bits
+        bloom.hashes = hashes
+        bloom.keys = keys
+        bloom._data = memoryview(data)[HEADER.size :]
+        return bloom
+
+
+class FilteredIndex:
+    """
+    Index wrapper answering misses from a Bloom filter.
+
+    Exposes the same lookup interface as the wrapped index; only strings
+    the filter lets through are searched in it.
+    """
+
+    def __init__(
+        self,
+        index: Any,
+        bloom: BloomFilter,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.index = index
+        self.bloom: BloomFilter = bloom
+        self.metrics: Optional[MetricsRegistry] = metrics
+
+    @property
+    def sorted_lines(self) -> Sequence[str]:
+        return self.index.sorted_lines
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, search_string: object) -> bool:
+        return isinstance(search_string, str) and self.contains(search_string)
+
+    def _count(self, rejected: int, false_positives: int) -> None:
+        if self.metrics is not None:
+            self.metrics.inc("filter_rejects", rejected)
+            self.metrics.inc("filter_false_positives", false_positives)
+
+    def contains_many(self, search_strings: Iterable[str]) -> List[bool]:
+        """
+        Check a batch of strings, searching only the filter positives.
+
+        Args:
+            search_strings (Iterable[str]): The strings being searched.
+
+        Returns:
+            List[bool]: Whether each string exists, in the same order.
+        """
+        search_strings = list(search_strings)
+        passed: List[int] = [
+            i
+            for i, search_string in enumerate(search_strings)
+            if search_string.encode() in self.bloom
+        ]
+        found: List[bool] = [False] * len(search_strings)
+        hits: List[bool] = self.index.contains_many(
+            [search_strings[i] for i in passed]
+        )
+        for i, hit in zip(passed, hits):
+            found[i] = hit
+        self._count(len(search_strings) - len(passed), len(passed) - sum(hits))
+        return found
+
+    def contains(
+        self,
+        search_string: str,
+        algorithm: Optional[Callable[[str, Sequence[str]], bool]] = None,
+    ) -> bool:
+        """
+        Check whether the given string exists, consulting the filter first.
+
+        Args:
+            search_string (str): The string being searched.
+            algorithm: Optional function from `search_algorithms`, passed on
+                to the wrapped index.
+
+        Returns:
+            bool: True if found, False otherwise.
+        """
+        if search_string.encode() not in self.bloom:
+            self._count(1, 0)
+            return False
+        found: bool = self.index.contains(search_string, algorithm)
+        if not found:
+            self._count(0, 1)
+        return found
+
+    def describe(self, counters: Dict[str, int]) -> Dict[str, Any]:
+        """
+        Summarize the filter for the stats.
+
+        Args:
+            counters: The metrics counters, possibly merged across processes
+
+        Returns:
+            Dict[str, Any]: Filter size, target and expected false-positive
+            rate, and the rate observed as the share of misses let through.
+        """
+        false_positives: int = counters.get("filter_false_positives", 0)
+        misses: int = counters.get("filter_rejects", 0) + false_positives
+        return {
+            "keys": self.bloom.keys,
+            "bits_per_key": round(self.bloom.bits_per_key, 2),
+            "hashes": self.bloom.hashes,
+            "target_fp_rate": self.bloom.fp_rate,
+            "expected_fp_rate": round(self.bloom.expected_fp_rate, 6),
+            "observed_fp_rate": round(false_positives / misses, 6) if misses else 0.0,
+        }
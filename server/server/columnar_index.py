@@ -0,0 +1,264 @@
+import sys
+import logging
+from collections import Counter
+from typing import Callable, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional, the columnar engine falls back to a hash set
+    np = None
+
+from .range_index import FIELD_SEPARATOR
+from .search_algorithms import search_in_set
+
+logger = logging.getLogger(__name__)
+
+"""
+Columnar encoding of numeric records, for the `columnar` search engine.
+
+Records such as `1;0;1;11;0;10;5;0;` are parsed into a 2-D integer array
+with one column per field, and each row is packed into a single integer
+key: every field gets just the bits its largest value needs, the first
+field in the highest bits. Keys fit one uint64 for up to 64 bits in total
+and 16 big-endian bytes for up to 128. The keys are sorted and unique, so
+a whole batch of queries is checked with one vectorized `searchsorted`.
+
+A record belongs to the numeric schema when it is exactly the canonical
+rendering of its fields: the most common number of fields, decimal
+values without sign or leading zeros, and a trailing separator. Every
+other record is kept in a small fallback `frozenset`, so lookups stay
+exact whatever the file holds.
+"""
+
+MAX_KEY_BITS: int = 128
+
+
+def parse_record(line: str, fields: int = 0) -> Optional[List[int]]:
+    """
+    Parse a record of the numeric schema.
+
+    Args:
+        line: The record
+        fields: Expected number of fields, or 0 for any
+
+    Returns:
+        Optional[List[int]]: The field values, or None if the record is not
+        the canonical rendering of numeric fields.
+    """
+    parts: List[str] = line.split(FIELD_SEPARATOR)
+    if len(parts) < 2 or parts[-1] or (fields and len(parts) != fields + 1):
+        return None
+    values: List[int] = []
+    for part in parts[:-1]:
+        if not (part.isascii() and part.isdigit()) or (part[0] == "0" and len(part) > 1):
+            return None
+        values.append(int(part))
+    return values
+
+
+def render_record(values: Iterable[int]) -> str:
+    """Render field values as a record of the numeric schema."""
+    return FIELD_SEPARATOR.join(map(str, values)) + FIELD_SEPARATOR
+
+
+class _RenderedLines(Sequence):
+    """
+    The records in sorted string order, rendered from the columns on access.
+
+    `order[i]` is the row of the i-th record, or `-1 - j` for the j-th
+    sorted record of the fallback set.
+    """
+
+    def __init__(self, columns: "np.ndarray", order: "np.ndarray", others: List[str]) -> None:
+        self._columns = columns
+        self._order = order
+        self._others: List[str] = others
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        row: int = int(self._order[i])
+        if row < 0:
+            return self._others[-1 - row]
+        return render_record(self._columns[row].tolist())
+
+
+class ColumnarIndex:
+    """
+    Immutable index over numeric records, packed into sorted integer keys.
+
+    Requires NumPy. Lookups parse the query into its key and search the
+    sorted keys; queries outside the numeric schema are looked up in the
+    fallback set of the records that are outside it too.
+
+    Args:
+        lines: The lines of the data file
+        presorted: Whether the lines are a list already sorted and
+            deduplicated, as built by `parallel_build`
+    """
+
+    def __init__(self, lines: Iterable[str], presorted: bool = False) -> None:
+        if np is None:
+            raise ImportError("The columnar index requires NumPy")
+        unique: List[str] = lines if presorted else sorted(set(lines))
+        parsed: List[Optional[List[int]]] = [parse_record(line) for line in unique]
+        counts: Counter = Counter(len(values) for values in parsed if values)
+        self.fields: int = counts.most_common(1)[0][0] if counts else 0
+        numeric: List[bool] = [
+            values is not None and len(values) == self.fields and max(values) < 2**64
+            for values in parsed
+        ]
+
+        # Parsed rows, in sorted string order for now
+        rows = np.array(
+            [values for values, fits in zip(parsed, numeric) if fits],
+            dtype=np.uint64,
+        ).reshape(sum(numeric), self.fields)
+        maxima: List[int] = rows.max(axis=0).tolist() if len(rows) else []
+        self.widths: List[int] = [max(1, int(value).bit_length()) for value in maxima]
+        if sum(self.widths) > MAX_KEY_BITS:
+            logger.warning(
+                f"Records need {sum(self.widths)} bits, more than {MAX_KEY_BITS}: "
+                f"the columnar index holds them all as strings"
+            )
+            numeric = [False] * len(unique)
+            rows = rows[:0]
+            self.widths = []
+        self.key_bits: int = 64 if sum(self.widths) <= 64 else MAX_KEY_BITS
+        # Shift of each field, the first field in the highest bits
+        self.shifts: List[int] = [
+            sum(self.widths[i + 1 :]) for i in range(len(self.widths))
+        ]
+
+        keys = self._pack_rows(rows)
+        rank = np.argsort(keys, kind="stable")
+        self.keys = keys[rank]
+        # Narrowest integer type holding every field
+        self.columns = rows[rank].astype(np.min_scalar_type(max(maxima, default=0)))
+        # Row of each numeric record in key order, to render them sorted
+        row_of = np.empty(len(rank), dtype=np.int64)
+        row_of[rank] = np.arange(len(rank), dtype=np.int64)
+
+        self.others: List[str] = [
+            line for line, fits in zip(unique, numeric) if not fits
+        ]
+        self.other_members: FrozenSet[str] = frozenset(self.others)
+        is_numeric = np.array(numeric, dtype=bool)
+        order = np.empty(len(unique), dtype=np.int64)
+        order[is_numeric] = row_of
+        order[~is_numeric] = -1 - np.arange(len(self.others), dtype=np.int64)
+        self.order = order.astype(np.int32) if len(order) < 2**31 else order
+        self.sorted_lines: _RenderedLines = _RenderedLines(
+            self.columns, self.order, self.others
+        )
+
+    def _pack_rows(self, rows: "np.ndarray") -> "np.ndarray":
+        """Pack parsed rows into their keys, vectorized."""
+        if self.key_bits == 64:
+            keys = np.zeros(len(rows), dtype=np.uint64)
+            for column, shift in enumerate(self.shifts):
+                keys |= rows[:, column] << np.uint64(shift)
+            return keys
+        # 128 bits: high and low words, stored big-endian so that the bytes
+        # sort in key order
+        words = np.zeros((len(rows), 2), dtype=">u8")
+        high = np.zeros(len(rows), dtype=np.uint64)
+        low = np.zeros(len(rows), dtype=np.uint64)
+        for column, (shift, width) in enumerate(zip(self.shifts, self.widths)):
+            values = rows[:, column]
+            if shift >= 64:
+                high |= values << np.uint64(shift - 64)
+            elif shift + width <= 64:
+                low |= values << np.uint64(shift)
+            else:
+                low |= values << np.uint64(shift)
+                high |= values >> np.uint64(64 - shift)
+        words[:, 0], words[:, 1] = high, low
+        return words.view("S16").reshape(-1)
+
+    def _key(self, search_string: str) -> Optional[int]:
+        """The key of a query in the numeric schema, or None."""
+        values: Optional[List[int]] = parse_record(search_string, self.fields)
+        if values is None or not self.widths:
+            return None
+        key: int = 0
+        for value, width in zip(values, self.widths):
+            if value >> width:
+                return None
+            key = (key << width) | value
+        return key
+
+    def _encode(self, keys: List[int]) -> "np.ndarray":
+        if self.key_bits == 64:
+            return np.array(keys, dtype=np.uint64)
+        return np.array([key.to_bytes(16, "big") for key in keys], dtype="S16")
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, search_string: object) -> bool:
+        return isinstance(search_string, str) and self.contains(search_string)
+
+    def contains_many(self, search_strings: Iterable[str]) -> List[bool]:
+        """
+        Check a batch of strings, the numeric ones in one vectorized search.
+
+        Args:
+            search_strings (Iterable[str]): The strings being searched.
+
+        Returns:
+            List[bool]: Whether each string exists, in the same order.
+        """
+        strings: List[str] = list(search_strings)
+        found: List[bool] = [False] * len(strings)
+        positions: List[int] = []
+        keys: List[int] = []
+        for position, search_string in enumerate(strings):
+            key: Optional[int] = self._key(search_string)
+            if key is None:
+                found[position] = search_string in self.other_members
+            else:
+                positions.append(position)
+                keys.append(key)
+        if keys and len(self.keys):
+            queries = self._encode(keys)
+            slots = np.searchsorted(self.keys, queries)
+            np.minimum(slots, len(self.keys) - 1, out=slots)
+            for position, hit in zip(positions, (self.keys[slots] == queries).tolist()):
+                found[position] = hit
+        return found
+
+    def contains(
+        self,
+        search_string: str,
+        algorithm: Optional[Callable[[str, Sequence[str]], bool]] = None,
+    ) -> bool:
+        """
+        Check whether the given string exists in the index.
+
+        Args:
+            search_string (str): The string being searched.
+            algorithm: Optional function from `search_algorithms`. The key
+                lookup is used by default; any other algorithm is run against
+                the records rendered in sorted order.
+
+        Returns:
+            bool: True if found, False otherwise.
+        """
+        if algorithm is None or algorithm is search_in_set:
+            return self.contains_many((search_string,))[0]
+        return algorithm(search_string, self.sorted_lines)
+
+    def footprint(self) -> Tuple[int, int]:
+        """Return the bytes held in memory and the bytes mapped from files."""
+        return (
+            self.keys.nbytes
+            + self.columns.nbytes
+            + self.order.nbytes
+            + sys.getsizeof(self.other_members)
+            + sum(sys.getsizeof(line) for line in self.others),
+            0,
+        )
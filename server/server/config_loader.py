@@ -1,14 +1,24 @@
 import configparser
+import functools
 import os
 from typing import Dict, Any
 from pathlib import Path
 
+# Environment variable naming another config file, so that several
+# instances (shards, replicas, the router) run from one checkout
+CONFIG_ENV: str = "SEARCH_SERVER_CONFIG"
+
+
 def load_config() -> Dict[str, Any]:
-    """Load configuration from INI file."""
-    
+    """Load configuration from INI file, parsed once per process."""
+    return dict(_read_config(os.environ.get(CONFIG_ENV, "")))
+
+
+@functools.lru_cache(maxsize=None)
+def _read_config(config_path: str) -> Dict[str, Any]:
     # Try to find config.ini relative to the package root
     base_dir = Path(__file__).parent.parent
-    file_path = base_dir / "config.ini"
+    file_path = Path(config_path) if config_path else base_dir / "config.ini"
 
     try:
         config = configparser.ConfigParser()
@@ -20,14 +30,75 @@ def load_config() -> Dict[str, Any]:
         return {
             "host": config.get("SERVER", "HOST", fallback="127.0.0.1"),
             "port": config.getint("SERVER", "PORT", fallback=8080),
+            "engine": config.get("SERVER", "ENGINE", fallback="threaded"),
+            "role": config.get("SERVER", "ROLE", fallback="search"),
+            "backlog": config.getint("SERVER", "BACKLOG", fallback=128),
+            "processes": config.getint("SERVER", "PROCESSES", fallback=1),
+            "max_connections": config.getint(
+                "SERVER", "MAX_CONNECTIONS", fallback=1000
+            ),
+            "workers": config.getint("SERVER", "WORKERS", fallback=32),
+            "queue_size": config.getint("SERVER", "QUEUE_SIZE", fallback=128),
+            "client_timeout": config.getfloat(
+                "SERVER", "CLIENT_TIMEOUT", fallback=10.0
+            ),
+            "idle_timeout": config.getfloat("SERVER", "IDLE_TIMEOUT", fallback=30.0),
+            "drain_timeout": config.getfloat(
+                "SERVER", "DRAIN_TIMEOUT", fallback=10.0
+            ),
+            "warmup_wait": config.getfloat("SERVER", "WARMUP_WAIT", fallback=2.0),
             "ssl_enabled": config.getboolean("SSL", "SSL_ENABLED", fallback=False),
             "max_payload": config.getint("REQUEST", "MAX_PAYLOAD_SIZE", fallback=1024),
+            "max_batch_size": config.getint(
+                "REQUEST", "MAX_BATCH_SIZE", fallback=100000
+            ),
+            "max_batch_payload": config.getint(
+                "REQUEST", "MAX_BATCH_PAYLOAD_SIZE", fallback=4194304
+            ),
             "ssl_certificate": config.get("SSL", "SSL_CERT", fallback=""),
             "ssl_private_key": config.get("SSL", "SSL_KEY", fallback=""),
+            "ssl_ciphers": config.get("SSL", "CIPHERS", fallback=""),
+            "ssl_ecdh_curve": config.get("SSL", "ECDH_CURVE", fallback=""),
+            "ssl_session_tickets": config.getboolean(
+                "SSL", "SESSION_TICKETS", fallback=True
+            ),
+            "ssl_num_tickets": config.getint("SSL", "NUM_TICKETS", fallback=2),
             "debug": config.getboolean("LOGGING", "DEBUG", fallback=False),
             "log_file": config.get("LOGGING", "LOG_FILE", fallback=""),
+            "log_queue_size": config.getint(
+                "LOGGING", "LOG_QUEUE_SIZE", fallback=10000
+            ),
+            "access_log_sample_rate": config.getfloat(
+                "LOGGING", "ACCESS_LOG_SAMPLE_RATE", fallback=0.0
+            ),
             "linuxpath": config.get("FILES", "linuxpath", fallback=""),
+            "algorithm": config.get("SEARCH", "ALGORITHM", fallback="set"),
+            "build_workers": config.getint("SEARCH", "BUILD_WORKERS", fallback=0),
+            "index_file": config.get("FILES", "INDEX_FILE", fallback=""),
+            "bloom_file": config.get("FILES", "BLOOM_FILE", fallback=""),
+            "watch_interval": config.getfloat(
+                "FILES", "WATCH_INTERVAL", fallback=1.0
+            ),
+            "mmap_snapshot": config.getboolean(
+                "FILES", "MMAP_SNAPSHOT", fallback=False
+            ),
+            "bloom_fp_rate": config.getfloat("QUERY", "BLOOM_FP_RATE", fallback=0.01),
             "reread_on_query": config.get("QUERY", "REREAD_ON_QUERY", fallback=False),
+            "result_cache_size": config.getint(
+                "QUERY", "RESULT_CACHE_SIZE", fallback=0
+            ),
+            "result_cache_policy": config.get(
+                "QUERY", "RESULT_CACHE_POLICY", fallback="tinylfu"
+            ),
+            "router_shards": config.get("ROUTER", "SHARDS", fallback=""),
+            "router_shard_ssl": config.getboolean(
+                "ROUTER", "SHARD_SSL", fallback=False
+            ),
+            "router_pool_size": config.getint("ROUTER", "POOL_SIZE", fallback=8),
+            "router_timeout": config.getfloat("ROUTER", "TIMEOUT", fallback=5.0),
+            "router_retry_after": config.getfloat(
+                "ROUTER", "RETRY_AFTER", fallback=5.0
+            ),
         }
     except Exception as e:
         print(f"Error loading config: {e}")
@@ -27,4 +27,21 @@ class FileAccessError(Exception):
     """
     def __init__(self, message="Error accessing the file"):
         self.message = message
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+
+class DataWarmingError(Exception):
+    """
+    Exception raised when a query arrives before the data is loaded.
+    """
+    def __init__(self, message="Search data is still loading"):
+        self.message = message
+        super().__init__(self.message)
+
+class ShardUnavailableError(Exception):
+    """
+    Exception raised when no replica of a shard answers.
+    """
+    def __init__(self, message="No replica of the shard is available"):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,115 @@
+from typing import Iterator
+
+from .exceptions import InvalidPayloadError
+
+"""
+Delimiter-scanned framing over a reusable receive buffer.
+
+Engines receive straight into the free tail of a preallocated bytearray
+(`recv_into`), complete frames are handed out as memoryview slices that
+can be decoded without an intermediate bytes copy, and only the trailing
+partial frame is moved to the front of the buffer before the next receive.
+"""
+
+# Room kept free for each receive on top of one maximum sized frame
+RECV_CHUNK_SIZE: int = 65536
+
+
+class FrameBuffer:
+    """
+    Reusable receive buffer splitting a byte stream into delimited frames.
+
+    Frames longer than `max_frame_size` are rejected before anything is
+    decoded, whether or not their delimiter has arrived yet. Partial frames
+    stay buffered until the rest arrives, and pipelined frames received
+    together are all returned.
+    """
+
+    def __init__(self, max_frame_size: int, delimiter: bytes = b"\n") -> None:
+        self.max_frame_size: int = max_frame_size
+        self.delimiter: bytes = delimiter
+        self._buffer: bytearray = bytearray(max_frame_size + RECV_CHUNK_SIZE)
+        self._view: memoryview = memoryview(self._buffer)
+        # Unconsumed data is _buffer[_start:_end]; no delimiter before _scan
+        self._start: int = 0
+        self._end: int = 0
+        self._scan: int = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def writable(self) -> memoryview:
+        """
+        Return the free part of the buffer to receive into.
+
+        Call `commit` with the number of bytes written afterwards.
+        """
+        self._compact()
+        return self._view[self._end :]
+
+    def commit(self, nbytes: int) -> None:
+        """Mark `nbytes` written into the last `writable` view as received."""
+        self._end += nbytes
+
+    def write(self, data: bytes) -> None:
+        """Copy received bytes into the buffer, for transports returning bytes."""
+        self._compact()
+        if len(data) > len(self._buffer) - self._end:
+            self._grow(self._end + len(data))
+        self._view[self._end : self._end + len(data)] = data
+        self._end += len(data)
+
+    def contains(self, data: bytes) -> bool:
+        """Check whether the unconsumed data contains the given bytes."""
+        return self._buffer.find(data, self._start, self._end) >= 0
+
+    def has_frame(self) -> bool:
+        """Check whether a complete frame is buffered."""
+        return self._buffer.find(self.delimiter, self._scan, self._end) >= 0
+
+    def frames(self) -> Iterator[memoryview]:
+        """
+        Yield the complete frames received so far, without the delimiter.
+
+        Each frame is only valid until the iteration continues.
+
+        Raises:
+            InvalidPayloadError: If a frame exceeds the maximum size.
+        """
+        while True:
+            end: int = self._buffer.find(self.delimiter, self._scan, self._end)
+            if end < 0:
+                self._scan = self._end
+                if self._end - self._start > self.max_frame_size:
+                    raise InvalidPayloadError("Payload too large")
+                return
+            if end - self._start > self.max_frame_size:
+                raise InvalidPayloadError("Payload too large")
+            frame: memoryview = self._view[self._start : end]
+            self._start = self._scan = end + len(self.delimiter)
+            try:
+                yield frame
+            finally:
+                frame.release()
+
+    def take_remaining(self) -> bytes:
+        """Remove and return the buffered partial frame."""
+        data: bytes = bytes(self._view[self._start : self._end])
+        self._start = self._end = self._scan = 0
+        return data
+
+    def _compact(self) -> None:
+        """Move the partial frame to the front to free the tail."""
+        if not self._start:
+            return
+        size: int = self._end - self._start
+        if size:
+            self._buffer[:size] = self._buffer[self._start : self._end]
+        self._scan -= self._start
+        self._start, self._end = 0, size
+
+    def _grow(self, size: int) -> None:
+        """Enlarge the buffer; no frame view may be held at this point."""
+        self._view.release()
+        self._buffer.extend(bytes(size - len(self._buffer)))
+        self._view = memoryview(self._buffer)
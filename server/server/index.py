@@ -0,0 +1,273 @@
+import math
+from typing import Callable, FrozenSet, Iterable, List, Optional, Union
+
+from .search_algorithms import binary_search, search_in_set
+
+"""
+Long-lived lookup index built once from the search file and shared
+read-only by every handler thread.
+"""
+
+# Lines a `DeltaIndex` holds on top of its base before they are merged into
+# a new base, at least; larger bases allow the square root of their size
+DELTA_MIN_LINES: int = 1024
+
+
+class StringIndex:
+    """
+    Immutable index over the lines of the search file.
+
+    The lines are deduplicated into a frozenset for O(1) membership checks
+    and presorted once, so the sorted-array algorithms in `search_algorithms`
+    run against the same structure without re-sorting on every query.
+
+    Args:
+        lines: The lines of the search file
+        presorted: Whether the lines are a list already sorted and
+            deduplicated, as built by `parallel_build`
+    """
+
+    __slots__ = ("members", "sorted_lines")
+
+    def __init__(self, lines: Iterable[str], presorted: bool = False) -> None:
+        self.members: FrozenSet[str] = frozenset(lines)
+        self.sorted_lines: List[str] = lines if presorted else sorted(self.members)
+
+    @classmethod
+    def _from_parts(
+        cls, members: FrozenSet[str], sorted_lines: List[str]
+    ) -> "StringIndex":
+        """Create an index from already deduplicated and sorted parts."""
+        index: StringIndex = cls.__new__(cls)
+        index.members = members
+        index.sorted_lines = sorted_lines
+        return index
+
+    def extend(self, lines: Iterable[str]) -> Union["StringIndex", "DeltaIndex"]:
+        """
+        Build a new index with the given lines added, leaving this one intact.
+
+        A few lines are kept in a `DeltaIndex` on top of this one, so they
+        cost no copy of it; more are merged into a new index.
+
+        Args:
+            lines (Iterable[str]): Lines to add.
+
+        Returns:
+            The new index.
+        """
+        return DeltaIndex(self).extend(lines)
+
+    def merge(self, added: FrozenSet[str]) -> "StringIndex":
+        """
+        Build a new index with the given new lines merged in.
+
+        Only the new lines are sorted; merging them into the presorted lines
+        is linear because Timsort detects the two existing runs.
+
+        Args:
+            added (FrozenSet[str]): Lines not in this index.
+
+        Returns:
+            StringIndex: The new index.
+        """
+        if not added:
+            return self
+        return StringIndex._from_parts(
+            self.members | added, sorted(self.sorted_lines + sorted(added))
+        )
+
+    def __len__(self) -> int:
+        return len(self.sorted_lines)
+
+    def __contains__(self, search_string: object) -> bool:
+        return search_string in self.members
+
+    def contains_many(self, search_strings: Iterable[str]) -> List[bool]:
+        """
+        Check a batch of strings against the index in one pass.
+
+        Args:
+            search_strings (Iterable[str]): The strings being searched.
+
+        Returns:
+            List[bool]: Whether each string exists, in the same order.
+        """
+        members: FrozenSet[str] = self.members
+        return [search_string in members for search_string in search_strings]
+
+    def contains(
+        self,
+        search_string: str,
+        algorithm: Optional[Callable[[str, List[str]], bool]] = None,
+    ) -> bool:
+        """
+        Check whether the given string exists in the index.
+
+        Args:
+            search_string (str): The string being searched.
+            algorithm: Optional function from `search_algorithms`. The hash
+                lookup is used by default; any other algorithm is run against
+                the presorted lines.
+
+        Returns:
+            bool: True if found, False otherwise.
+        """
+        if algorithm is None or algorithm is search_in_set:
+            return search_in_set(search_string, self.members)
+        return algorithm(search_string, self.sorted_lines)
+
+
+class DeltaIndex:
+    """
+    Immutable `StringIndex` plus the lines added to it since it was built.
+
+    Extending copies only the added lines, not the base, so a file growing
+    by small appends is not re-indexed as a whole each time. Once the delta
+    outgrows the square root of the base (and `DELTA_MIN_LINES`), it is
+    merged into a new base, which keeps the amortized cost of an added line
+    at O(sqrt(n)). The sorted lines are only merged when first used.
+
+    Args:
+        base: The index the lines are added to
+        added: Lines not in the base
+    """
+
+    __slots__ = ("base", "added", "_sorted_lines")
+
+    def __init__(self, base: StringIndex, added: FrozenSet[str] = frozenset()) -> None:
+        self.base: StringIndex = base
+        self.added: FrozenSet[str] = added
+        self._sorted_lines: Optional[List[str]] = None
+
+    def extend(self, lines: Iterable[str]) -> Union[StringIndex, "DeltaIndex"]:
+        """
+        Build a new index with the given lines added, leaving this one intact.
+
+        Args:
+            lines (Iterable[str]): Lines to add.
+
+        Returns:
+            The new index, with a new base if the delta grew too large.
+        """
+        members: FrozenSet[str] = self.base.members
+        new: FrozenSet[str] = frozenset(
+            line for line in lines if line not in members
+        ) - self.added
+        if not new:
+            return self
+        added: FrozenSet[str] = self.added | new
+        limit: int = max(DELTA_MIN_LINES, math.isqrt(len(self.base)))
+        if len(added) > limit:
+            return self.base.merge(added)
+        return DeltaIndex(self.base, added)
+
+    @property
+    def sorted_lines(self) -> List[str]:
+        if self._sorted_lines is None:
+            self._sorted_lines = sorted(
+                self.base.sorted_lines + sorted(self.added)
+            )
+        return self._sorted_lines
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.added)
+
+    def __contains__(self, search_string: object) -> bool:
+        return search_string in self.base.members or search_string in self.added
+
+    def contains_many(self, search_strings: Iterable[str]) -> List[bool]:
+        """
+        Check a batch of strings against the index in one pass.
+
+        Args:
+            search_strings (Iterable[str]): The strings being searched.
+
+        Returns:
+            List[bool]: Whether each string exists, in the same order.
+        """
+        members: FrozenSet[str] = self.base.members
+        added: FrozenSet[str] = self.added
+        return [
+            search_string in members or search_string in added
+            for search_string in search_strings
+        ]
+
+    def contains(
+        self,
+        search_string: str,
+        algorithm: Optional[Callable[[str, List[str]], bool]] = None,
+    ) -> bool:
+        """
+        Check whether the given string exists in the index.
+
+        Args:
+            search_string (str): The string being searched.
+            algorithm: Optional function from `search_algorithms`. The hash
+                lookups are used by default; any other algorithm is run
+                against the sorted lines.
+
+        Returns:
+            bool: True if found, False otherwise.
+        """
+        if algorithm is None or algorithm is search_in_set:
+            return search_string in self.base.members or search_string in self.added
+        return algorithm(search_string, self.sorted_lines)
+
+
+class SortedListIndex:
+    """
+    Immutable index holding only the presorted, deduplicated lines.
+
+    Lookups binary search the list, trading the O(1) hash lookup of
+    `StringIndex` for about half its memory.
+
+    Args:
+        lines: The lines of the search file
+        presorted: Whether the lines are a list already sorted and
+            deduplicated, as built by `parallel_build`
+    """
+
+    __slots__ = ("sorted_lines",)
+
+    def __init__(self, lines: Iterable[str], presorted: bool = False) -> None:
+        self.sorted_lines: List[str] = lines if presorted else sorted(set(lines))
+
+    def __len__(self) -> int:
+        return len(self.sorted_lines)
+
+    def __contains__(self, search_string: object) -> bool:
+        return isinstance(search_string, str) and binary_search(
+            search_string, self.sorted_lines
+        )
+
+    def contains_many(self, search_strings: Iterable[str]) -> List[bool]:
+        """
+        Check a batch of strings against the index.
+
+        Args:
+            search_strings (Iterable[str]): The strings being searched.
+
+        Returns:
+            List[bool]: Whether each string exists, in the same order.
+        """
+        lines: List[str] = self.sorted_lines
+        return [binary_search(search_string, lines) for search_string in search_strings]
+
+    def contains(
+        self,
+        search_string: str,
+        algorithm: Optional[Callable[[str, List[str]], bool]] = None,
+    ) -> bool:
+        """
+        Check whether the given string exists in the index.
+
+        Args:
+            search_string (str): The string being searched.
+            algorithm: Optional function from `search_algorithms`, run against
+                the sorted lines; binary search by default.
+
+        Returns:
+            bool: True if found, False otherwise.
+        """
+        return (algorithm or binary_search)(search_string, self.sorted_lines)
@@ -0,0 +1,233 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import logging
+from array import array
+from typing import Optional, Sequence, Tuple
+
+from .mmap_index import SortedBytesIndex
+from .utils import split_byte_lines
+
+logger = logging.getLogger(__name__)
+
+"""
+On-disk sorted index file, memory-mapped at startup instead of parsing
+the text data file.
+
+Layout (little endian):
+- header: magic, format version, record count, size, mtime and checksum
+  of the source data file
+- offset table: record count + 1 unsigned 64-bit offsets into the records
+- records: the sorted, deduplicated lines, concatenated without separators
+"""
+
+MAGIC: bytes = b"TSSIDX\x00\x01"
+VERSION: int = 1
+# magic, version, reserved, record count, source size, source mtime_ns, checksum
+HEADER = struct.Struct("<8sIIQQq16s")
+CHECKSUM_CHUNK_SIZE: int = 1 << 20
+
+
+def source_checksum(file_path: str) -> bytes:
+    """
+    Compute the checksum of a source data file, as stored in the header.
+
+    Args:
+        file_path (str): Path to the source file.
+
+    Returns:
+        bytes: The 16-byte BLAKE2b digest of the file contents.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def source_matches(
+    source_path: str, size: int, mtime_ns: int, checksum: bytes
+) -> bool:
+    """
+    Check whether a source data file is the one a derived file was built from.
+
+    Size and modification time are compared first; the checksum is only
+    computed when the size matches but the time does not, e.g. after a
+    copy or a touch.
+
+    Args:
+        source_path (str): Path to the text data file.
+        size (int): Size of the source file recorded at build time.
+        mtime_ns (int): Modification time recorded at build time.
+        checksum (bytes): Checksum recorded at build time.
+
+    Returns:
+        bool: True if the source file is unchanged.
+    """
+    try:
+        stat: os.stat_result = os.stat(source_path)
+    except OSError:
+        return False
+    if stat.st_size != size:
+        return False
+    if stat.st_mtime_ns == mtime_ns:
+        return True
+    return source_checksum(source_path) == checksum
+
+
+def write_index_file(
+    source_path: str, index_path: str, records: Optional[Sequence[bytes]] = None
+) -> int:
+    """
+    Write the sorted index file for a text data file.
+
+    The file is written next to its final path and renamed into place, so
+    a running server never maps a half-written index.
+
+    Args:
+        source_path (str): Path to the text data file.
+        index_path (str): Path of the index file to write.
+        records (Optional[Sequence[bytes]]): Sorted, unique records, if
+            already built; otherwise they are read from the source file.
+
+    Returns:
+        int: The number of records written.
+    """
+    stat: os.stat_result = os.stat(source_path)
+    checksum: bytes = source_checksum(source_path)
+    if records is None:
+        with open(source_path, "rb") as f:
+            records = sorted(set(split_byte_lines(f.read())))
+
+    offsets: array = array("Q", [0])
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    temp_path: str = f"{index_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                0,
+                len(offsets) - 1,
+                stat.st_size,
+                stat.st_mtime_ns,
+                checksum,
+            )
+        )
+        f.write(offsets.tobytes())
+        for record in records:
+            f.write(record)
+    os.replace(temp_path, index_path)
+    return len(offsets) - 1
+
+
+class _RecordLines(Sequence):
+    """Read-only sequence of the records of a mapped index file."""
+
+    def __init__(self, data: mmap.mmap, offsets: Sequence[int], base: int) -> None:
+        self._data: mmap.mmap = data
+        self._offsets: Sequence[int] = offsets
+        self._base: int = base
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("record index out of range")
+        start: int = self._base + self._offsets[i]
+        return self._data[start : self._base + self._offsets[i + 1]]
+
+
+class IndexFile(SortedBytesIndex):
+    """
+    Memory-mapped sorted index file.
+
+    Opening it only validates the header and sizes; the offset table and
+    records are read straight from the mapping, so startup time does not
+    depend on the size of the data.
+    """
+
+    __slots__ = ("index_path", "source_size", "source_mtime_ns", "checksum", "_data")
+
+    def __init__(self, index_path: str) -> None:
+        self.index_path: str = index_path
+        with open(index_path, "rb") as f:
+            self._data: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < HEADER.size:
+            raise ValueError(f"Index file too short: {index_path}")
+        magic, version, _, count, size, mtime_ns, checksum = HEADER.unpack_from(
+            self._data
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a version {VERSION} index file: {index_path}")
+        self.source_size: int = size
+        self.source_mtime_ns: int = mtime_ns
+        self.checksum: bytes = checksum
+
+        table_end: int = HEADER.size + (count + 1) * 8
+        if len(self._data) < table_end:
+            raise ValueError(f"Truncated offset table: {index_path}")
+        offsets: Sequence[int] = memoryview(self._data)[
+            HEADER.size : table_end
+        ].cast("Q")
+        if sys.byteorder != "little":
+            swapped: array = array("Q", offsets)
+            swapped.byteswap()
+            offsets = swapped
+        if len(self._data) != table_end + offsets[count]:
+            raise ValueError(f"Truncated records: {index_path}")
+        self._set_lines(_RecordLines(self._data, offsets, table_end))
+
+    def footprint(self) -> Tuple[int, int]:
+        """Return the bytes held in memory and the bytes mapped from files."""
+        return 0, len(self._data)
+
+    def is_fresh(self, source_path: str) -> bool:
+        """
+        Check whether the index still matches its source data file.
+
+        Args:
+            source_path (str): Path to the text data file.
+
+        Returns:
+            bool: True if the index can be used for the source file.
+        """
+        return source_matches(
+            source_path, self.source_size, self.source_mtime_ns, self.checksum
+        )
+
+
+def load_index_file(source_path: str, index_path: str) -> Optional[IndexFile]:
+    """
+    Open the index file for a data file if it exists and is up to date.
+
+    Args:
+        source_path (str): Path to the text data file.
+        index_path (str): Path to the index file.
+
+    Returns:
+        Optional[IndexFile]: The index, or None if it is missing, invalid or
+        stale and the text file has to be parsed instead.
+    """
+    if not index_path or not os.path.exists(index_path):
+        return None
+    try:
+        index: IndexFile = IndexFile(index_path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring index file: {e}")
+        return None
+    if not index.is_fresh(source_path):
+        logger.warning(f"Index file {index_path} is stale, parsing {source_path}")
+        return None
+    return index
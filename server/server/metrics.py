@@ -0,0 +1,312 @@
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+"""
+Process-wide metrics: counters, gauges and latency histograms.
+
+Counters and histograms are sharded per thread: every thread increments
+its own slots without a lock and readers sum the shards, so recording a
+query costs a few integer additions. Histograms use HDR-style log-linear
+buckets (32 sub-buckets per power of two, about 3% relative error) over
+microseconds, so percentiles stay accurate from microseconds to minutes
+in a fixed amount of memory.
+"""
+
+# Connection phases with a latency histogram
+PHASES = ("recv", "tls", "tls_resumed", "reload", "lookup", "send")
+COUNTERS = (
+    "connections",
+    "queries",
+    "batches",
+    "rejected_connections",
+    "errors",
+    "cache_hits",
+    "cache_misses",
+    "filter_rejects",
+    "filter_false_positives",
+    "tls_handshakes",
+    "tls_resumed",
+    "warming",
+)
+GAUGES = ("active_connections", "queue_depth")
+PERCENTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+
+SUB_BUCKET_BITS: int = 5
+SUB_BUCKETS: int = 1 << SUB_BUCKET_BITS
+# Values up to 2^40 us (about 12 days) are bucketed, larger ones clamped
+MAX_VALUE_BITS: int = 40
+BUCKETS: int = 2 * SUB_BUCKETS + (MAX_VALUE_BITS - SUB_BUCKET_BITS - 1) * SUB_BUCKETS
+MAX_VALUE: int = (1 << MAX_VALUE_BITS) - 1
+
+
+def bucket_index(value: int) -> int:
+    """
+    Return the histogram bucket of a value.
+
+    Values below 2 * SUB_BUCKETS get a bucket each; above that, each power
+    of two is split into SUB_BUCKETS equal buckets.
+    """
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift: int = value.bit_length() - SUB_BUCKET_BITS - 1
+    return 2 * SUB_BUCKETS + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_high(index: int) -> int:
+    """Return the highest value counted in a histogram bucket."""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift, sub = divmod(index - 2 * SUB_BUCKETS, SUB_BUCKETS)
+    return ((sub + SUB_BUCKETS + 1) << (shift + 1)) - 1
+
+
+class Counter:
+    """Monotonic counter sharded per thread."""
+
+    def __init__(self) -> None:
+        self._shards: List[List[int]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        """Add to the counter."""
+        try:
+            self._local.shard[0] += amount
+        except AttributeError:
+            shard: List[int] = [amount]
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+
+    @property
+    def value(self) -> int:
+        return sum(shard[0] for shard in self._shards)
+
+
+class Gauge:
+    """
+    Current value with its peak since startup.
+
+    Gauges change once per connection rather than per query, so a lock is
+    cheap here and keeps the peak exact.
+    """
+
+    def __init__(self) -> None:
+        self.value: int = 0
+        self.peak: int = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+            if self.value > self.peak:
+                self.peak = self.value
+
+    def dec(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: int) -> None:
+        with self._lock:
+            self.value = value
+            if value > self.peak:
+                self.peak = value
+
+
+class _HistogramShard:
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts: array = array("q", bytes(8 * BUCKETS))
+        self.total: int = 0
+        self.max: int = 0
+
+
+class Histogram:
+    """Latency histogram in microseconds, sharded per thread."""
+
+    def __init__(self) -> None:
+        self._shards: List[_HistogramShard] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _HistogramShard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: _HistogramShard = _HistogramShard()
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def record(self, seconds: float) -> None:
+        """Record a duration given in seconds, as returned by `timer()`."""
+        value: int = min(max(int(seconds * 1_000_000), 0), MAX_VALUE)
+        shard: _HistogramShard = self._shard()
+        shard.counts[bucket_index(value)] += 1
+        shard.total += value
+        if value > shard.max:
+            shard.max = value
+
+    def snapshot(self) -> "HistogramSnapshot":
+        """Merge the shards into a point-in-time copy."""
+        merged: HistogramSnapshot = HistogramSnapshot()
+        for shard in list(self._shards):
+            merged.add(shard.counts, shard.total, shard.max)
+        return merged
+
+
+class HistogramSnapshot:
+    """Merged bucket counts of one or more histograms."""
+
+    def __init__(self) -> None:
+        self.counts: array = array("q", bytes(8 * BUCKETS))
+        self.total: int = 0
+        self.max: int = 0
+
+    def add(self, counts: Iterable[int], total: int, maximum: int) -> None:
+        """Merge in the buckets of another histogram."""
+        for index, count in enumerate(counts):
+            if count:
+                self.counts[index] += count
+        self.total += total
+        self.max = max(self.max, maximum)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, quantile: float) -> int:
+        """Return the value below which the given share of samples fall."""
+        count: int = self.count
+        if not count:
+            return 0
+        rank: int = max(1, math.ceil(quantile * count))
+        seen: int = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= rank:
+                return min(bucket_high(index), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summarize the histogram, with all values in microseconds."""
+        count: int = self.count
+        summary: Dict[str, Any] = {
+            "count": count,
+            "mean": round(self.total / count, 1) if count else 0,
+        }
+        for name, quantile in PERCENTILES:
+            summary[name] = self.percentile(quantile)
+        summary["max"] = self.max
+        return summary
+
+
+class MetricsRegistry:
+    """
+    The counters, gauges and per-phase latency histograms of a process.
+
+    The set of metrics is fixed, so a registry can be exported as a flat
+    array of integers and merged with the exports of other processes.
+    """
+
+    def __init__(self) -> None:
+        self.started: float = time.time()
+        self.counters: Dict[str, Counter] = {name: Counter() for name in COUNTERS}
+        self.gauges: Dict[str, Gauge] = {name: Gauge() for name in GAUGES}
+        self.histograms: Dict[str, Histogram] = {name: Histogram() for name in PHASES}
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        """Add to a counter."""
+        self.counters[name].inc(amount)
+
+    def record(self, phase: str, seconds: float) -> None:
+        """Record the duration of a connection phase."""
+        self.histograms[phase].record(seconds)
+
+    def export(self) -> array:
+        """
+        Flatten the metrics into an array of signed 64-bit integers.
+
+        Layout: start time, counters, (value, peak) per gauge, then per phase
+        the total, the maximum and the bucket counts.
+        """
+        values: array = array("q", [int(self.started)])
+        values.extend(counter.value for counter in self.counters.values())
+        for gauge in self.gauges.values():
+            values.extend((gauge.value, gauge.peak))
+        for histogram in self.histograms.values():
+            merged: HistogramSnapshot = histogram.snapshot()
+            values.extend((merged.total, merged.max))
+            values.extend(merged.counts)
+        return values
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current metrics of this process."""
+        return merge_exports([self.export()])
+
+
+# Number of integers in `MetricsRegistry.export()`
+EXPORT_SIZE: int = 1 + len(COUNTERS) + 2 * len(GAUGES) + len(PHASES) * (BUCKETS + 2)
+
+
+def merge_exports(exports: Iterable[array]) -> Dict[str, Any]:
+    """
+    Merge exported metrics, e.g. of the pre-fork workers, into one view.
+
+    Counters and gauges are summed (so gauge peaks are an upper bound) and
+    histograms merged bucket by bucket, so percentiles are exact across
+    processes.
+
+    Args:
+        exports: Arrays as returned by `MetricsRegistry.export()`
+
+    Returns:
+        Dict[str, Any]: Counters, gauges, and latency summaries in
+        microseconds per phase.
+    """
+    started: Optional[int] = None
+    counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+    gauges: Dict[str, Dict[str, int]] = {
+        name: {"value": 0, "peak": 0} for name in GAUGES
+    }
+    histograms: Dict[str, HistogramSnapshot] = {
+        name: HistogramSnapshot() for name in PHASES
+    }
+    processes: int = 0
+    for values in exports:
+        processes += 1
+        started = min(started or values[0], values[0])
+        position: int = 1
+        for name in COUNTERS:
+            counters[name] += values[position]
+            position += 1
+        for name in GAUGES:
+            gauges[name]["value"] += values[position]
+            gauges[name]["peak"] += values[position + 1]
+            position += 2
+        for name in PHASES:
+            total, maximum = values[position], values[position + 1]
+            histograms[name].add(
+                values[position + 2 : position + 2 + BUCKETS], total, maximum
+            )
+            position += BUCKETS + 2
+    return {
+        "pid": os.getpid(),
+        "processes": processes,
+        "uptime": round(time.time() - started, 1) if started else 0,
+        "counters": counters,
+        "gauges": gauges,
+        "latency_us": {
+            name: histogram.to_dict() for name, histogram in histograms.items()
+        },
+    }
+
+
+# Process-wide registry shared by the engines
+METRICS: MetricsRegistry = MetricsRegistry()
@@ -0,0 +1,253 @@
+import abc
+import bisect
+import contextlib
+import functools
+import heapq
+import mmap
+import os
+import shutil
+import tempfile
+from array import array
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .search_algorithms import search_in_set
+from .utils import strip_line_end
+
+"""
+Memory-mapped, sorted lookup index for data files too large to hold as
+Python strings.
+
+The file is mapped read-only and only an array of line start offsets,
+ordered by line content, is kept in memory (8 bytes per line). Lookups
+binary search the mapped bytes directly, so resident memory stays close
+to the file size instead of several times it.
+
+A mapping only stays valid while the file keeps its size: rewriting the
+mapped file in place (`open(path, "w")`, `>`) truncates it and the next
+access to the lost pages kills the process with SIGBUS. Writers must
+replace the file by renaming a new one over it, which leaves the mapped
+inode intact. Where that cannot be guaranteed, the engines can map a
+private `snapshot` of the data file instead, at the cost of a full copy
+per build.
+"""
+
+# Lines sorted at a time when building the index of an unsorted file; the
+# sorted runs are merged so only one run's keys are held in memory at once
+SORT_RUN_LINES: int = 1 << 18
+
+
+@contextlib.contextmanager
+def snapshot(file_path: str) -> Iterator[str]:
+    """
+    Copy a file to a private temporary file, deleted on exit.
+
+    The copy is created next to the file, on the same file system, or in
+    the temporary directory if that is not writable. Mappings of the copy
+    stay valid after it is deleted, until they are closed.
+
+    Args:
+        file_path: Path to the file to copy
+
+    Yields:
+        str: Path of the copy.
+    """
+    try:
+        fd, path = tempfile.mkstemp(
+            prefix=".snapshot-", dir=os.path.dirname(os.path.abspath(file_path))
+        )
+    except OSError:
+        fd, path = tempfile.mkstemp(prefix="snapshot-")
+    try:
+        os.close(fd)
+        shutil.copyfile(file_path, path)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+class _MappedLines(Sequence):
+    """Read-only sequence of the indexed lines, as bytes, in sorted order."""
+
+    def __init__(self, data: mmap.mmap, starts: array) -> None:
+        self._data: mmap.mmap = data
+        self._starts: array = starts
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return _line_at(self._data, self._starts[i])
+
+
+class DecodedLines(Sequence):
+    """The lines of a bytes sequence as `str`, decoded on access."""
+
+    def __init__(self, lines: Sequence[bytes]) -> None:
+        self._lines: Sequence[bytes] = lines
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._lines[i].decode("utf-8", "replace")
+
+
+def _line_at(data: mmap.mmap, start: int) -> bytes:
+    """Return the line starting at the given offset, without line ending."""
+    end: int = data.find(b"\n", start)
+    if end < 0:
+        end = len(data)
+    if end > start and data[end - 1] == 13:  # \r
+        end -= 1
+    return data[start:end]
+
+
+class SortedBytesIndex(abc.ABC):
+    """
+    Lookup interface shared by the indexes over sorted, unique byte lines.
+
+    Subclasses set `lines` to a sequence of the lines as bytes in sorted
+    order; lookups bisect it and the algorithms from `search_algorithms`
+    run against the same lines decoded on access.
+    """
+
+    __slots__ = ("lines", "sorted_lines")
+
+    def _set_lines(self, lines: Sequence[bytes]) -> None:
+        self.lines: Sequence[bytes] = lines
+        self.sorted_lines: DecodedLines = DecodedLines(lines)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __contains__(self, search_string: object) -> bool:
+        return isinstance(search_string, str) and self._find(search_string.encode())
+
+    def _find(self, key: bytes) -> bool:
+        """Binary search the lines for the given bytes."""
+        index: int = bisect.bisect_left(self.lines, key)
+        return index != len(self.lines) and self.lines[index] == key
+
+    def contains_many(self, search_strings: Iterable[str]) -> List[bool]:
+        """
+        Check a batch of strings against the index.
+
+        Args:
+            search_strings (Iterable[str]): The strings being searched.
+
+        Returns:
+            List[bool]: Whether each string exists, in the same order.
+        """
+        return [self._find(search_string.encode()) for search_string in search_strings]
+
+    def contains(
+        self,
+        search_string: str,
+        algorithm: Optional[Callable[[str, Sequence[str]], bool]] = None,
+    ) -> bool:
+        """
+        Check whether the given string exists in the index.
+
+        Args:
+            search_string (str): The string being searched.
+            algorithm: Optional function from `search_algorithms`. The binary
+                search over the bytes is used by default; any other algorithm
+                is run against the sorted lines decoded on access.
+
+        Returns:
+            bool: True if found, False otherwise.
+        """
+        if algorithm is None or algorithm is search_in_set:
+            return self._find(search_string.encode())
+        return algorithm(search_string, self.sorted_lines)
+
+    @abc.abstractmethod
+    def footprint(self) -> Tuple[int, int]:
+        """Return the bytes held in memory and the bytes mapped from files."""
+
+
+class MmapIndex(SortedBytesIndex):
+    """
+    Immutable index over a memory-mapped data file.
+
+    Exposes the same lookup interface as `StringIndex`. Lines are
+    deduplicated and sorted by their bytes once at build time; if the file
+    is already sorted, no sorting is needed at all.
+
+    Args:
+        file_path: Path to the data file
+        starts: The offsets of the unique lines in sorted order, if already
+            built (see `parallel_build.sorted_line_starts`)
+    """
+
+    __slots__ = ("file_path", "_data", "_starts")
+
+    def __init__(self, file_path: str, starts: Optional[array] = None) -> None:
+        self.file_path: str = file_path
+        with open(file_path, "rb") as f:
+            # Zero-length files cannot be mapped
+            self._data: Optional[mmap.mmap] = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if f.seek(0, 2)
+                else None
+            )
+        if self._data is None:
+            starts = array("Q")
+        self._starts: array = starts if starts is not None else self._build()
+        self._set_lines(_MappedLines(self._data, self._starts))
+
+    def footprint(self) -> Tuple[int, int]:
+        """Return the bytes held in memory and the bytes mapped from files."""
+        return (
+            self._starts.buffer_info()[1] * self._starts.itemsize,
+            len(self._data) if self._data is not None else 0,
+        )
+
+    def _build(self) -> array:
+        """
+        Collect the start offset of every non-empty line, in sorted order.
+
+        Returns:
+            array: The offsets of the unique lines, ordered by line content.
+        """
+        data: mmap.mmap = self._data
+        starts: array = array("Q")
+        is_sorted: bool = True
+        previous: bytes = b""
+        position: int = 0
+        for raw in iter(data.readline, b""):
+            line: bytes = strip_line_end(raw)
+            if line:
+                if is_sorted and line <= previous and starts:
+                    is_sorted = line == previous
+                    if is_sorted:
+                        # Adjacent duplicate in a sorted file
+                        position += len(raw)
+                        continue
+                starts.append(position)
+                previous = line
+            position += len(raw)
+        if is_sorted:
+            return starts
+
+        # External sort: sorting all offsets at once would hold the key of
+        # every line, several times the file size
+        key: Callable[[int], bytes] = functools.partial(_line_at, data)
+        runs: List[array] = [
+            array("Q", sorted(starts[i : i + SORT_RUN_LINES], key=key))
+            for i in range(0, len(starts), SORT_RUN_LINES)
+        ]
+        del starts
+        unique: array = array("Q")
+        previous = b""
+        for line, start in heapq.merge(
+            *(((key(start), start) for start in run) for run in runs)
+        ):
+            if not unique or line != previous:
+                unique.append(start)
+                previous = line
+        return unique
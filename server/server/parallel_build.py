@@ -0,0 +1,404 @@
+import bisect
+import contextlib
+import functools
+import logging
+import mmap
+import multiprocessing
+import os
+from array import array
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from timeit import default_timer as timer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .utils import strip_line_end
+
+logger = logging.getLogger(__name__)
+
+"""
+Parallel build of the sorted, deduplicated lines of large data files.
+
+The file is split at line boundaries into one byte range per worker
+process and built in two parallel stages over a read-only mapping of it:
+- sort: each worker splits its range into lines, sorts and deduplicates
+  them, and publishes them with their offsets as a sorted run
+- merge: the key space is cut at splitters sampled from the runs, and
+  each worker merges the slice of every run falling in its key range
+Only file offsets and cut points are passed to the workers: results are
+exchanged through shared memory blocks, never as pickled line lists, and
+the key ranges concatenate into the final order without a serial merge.
+Files below `PARALLEL_MIN_BYTES` are built serially, as starting the
+workers would cost more than it saves.
+"""
+
+# Smallest data file built in parallel (in bytes)
+PARALLEL_MIN_BYTES: int = 64 * 2**20
+# Keys sampled from each sorted run to choose the merge splitters, per worker
+SAMPLES_PER_WORKER: int = 32
+
+# Shared memory block holding a result: (name, size in bytes)
+SharedBlock = Tuple[str, int]
+# Sorted run of the sort stage: its block and number of lines
+Run = Tuple[SharedBlock, int]
+
+
+def worker_count(setting: int) -> int:
+    """Return the processes of a `[SEARCH] BUILD_WORKERS` setting (0 = per core)."""
+    return setting if setting > 0 else os.cpu_count() or 1
+
+
+def workers_for(file_path: str, setting: int) -> int:
+    """
+    Return the processes to build the given file with.
+
+    Args:
+        file_path: Path to the data file
+        setting: The `[SEARCH] BUILD_WORKERS` setting
+
+    Returns:
+        int: The number of workers, 1 for a serial build.
+    """
+    workers: int = worker_count(setting)
+    try:
+        if workers > 1 and os.path.getsize(file_path) >= PARALLEL_MIN_BYTES:
+            return workers
+    except OSError:
+        pass
+    return 1
+
+
+def line_ranges(data: mmap.mmap, parts: int) -> List[Tuple[int, int]]:
+    """
+    Split mapped data into byte ranges of about equal size at line boundaries.
+
+    Args:
+        data: The mapped file
+        parts: Number of ranges wanted
+
+    Returns:
+        List[Tuple[int, int]]: The non-empty (start, end) ranges, in file
+        order; every range but the last ends just after a newline.
+    """
+    size: int = len(data)
+    bounds: List[int] = [0]
+    for part in range(1, parts):
+        cut: int = max(bounds[-1], size * part // parts)
+        if cut == 0:
+            continue
+        newline: int = data.find(b"\n", cut - 1)
+        bounds.append(newline + 1 if newline >= 0 else size)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def sorted_line_starts(
+    file_path: str, workers: int, stages: Optional[Dict[str, float]] = None
+) -> array:
+    """
+    Collect the start offset of every unique non-empty line, in sorted order.
+
+    The parallel counterpart of `MmapIndex._build`.
+
+    Args:
+        file_path: Path to the data file
+        workers: Number of worker processes
+        stages: Optional dict receiving the time of each stage (in ms)
+
+    Returns:
+        array: The offsets of the unique lines, ordered by line content.
+    """
+    starts: array = array("Q")
+    with _parallel_build(file_path, workers, False, stages) as blocks:
+        for block in blocks:
+            with _attach(block) as view:
+                starts.frombytes(view)
+    return starts
+
+
+def read_sorted_lines(
+    file_path: str, workers: int, stages: Optional[Dict[str, float]] = None
+) -> List[str]:
+    """
+    Read the unique non-empty lines of a file, sorted, in parallel.
+
+    Each worker joins the lines of its key range, so the main process only
+    decodes and splits whole blocks instead of slicing line by line.
+
+    Args:
+        file_path: Path to the data file
+        workers: Number of worker processes
+        stages: Optional dict receiving the time of each stage (in ms)
+
+    Returns:
+        List[str]: The lines in sorted order, without duplicates.
+
+    Raises:
+        UnicodeDecodeError: If the file is not valid UTF-8.
+    """
+    lines: List[str] = []
+    with _parallel_build(file_path, workers, True, stages) as blocks:
+        for block in blocks:
+            if block[1]:
+                with _attach(block) as view:
+                    lines.extend(str(view, "utf-8").split("\n"))
+    return lines
+
+
+@contextlib.contextmanager
+def _parallel_build(
+    file_path: str, workers: int, text: bool, stages: Optional[Dict[str, float]]
+) -> Iterator[List[SharedBlock]]:
+    """
+    Run the sort and merge stages, yielding the merged blocks in key order.
+
+    Every shared memory block is removed on exit, and the time spent on
+    each stage, including the caller's collection of the blocks, is logged
+    and recorded in `stages`.
+    """
+    timings: Dict[str, float] = {} if stages is None else stages
+    created: List[SharedBlock] = []
+    start: float = timer()
+    with open(file_path, "rb") as f:
+        # Zero-length files cannot be mapped
+        data: Optional[mmap.mmap] = (
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else None
+        )
+    if data is None:
+        yield []
+        return
+    # Workers register their blocks with this process's tracker, so that
+    # the blocks outlive them
+    resource_tracker.ensure_running()
+    try:
+        try:
+            ranges: List[Tuple[int, int]] = line_ranges(data, workers)
+        finally:
+            data.close()
+        timings["split"] = (timer() - start) * 1000
+
+        with ProcessPoolExecutor(len(ranges), mp_context=_context()) as pool:
+            start = timer()
+            runs: List[Run] = list(
+                pool.map(_sort_range, [file_path] * len(ranges), *zip(*ranges))
+            )
+            created += [block for block, _ in runs]
+            timings["sort"] = (timer() - start) * 1000
+
+            start = timer()
+            cuts: List[List[int]] = _cut_runs(runs, workers)
+            slices: List[List[Tuple[SharedBlock, int, int, int]]] = [
+                [
+                    (block, count, run_cuts[part], run_cuts[part + 1])
+                    for (block, count), run_cuts in zip(runs, cuts)
+                ]
+                for part in range(len(cuts[0]) - 1)
+            ]
+            merged: List[SharedBlock] = list(
+                pool.map(functools.partial(_merge_range, text=text), slices)
+            )
+            created += merged
+            timings["merge"] = (timer() - start) * 1000
+
+        start = timer()
+        yield merged
+        timings["collect"] = (timer() - start) * 1000
+        logger.info(
+            f"Built {file_path} with {len(ranges)} processes: "
+            + ", ".join(f"{stage} {ms:.2f}ms" for stage, ms in timings.items())
+        )
+    finally:
+        for name, _ in created:
+            _unlink(name)
+
+
+def _context() -> multiprocessing.context.BaseContext:
+    """
+    Start method of the workers.
+
+    Builds run while the server threads hold locks (logging, worker pool),
+    so the workers are not forked from the server, where they could wait
+    forever on a lock held by another thread. They are forked from a fork
+    server instead, which only imports this module, or spawned.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context: multiprocessing.context.BaseContext = multiprocessing.get_context(
+            "forkserver"
+        )
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _sort_range(file_path: str, start: int, end: int) -> Run:
+    """
+    Sort stage, run in a worker: sort and deduplicate the lines of a range.
+
+    Args:
+        file_path: Path to the data file
+        start: Offset of the first line of the range
+        end: Offset just past the range
+
+    Returns:
+        Run: The block holding the sorted unique lines and their offsets,
+        and the number of lines.
+    """
+    with open(file_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            chunk: bytes = data[start:end]
+    lines: List[bytes] = chunk.split(b"\n")
+    # Offset of each line, and of the end of the range last
+    starts: List[int] = list(
+        accumulate(map((1).__add__, map(len, lines)), initial=start)
+    )
+    starts.pop()
+    if b"\r" in chunk:
+        # Same keys as `_line_at`: without the line ending
+        lines = [strip_line_end(line) for line in lines]
+    del chunk
+    # Later items win: the first offset of each line is kept, as in a serial build
+    offsets: Dict[bytes, int] = dict(zip(reversed(lines), reversed(starts)))
+    del lines, starts
+    offsets.pop(b"", None)
+    keys: List[bytes] = sorted(offsets)
+    return _share_run(keys, array("Q", list(map(offsets.__getitem__, keys))))
+
+
+def _share_run(keys: List[bytes], starts: array) -> Run:
+    """
+    Publish sorted lines and their offsets as a run.
+
+    Layout: the offsets, the position of each line in the text followed by
+    the text length, then the text, each line ended by a newline.
+    """
+    bounds: array = array("Q", accumulate(map((1).__add__, map(len, keys)), initial=0))
+    text: bytes = b"\n".join(keys) + b"\n" if keys else b""
+    return _share(starts, bounds, text), len(keys)
+
+
+def _run_key(view: memoryview, count: int, i: int) -> bytes:
+    """Return line `i` of a run."""
+    bounds: memoryview = view[8 * count : 8 * (2 * count + 1)].cast("Q")
+    text: int = 8 * (2 * count + 1)
+    return bytes(view[text + bounds[i] : text + bounds[i + 1] - 1])
+
+
+def _cut_runs(runs: List[Run], workers: int) -> List[List[int]]:
+    """
+    Cut the runs into key ranges of about equal size, one per worker.
+
+    Splitter keys are sampled from every run; each run is then cut at the
+    splitters by binary search.
+
+    Returns:
+        List[List[int]]: For each run, the index of the first line of each
+        key range, followed by the line count.
+    """
+    samples: List[bytes] = []
+    for block, count in runs:
+        step: int = max(1, count // (SAMPLES_PER_WORKER * workers))
+        with _attach(block) as view:
+            samples.extend(_run_key(view, count, i) for i in range(0, count, step))
+    samples.sort()
+    splitters: List[bytes] = sorted(
+        {samples[len(samples) * part // workers] for part in range(1, workers)}
+        if samples
+        else set()
+    )
+    cuts: List[List[int]] = []
+    for block, count in runs:
+        with _attach(block) as view:
+            key_of = functools.partial(_run_key, view, count)
+            cuts.append(
+                [0]
+                + [
+                    bisect.bisect_left(range(count), splitter, key=key_of)
+                    for splitter in splitters
+                ]
+                + [count]
+            )
+            del key_of
+    return cuts
+
+
+def _merge_range(
+    slices: List[Tuple[SharedBlock, int, int, int]], text: bool = False
+) -> SharedBlock:
+    """
+    Merge stage, run in a worker: merge the runs over one key range.
+
+    Args:
+        slices: The block and line count of each run, with the first and
+            last (excluded) line of the key range in it
+        text: Whether to return the lines joined by newlines instead of
+            their offsets
+
+    Returns:
+        SharedBlock: The block holding the merged unique lines of the range.
+    """
+    offsets: Dict[bytes, int] = {}
+    # Runs are in file order: the earliest offset of a line is written last
+    for block, count, first, last in reversed(slices):
+        with _attach(block) as view:
+            lines, starts = _run_slice(view, count, first, last)
+        offsets.update(zip(lines, starts))
+    # The runs are each sorted, which Timsort merges in linear time per run
+    keys: List[bytes] = sorted(offsets)
+    if text:
+        return _share(b"\n".join(keys))
+    return _share(array("Q", list(map(offsets.__getitem__, keys))))
+
+
+def _run_slice(
+    view: memoryview, count: int, first: int, last: int
+) -> Tuple[List[bytes], array]:
+    """Copy lines `first` to `last` (excluded) of a run and their offsets."""
+    starts: array = array("Q")
+    starts.frombytes(view[8 * first : 8 * last])
+    bounds: memoryview = view[8 * count : 8 * (2 * count + 1)].cast("Q")
+    text: int = 8 * (2 * count + 1)
+    lines: List[bytes] = bytes(
+        view[text + bounds[first] : text + bounds[last]]
+    ).split(b"\n")
+    lines.pop()  # after the last newline
+    return lines, starts
+
+
+def _share(*parts) -> SharedBlock:
+    """Copy bytes-like results, concatenated, into a new shared memory block."""
+    views: List[memoryview] = [memoryview(part).cast("B") for part in parts]
+    size: int = sum(len(view) for view in views)
+    # Blocks cannot be empty
+    block: SharedMemory = SharedMemory(create=True, size=max(1, size))
+    try:
+        position: int = 0
+        for view in views:
+            block.buf[position : position + len(view)] = view
+            position += len(view)
+        return block.name, size
+    finally:
+        block.close()
+
+
+@contextlib.contextmanager
+def _attach(block: SharedBlock) -> Iterator[memoryview]:
+    """Map a shared memory block."""
+    name, size = block
+    shared: SharedMemory = SharedMemory(name)
+    view: memoryview = shared.buf[:size]
+    try:
+        yield view
+    finally:
+        view.release()
+        shared.close()
+
+
+def _unlink(name: str) -> None:
+    """Remove a shared memory block, if it still exists."""
+    try:
+        block: SharedMemory = SharedMemory(name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
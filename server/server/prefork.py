@@ -0,0 +1,395 @@
+import asyncio
+import gc
+import mmap
+import os
+import signal
+import socket
+import threading
+import time
+import logging
+from array import array
+from typing import Any, Dict, List, Optional
+
+from .async_logging import stop_logging
+from .async_server import AsyncStringSearchServer, serve
+from .metrics import EXPORT_SIZE, METRICS, MetricsRegistry, merge_exports
+from .server import (
+    DRAIN_TIMEOUT,
+    ENGINE,
+    REREAD_QUERY,
+    SSL_ENABLED,
+    WATCH_INTERVAL,
+    WATCHER,
+    StringSearchServer,
+    server_context,
+    start_server,
+)
+
+logger = logging.getLogger(__name__)
+
+"""
+Pre-fork server mode: N worker processes accept on the same port through
+SO_REUSEPORT, so queries are served on all cores instead of one GIL.
+
+The index is loaded once in the parent, before forking, so the workers
+share its pages (fully for the mapped backends, copy-on-write for the
+in-memory one); the workers only bind the port once it is loaded. The
+TLS context is created before forking too, so a session ticket issued by
+one worker is resumed by any other. The parent supervises the workers, restarts the
+ones that die, and merges their metrics from shared memory.
+
+The workers do not watch the data file: a rebuild in each of them would
+hold one private copy of the index per worker. The parent rebuilds it
+instead, when the file changes or a worker receives RELOAD (forwarded as
+SIGHUP), and replaces the workers one at a time with processes forked
+from the new generation. A worker is only stopped once its replacement
+listens, and it stops on SIGTERM by accepting the connections queued on
+its socket, closing it, and draining its connections before it exits.
+"""
+
+# Seconds between stats updates from the workers
+STATS_INTERVAL: float = 1.0
+# Workers dying sooner than this after starting are restarted with a delay
+RESTART_DELAY: float = 1.0
+# Seconds a replacement worker may take to listen before the reload gives up
+READY_TIMEOUT: float = 30.0
+
+
+class WorkerStats:
+    """
+    Per-worker metrics slots in anonymous shared memory.
+
+    The mapping is created before forking, so every worker writes the
+    export of its metrics registry into its own slot and any process reads
+    all of them without IPC. Each slot starts with the pid of its worker,
+    0 while the slot is unused.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers: int = workers
+        self.slot_size: int = 8 * (1 + EXPORT_SIZE)
+        self._data: mmap.mmap = mmap.mmap(-1, self.slot_size * workers)
+
+    def publish(self, slot: int, metrics: MetricsRegistry) -> None:
+        """Write a worker's metrics into its slot."""
+        values: array = array("q", [os.getpid()])
+        values.extend(metrics.export())
+        offset: int = slot * self.slot_size
+        self._data[offset : offset + self.slot_size] = values.tobytes()
+
+    def clear(self, slot: int) -> None:
+        """Reset the slot of a worker that exited."""
+        offset: int = slot * self.slot_size
+        self._data[offset : offset + self.slot_size] = bytes(self.slot_size)
+
+    def read(self, slot: int) -> array:
+        """Read the pid and metrics export of one worker."""
+        offset: int = slot * self.slot_size
+        return array("q", self._data[offset : offset + self.slot_size])
+
+    def aggregate(self) -> Dict[str, Any]:
+        """
+        Merge the metrics of all running workers into one view.
+
+        Returns:
+            The merged metrics as from `metrics.merge_exports`, with the pids
+            of the workers under "workers".
+        """
+        slots: List[array] = [self.read(slot) for slot in range(self.workers)]
+        slots = [values for values in slots if values[0]]
+        aggregated: Dict[str, Any] = merge_exports(values[1:] for values in slots)
+        aggregated["workers"] = [values[0] for values in slots]
+        return aggregated
+
+
+class PreforkWorkerServer(StringSearchServer):
+    """Handler of a worker process; the supervisor loads the data."""
+
+    def start_loading(self) -> None:
+        """The data was loaded before forking; the supervisor reloads it."""
+
+    def reload_report(self) -> str:
+        """Ask the supervisor to rebuild the data and replace the workers."""
+        if str(REREAD_QUERY) == "True":
+            return super().reload_report()
+        os.kill(os.getppid(), signal.SIGHUP)
+        return "RELOAD SCHEDULED"
+
+
+class PreforkSupervisor:
+    """Start, supervise and restart the pre-forked worker processes."""
+
+    def __init__(self, host: str, port: int, debug: bool, processes: int) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.debug: bool = debug
+        self.processes: int = processes
+        # One spare slot for the replacement started before a worker retires
+        self.stats: WorkerStats = WorkerStats(processes + 1)
+        self.restarts: int = 0
+        self._children: Dict[int, int] = {}  # pid -> slot
+        self._started: Dict[int, float] = {}  # slot -> start time
+        self._stopping: bool = False
+        self._reload_requested: bool = False
+
+    def run(self) -> None:
+        """Fork the workers and supervise them until SIGINT or SIGTERM."""
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise OSError("SO_REUSEPORT is not supported on this platform")
+        # Load the data and create the TLS context to share them
+        WATCHER.wait_ready(None)
+        if SSL_ENABLED:
+            server_context()
+        # Keep the garbage collector from touching (and so copying) the
+        # pages of the objects loaded before forking
+        gc.freeze()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+        for slot in range(self.processes):
+            self._spawn(slot)
+        logger.info(
+            f"Pre-fork server listening on {self.host}:{self.port} "
+            f"with {self.processes} {ENGINE} workers"
+        )
+
+        last_report: float = time.monotonic()
+        last_poll: float = time.monotonic()
+        while not self._stopping:
+            self._reap()
+            if self._reload_requested:
+                self._reload_requested = False
+                if WATCHER.reload():
+                    self._replace_workers()
+            elif (
+                str(REREAD_QUERY) != "True"
+                and WATCH_INTERVAL > 0
+                and time.monotonic() - last_poll >= WATCH_INTERVAL
+            ):
+                last_poll = time.monotonic()
+                if WATCHER.poll():
+                    self._replace_workers()
+            if self.debug and time.monotonic() - last_report >= STATS_INTERVAL * 10:
+                last_report = time.monotonic()
+                aggregated: Dict[str, Any] = self.stats.aggregate()
+                lookup: Dict[str, Any] = aggregated["latency_us"]["lookup"]
+                logger.debug(
+                    f"Worker stats: {aggregated['counters']}, lookup p99 "
+                    f"{lookup['p99']}us, restarts: {self.restarts}"
+                )
+            time.sleep(STATS_INTERVAL / 2)
+        self._shutdown()
+
+    def _spawn(self, slot: int) -> int:
+        """Fork a worker process for the given stats slot; return its pid."""
+        pid: int = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            code: int = 0
+            try:
+                self._worker_main(slot)
+            except Exception as e:
+                logger.error(f"Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                # os._exit skips atexit, so write the queued log records now
+                stop_logging()
+                os._exit(code)
+        self._children[pid] = slot
+        self._started[slot] = time.monotonic()
+        logger.debug(f"Started worker {pid} in slot {slot}")
+        return pid
+
+    def _reap(self) -> None:
+        """Restart the workers that exited."""
+        while self._children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            slot: Optional[int] = self._children.pop(pid, None)
+            if slot is None:
+                continue
+            self.stats.clear(slot)
+            if self._stopping:
+                continue
+            exit_code: int = os.waitstatus_to_exitcode(status)
+            logger.error(f"Worker {pid} exited with status {exit_code}, restarting")
+            if time.monotonic() - self._started[slot] < RESTART_DELAY:
+                # Avoid a fork loop when workers die right after starting
+                time.sleep(RESTART_DELAY)
+            self.restarts += 1
+            self._spawn(slot)
+
+    def _replace_workers(self) -> None:
+        """
+        Replace every worker with one forked from the current generation.
+
+        Each replacement listens before the worker it replaces is stopped,
+        so the port is always served.
+        """
+        gc.freeze()
+        for pid in list(self._children):
+            if self._stopping:
+                return
+            free: int = min(
+                set(range(self.stats.workers)) - set(self._children.values())
+            )
+            replacement: int = self._spawn(free)
+            if not self._wait_listening(replacement, free):
+                logger.error(
+                    f"Worker {replacement} did not start listening, "
+                    "keeping the previous workers"
+                )
+                self._retire(replacement, signal.SIGKILL)
+                return
+            self._retire(pid)
+        logger.info(
+            f"Workers replaced with generation {WATCHER.generation}: "
+            f"{sorted(self._children)}"
+        )
+
+    def _wait_listening(self, pid: int, slot: int) -> bool:
+        """Wait until a new worker publishes its stats, once it listens."""
+        deadline: float = time.monotonic() + READY_TIMEOUT
+        while self.stats.read(slot)[0] != pid:
+            if time.monotonic() >= deadline or os.waitpid(pid, os.WNOHANG)[0]:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _retire(self, pid: int, signum: int = signal.SIGTERM) -> None:
+        """Stop a worker and wait for it; SIGTERM lets it drain its connections."""
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+        self._wait_exit(pid)
+
+    def _wait_exit(self, pid: int) -> None:
+        """
+        Wait for a stopped worker and free its slot.
+
+        A worker still running once its drain should have ended is killed.
+        """
+        slot: int = self._children.pop(pid)
+        try:
+            deadline: float = time.monotonic() + (
+                DRAIN_TIMEOUT + STATS_INTERVAL if DRAIN_TIMEOUT else float("inf")
+            )
+            while not os.waitpid(pid, os.WNOHANG)[0]:
+                if time.monotonic() >= deadline:
+                    logger.error(f"Worker {pid} did not drain in time, killing it")
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    break
+                time.sleep(0.01)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+        self.stats.clear(slot)
+
+    def _request_reload(self, signum: int, frame: Any) -> None:
+        """Signal handler asking the supervisor loop to rebuild the data."""
+        self._reload_requested = True
+
+    def _stop(self, signum: int, frame: Any) -> None:
+        """Signal handler asking the supervisor loop to stop."""
+        self._stopping = True
+
+    def _shutdown(self) -> None:
+        """Stop the workers, letting them drain their connections."""
+        logger.info("Stopping workers")
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self._children):
+            self._wait_exit(pid)
+
+    def _worker_main(self, slot: int) -> None:
+        """
+        Run the configured engine on a shared port inside a worker.
+
+        The worker publishes its stats once it listens, which tells the
+        supervisor it can stop the worker it replaces, and drains its
+        connections on SIGTERM.
+        """
+        search_server: StringSearchServer = PreforkWorkerServer()
+        # STATS reports the metrics of all workers, with this one up to date
+        search_server.stats_source = lambda: self._aggregate(slot)
+
+        def on_listening() -> None:
+            threading.Thread(
+                target=self._publish_stats,
+                args=(slot,),
+                name="stats-publisher",
+                daemon=True,
+            ).start()
+
+        if ENGINE == "asyncio":
+            asyncio.run(self._serve_async(search_server, on_listening))
+        else:
+            stop: threading.Event = threading.Event()
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+            start_server(
+                self.host,
+                self.port,
+                self.debug,
+                reuse_port=True,
+                client_operation=search_server,
+                on_listening=on_listening,
+                stop=stop,
+            )
+        logger.debug(f"Worker {os.getpid()} drained")
+
+    async def _serve_async(
+        self, search_server: StringSearchServer, on_listening: Any
+    ) -> None:
+        """Run the asyncio engine until SIGTERM, then drain it."""
+        stop: asyncio.Event = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await serve(
+            self.host,
+            self.port,
+            self.debug,
+            server_context() if SSL_ENABLED else None,
+            reuse_port=True,
+            search_server=AsyncStringSearchServer(search_server=search_server),
+            on_listening=on_listening,
+            stop=stop,
+        )
+
+    def _aggregate(self, slot: int) -> Dict[str, Any]:
+        """Publish this worker's metrics and merge those of all workers."""
+        self.stats.publish(slot, METRICS)
+        return self.stats.aggregate()
+
+    def _publish_stats(self, slot: int) -> None:
+        """Copy the worker metrics to shared memory; exit if orphaned."""
+        parent: int = os.getppid()
+        while True:
+            self.stats.publish(slot, METRICS)
+            if os.getppid() != parent:
+                logger.error("Supervisor exited, stopping worker")
+                stop_logging()
+                os._exit(1)
+            time.sleep(STATS_INTERVAL)
+
+
+def start_prefork_server(host: str, port: int, debug: bool, processes: int) -> None:
+    """
+    Start the pre-fork server and supervise its workers.
+
+    Args:
+        host: The host address to bind to
+        port: The port number to listen on
+        debug: Whether to print debug information
+        processes: The number of worker processes
+    """
+    try:
+        PreforkSupervisor(host, port, debug, processes).run()
+    except Exception as e:
+        logger.error(f"Server error: {e}")
+        raise
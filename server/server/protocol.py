@@ -0,0 +1,277 @@
+import logging
+from typing import Callable, List, Optional, Union
+
+from .exceptions import DataWarmingError, InvalidPayloadError
+from .framing import FrameBuffer
+
+logger = logging.getLogger(__name__)
+
+"""
+Transport-independent connection protocol shared by the server engines.
+
+A connection whose first message contains a newline is persistent: every
+newline-delimited query is answered in order with a newline-terminated
+response until the client closes or the idle timeout fires. A first
+message without a newline is a single-shot query, answered without a
+newline before the connection is closed, as older clients expect.
+
+On a persistent connection, `BATCH <n> [TEXT|BITS]` followed by n query
+lines checks all of them at once. The answer starts with the echoed
+header line and is followed by either n response lines (TEXT, default)
+or ceil(n / 8) raw bytes with one bit per query, least significant bit
+first (BITS). Answers are streamed as the query lines arrive.
+
+`STATS`, as a single-shot or persistent query, is answered with the
+server metrics as one line of JSON. `RELOAD` rebuilds the index from the
+data file and answers once the new generation is published. `HEALTH` is
+answered `OK` as long as the process serves connections, and `READY`
+tells whether the data is loaded, so probes work during the warm-up.
+"""
+
+# Frames are decoded straight from the receive buffer where possible
+Frame = Union[bytes, memoryview]
+
+BATCH_COMMAND: bytes = b"BATCH"
+BATCH_MODES = ("TEXT", "BITS")
+STATS_COMMAND: str = "STATS"
+RELOAD_COMMAND: str = "RELOAD"
+HEALTH_COMMAND: str = "HEALTH"
+READY_COMMAND: str = "READY"
+
+
+class _Batch:
+    """State of a batch request being received."""
+
+    __slots__ = ("mode", "remaining", "payload_size", "pending", "bits", "bit_count")
+
+    def __init__(self, mode: str, size: int) -> None:
+        self.mode: str = mode
+        self.remaining: int = size
+        self.payload_size: int = 0
+        self.pending: List[str] = []
+        # Answers not yet sent in BITS mode, packed LSB first
+        self.bits: int = 0
+        self.bit_count: int = 0
+
+
+class ClientSession:
+    """
+    Protocol state of one client connection.
+
+    The engines either receive into `buffer.writable()` and call `process`,
+    or pass received bytes to `feed`. They send back whatever is returned
+    and stop reading once `closed` is set.
+    """
+
+    def __init__(
+        self,
+        process_request: Callable[[str], str],
+        max_payload_size: int,
+        process_batch: Optional[Callable[[List[str]], List[bool]]] = None,
+        max_batch_size: int = 0,
+        max_batch_payload_size: int = 0,
+        stats: Optional[Callable[[], str]] = None,
+        reload: Optional[Callable[[], str]] = None,
+        ready: Optional[Callable[[], str]] = None,
+    ) -> None:
+        self.process_request: Callable[[str], str] = process_request
+        self.process_batch: Optional[Callable[[List[str]], List[bool]]] = (
+            process_batch
+        )
+        self.max_payload_size: int = max_payload_size
+        self.max_batch_size: int = max_batch_size
+        self.max_batch_payload_size: int = max_batch_payload_size
+        self.stats: Optional[Callable[[], str]] = stats
+        self.reload: Optional[Callable[[], str]] = reload
+        self.ready: Optional[Callable[[], str]] = ready
+        self.keep_alive: bool = False
+        self.closed: bool = False
+        self.queries: int = 0
+        self.started: bool = False
+        self.buffer: FrameBuffer = FrameBuffer(max_payload_size)
+        self._batch: Optional[_Batch] = None
+
+    def feed(self, data: bytes) -> bytes:
+        """
+        Consume received bytes.
+
+        Args:
+            data: The bytes received from the client, empty on end of stream
+
+        Returns:
+            The bytes to send back to the client, possibly empty.
+        """
+        self.buffer.write(data)
+        return self.process(eof=not data)
+
+    def process(self, eof: bool = False) -> bytes:
+        """
+        Answer the frames received into the buffer so far.
+
+        Args:
+            eof: Whether the client closed its side of the connection
+
+        Returns:
+            The bytes to send back to the client, possibly empty.
+        """
+        if not self.started:
+            self.started = True
+            if not self.buffer.has_frame():
+                # Single-shot client: the whole message is the query
+                self.closed = True
+                if len(self.buffer) > self.max_payload_size:
+                    logger.error("Query exceeds the maximum payload size")
+                    return b"ERROR: Payload too large"
+                return self._respond(self.buffer.take_remaining()).encode()
+            self.keep_alive = True
+
+        output: List[bytes] = []
+        try:
+            for frame in self.buffer.frames():
+                self._handle_line(frame, output)
+                if self.closed:
+                    break
+        except InvalidPayloadError as e:
+            logger.error("Query exceeds the maximum payload size")
+            self._fail(f"ERROR: {str(e)}", output)
+        if eof and not self.closed:
+            # End of stream: answer a last query sent without a newline
+            rest: bytes = self.buffer.take_remaining()
+            if rest.strip():
+                self._handle_line(rest, output)
+            self.closed = True
+        if self._batch is not None:
+            self._flush_batch(output)
+        return b"".join(output)
+
+    def _handle_line(self, line: Frame, output: List[bytes]) -> None:
+        """Route one line to the running batch, a new batch or a query."""
+        if self._batch is not None:
+            self._add_to_batch(line, output)
+        elif (
+            line[: len(BATCH_COMMAND)] == BATCH_COMMAND
+            and self.process_batch is not None
+        ):
+            self._start_batch(line, output)
+        else:
+            output.append(self._respond(line).encode() + b"\n")
+
+    def _start_batch(self, line: Frame, output: List[bytes]) -> None:
+        """Parse a `BATCH <n> [TEXT|BITS]` header and echo it back."""
+        parts: List[str] = str(line, "utf-8", "replace").split()
+        mode: str = parts[2].upper() if len(parts) > 2 else BATCH_MODES[0]
+        if parts[0] != BATCH_COMMAND.decode():
+            # A query that merely starts with the command name
+            output.append(self._respond(line).encode() + b"\n")
+            return
+        if len(parts) > 3 or not parts[1:2] or not parts[1].isdigit():
+            self._fail("ERROR: Invalid batch header", output)
+            return
+        if mode not in BATCH_MODES:
+            self._fail(f"ERROR: Unknown batch mode {mode}", output)
+            return
+        size: int = int(parts[1])
+        if self.max_batch_size and size > self.max_batch_size:
+            self._fail("ERROR: Batch too large", output)
+            return
+        output.append(f"BATCH {size} {mode}\n".encode())
+        if size:
+            self._batch = _Batch(mode, size)
+
+    def _add_to_batch(self, line: Frame, output: List[bytes]) -> None:
+        """Collect one query line of the running batch."""
+        batch: _Batch = self._batch
+        batch.payload_size += len(line)
+        if self.max_batch_payload_size and (
+            batch.payload_size > self.max_batch_payload_size
+        ):
+            self._flush_batch(output)
+            self._fail("ERROR: Batch payload too large", output)
+            return
+        try:
+            batch.pending.append(str(line, "utf-8").strip())
+        except UnicodeDecodeError:
+            # Cannot match any stored string, but keeps the answer count
+            batch.pending.append("")
+        batch.remaining -= 1
+        if not batch.remaining:
+            self._flush_batch(output)
+
+    def _flush_batch(self, output: List[bytes]) -> None:
+        """Check the collected batch queries in one pass and emit answers."""
+        batch: _Batch = self._batch
+        if batch.pending:
+            self.queries += len(batch.pending)
+            try:
+                found: List[bool] = self.process_batch(batch.pending)
+            except DataWarmingError:
+                self._fail("SERVER WARMING", output)
+                return
+            except Exception as e:
+                logger.error("Error searching batch: %s", e)
+                self._fail("SERVER ERROR", output)
+                return
+            batch.pending = []
+            if batch.mode == "BITS":
+                for bit in found:
+                    batch.bits |= bit << batch.bit_count
+                    batch.bit_count += 1
+                whole: int = batch.bit_count // 8
+                if whole:
+                    output.append(batch.bits.to_bytes(whole + 1, "little")[:whole])
+                    batch.bits >>= whole * 8
+                    batch.bit_count -= whole * 8
+            else:
+                output.append(
+                    b"".join(
+                        b"STRING EXISTS\n" if hit else b"STRING NOT EXIST\n"
+                        for hit in found
+                    )
+                )
+        if not batch.remaining or self.closed:
+            if batch.bit_count:
+                output.append(bytes([batch.bits]))
+            self._batch = None
+
+    def _fail(self, message: str, output: List[bytes]) -> None:
+        """Send an error line and close, as the stream can no longer be framed."""
+        output.append(message.encode() + b"\n")
+        self._batch = None
+        self.closed = True
+
+    def _respond(self, data: Frame) -> str:
+        """Decode a query and build its response."""
+        self.queries += 1
+        try:
+            request: str = self._decode(data)
+        except InvalidPayloadError as e:
+            logger.error("Invalid payload: %s", e)
+            return f"ERROR: {str(e)}"
+        if request == STATS_COMMAND and self.stats is not None:
+            return self.stats()
+        if request == RELOAD_COMMAND and self.reload is not None:
+            return self.reload()
+        if request == HEALTH_COMMAND:
+            return "OK"
+        if request == READY_COMMAND and self.ready is not None:
+            return self.ready()
+        return self.process_request(request)
+
+    def _decode(self, data: Frame) -> str:
+        """
+        Decode and validate a query.
+
+        Args:
+            data: The raw query bytes
+
+        Returns:
+            The decoded and stripped query
+        """
+        try:
+            request: str = str(data, "utf-8").strip().rstrip("\x00")
+        except UnicodeDecodeError as e:
+            logger.error("Error decoding data: %s", e)
+            raise InvalidPayloadError from e
+        if not request:
+            raise InvalidPayloadError("Empty payload received")
+        return request
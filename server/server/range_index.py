@@ -0,0 +1,129 @@
+import bisect
+import threading
+import logging
+from timeit import default_timer as timer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+"""
+Range queries over the semicolon-delimited records.
+
+`PREFIX <p>` counts the records starting with p: the records are already
+sorted for the exact-match engines, so the matches form one contiguous
+range whose bounds are found by two binary searches, without scanning.
+
+`FIELD <i>=<v>` counts the records whose i-th field (from 1) equals v,
+from per-field secondary indexes mapping each value to its number of
+records. They are built in one pass over the records on the first FIELD
+query of a data generation.
+
+Counts are of distinct records, as the indexes are deduplicated.
+"""
+
+PREFIX_COMMAND: str = "PREFIX"
+FIELD_COMMAND: str = "FIELD"
+FIELD_SEPARATOR: str = ";"
+
+# (command, argument): ("PREFIX", prefix) or ("FIELD", "<i>=<v>")
+RangeQuery = Tuple[str, str]
+
+
+def parse_range_query(request: str) -> Optional[RangeQuery]:
+    """
+    Recognize a PREFIX or FIELD query.
+
+    Args:
+        request: The decoded and stripped query string
+
+    Returns:
+        Optional[RangeQuery]: The command and its argument, or None for an
+        exact-match query.
+    """
+    command, _, argument = request.partition(" ")
+    if command in (PREFIX_COMMAND, FIELD_COMMAND) and argument:
+        return command, argument.strip()
+    return None
+
+
+def record_fields(line: str) -> List[str]:
+    """Split a record into its fields, ignoring the trailing separator."""
+    fields: List[str] = line.split(FIELD_SEPARATOR)
+    if fields and not fields[-1]:
+        fields.pop()
+    return fields
+
+
+class RangeIndex:
+    """
+    Prefix and field lookups over the sorted records of one generation.
+
+    Args:
+        sorted_lines: The deduplicated records in sorted order, as exposed by
+            every search engine
+    """
+
+    def __init__(self, sorted_lines: Sequence[str]) -> None:
+        self.sorted_lines: Sequence[str] = sorted_lines
+        self._fields: Optional[List[Dict[str, int]]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def fields_built(self) -> bool:
+        """Whether the field indexes are built, so FIELD queries do not wait."""
+        return self._fields is not None
+
+    def count_prefix(self, prefix: str) -> int:
+        """
+        Count the records starting with the given prefix.
+
+        Args:
+            prefix: The non-empty prefix
+
+        Returns:
+            int: The number of matching records.
+        """
+        lines: Sequence[str] = self.sorted_lines
+        low: int = bisect.bisect_left(lines, prefix)
+        # Smallest string above every string starting with the prefix
+        end: str = prefix.rstrip(chr(0x10FFFF))
+        if not end:
+            return len(lines) - low
+        end = end[:-1] + chr(ord(end[-1]) + 1)
+        return bisect.bisect_left(lines, end, low) - low
+
+    def count_field(self, field: int, value: str) -> int:
+        """
+        Count the records whose field at the given position equals a value.
+
+        Args:
+            field: Position of the field, from 1
+            value: The exact field value
+
+        Returns:
+            int: The number of matching records.
+        """
+        fields: List[Dict[str, int]] = self._fields or self._build_fields()
+        if not 1 <= field <= len(fields):
+            return 0
+        return fields[field - 1].get(value, 0)
+
+    def _build_fields(self) -> List[Dict[str, int]]:
+        """Build the secondary index of every field in one pass."""
+        with self._lock:
+            if self._fields is not None:
+                return self._fields
+            start: float = timer()
+            fields: List[Dict[str, int]] = []
+            for line in self.sorted_lines:
+                values: List[str] = record_fields(line)
+                while len(fields) < len(values):
+                    fields.append({})
+                for column, value in zip(fields, values):
+                    column[value] = column.get(value, 0) + 1
+            self._fields = fields
+            logger.info(
+                f"Built field indexes of {len(self.sorted_lines)} records "
+                f"({len(fields)} fields) in {(timer() - start) * 1000:.2f}ms"
+            )
+            return fields
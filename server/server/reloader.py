@@ -0,0 +1,371 @@
+import hashlib
+import os
+import threading
+import logging
+from timeit import default_timer as timer
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .index import DeltaIndex, StringIndex
+from .exceptions import FileAccessError
+from .utils import split_lines
+
+logger = logging.getLogger(__name__)
+
+"""
+Change-detecting reload layers for the data file.
+
+`FileReloader` serves the REREAD_ON_QUERY mode. The file is expected to be
+appended to by an upstream job, so a cheap `os.stat` on each query decides
+whether anything has to be read at all:
+- unchanged signature: the published index is returned as is
+- same inode, grown, and the last bytes read before unchanged: only the
+  appended bytes are read and added on top of the previous index
+- truncated, rewritten or replaced: the index is rebuilt from scratch
+
+`EngineWatcher` serves the default mode, where the search engine is built
+once: the first build runs in the background after the port is bound
+(`warm_up`), then a background thread polls the file and rebuilds the
+engine when it changes, off the request path. Both publish the new index by swapping one
+reference (read-copy-update): a lookup holds the reference it started
+with, so in-flight lookups finish on the previous generation, which is
+freed once the last of them is done.
+"""
+
+# (st_dev, st_ino, st_size, st_mtime_ns)
+FileSignature = Tuple[int, int, int, int]
+
+# Seconds between the progress logs of a first build still running
+WARMUP_LOG_INTERVAL: float = 5.0
+# Bytes before the read offset re-read and compared on an append, to tell
+# a file rewritten in place from one appended to
+TAIL_CHECK_BYTES: int = 4096
+
+# Index of the reread mode: a full build, or one with lines appended
+ReloadedIndex = Union[StringIndex, DeltaIndex]
+
+
+def file_signature(file_path: str) -> Optional[FileSignature]:
+    """Return the identity, size and modification time of a file, if any."""
+    try:
+        stat: os.stat_result = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class FileReloader:
+    """
+    Keep a `StringIndex` in sync with a file that is appended to upstream.
+
+    Readers only `stat` the file and read the published index reference.
+    A single thread at a time performs the reload and swaps the new index
+    in atomically; other readers keep using the previous index meanwhile.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path: str = file_path
+        self.index: Optional[ReloadedIndex] = None
+        self.generation: int = 0
+        self.last_reload_ms: float = 0.0
+        self._base: Optional[ReloadedIndex] = None
+        self._signature: Optional[FileSignature] = None
+        self._offset: int = 0
+        # Checksum of the TAIL_CHECK_BYTES read just before _offset
+        self._tail_checksum: bytes = b""
+        self._reload_lock = threading.Lock()
+
+    def current(self) -> ReloadedIndex:
+        """
+        Return the index for the current file contents, reloading if needed.
+
+        Returns:
+            ReloadedIndex: The published index.
+
+        Raises:
+            FileAccessError: If the file cannot be read and no index exists.
+        """
+        index: Optional[ReloadedIndex] = self.index
+        try:
+            stat: os.stat_result = os.stat(self.file_path)
+        except OSError as e:
+            if index is None:
+                raise FileAccessError(f"Failed to load file: {e}")
+            logger.error(f"Error checking file '{self.file_path}': {e}")
+            return index
+
+        signature: FileSignature = (
+            stat.st_dev,
+            stat.st_ino,
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+        if index is not None and signature == self._signature:
+            return index
+
+        # Only the first load makes readers wait; afterwards a reload in
+        # progress is skipped and the previous index keeps serving.
+        if not self._reload_lock.acquire(blocking=index is None):
+            return index
+        try:
+            if self.index is None or signature != self._signature:
+                self._reload(signature)
+        finally:
+            self._reload_lock.release()
+        return self.index
+
+    def _reload(self, signature: FileSignature) -> None:
+        """Read the changed part of the file and publish a new index."""
+        start: float = timer()
+        previous: Optional[FileSignature] = self._signature
+        appended: bool = (
+            self._base is not None
+            and previous is not None
+            and previous[:2] == signature[:2]
+            and signature[2] >= self._offset
+            and signature[2] > previous[2]
+        )
+        try:
+            read: Optional[Tuple[List[str], str]] = (
+                self._read_from(self._offset) if appended else None
+            )
+            if read is not None:
+                lines, tail = read
+                self._base = self._base.extend(lines)
+            else:
+                # Not grown, or rewritten in place rather than appended to
+                appended = False
+                lines, tail = self._read_from(0)
+                self._base = StringIndex(lines)
+        except (OSError, UnicodeDecodeError) as e:
+            if self.index is None:
+                raise FileAccessError(f"Failed to load file: {e}")
+            logger.error(f"Error reloading file '{self.file_path}': {e}")
+            return
+
+        # A trailing line without newline may still be written to, so it is
+        # served but re-read on the next reload instead of being merged.
+        self.index = self._base.extend([tail]) if tail else self._base
+        self._signature = signature
+        self.generation += 1
+        self.last_reload_ms = (timer() - start) * 1000
+        logger.debug(
+            f"{'Incremental' if appended else 'Full'} reload of "
+            f"{self.file_path} (generation {self.generation}) "
+            f"in {self.last_reload_ms:.2f}ms"
+        )
+
+    def _read_from(self, offset: int) -> Optional[Tuple[List[str], str]]:
+        """
+        Read the file from the given byte offset.
+
+        Past the start of the file, the TAIL_CHECK_BYTES before the offset
+        are read too and must match the checksum taken when they were first
+        read; otherwise the file was rewritten, not appended to.
+
+        Args:
+            offset (int): Byte offset just after the last complete line.
+
+        Returns:
+            Optional[Tuple[List[str], str]]: The complete non-empty lines
+            read and the trailing partial line (empty if the file ends with
+            a newline), or None if the bytes before the offset changed.
+        """
+        start: int = max(0, offset - TAIL_CHECK_BYTES)
+        with open(self.file_path, "rb") as f:
+            f.seek(start)
+            data: bytes = f.read()
+        if offset and _checksum(data[: offset - start]) != self._tail_checksum:
+            return None
+        cut: int = data.rfind(b"\n", offset - start) + 1 or offset - start
+        lines: List[str] = split_lines(data[offset - start : cut].decode("utf-8"))
+        tail: str = "".join(split_lines(data[cut:].decode("utf-8")))
+        self._offset = start + cut
+        self._tail_checksum = _checksum(data[max(0, cut - TAIL_CHECK_BYTES) : cut])
+        return lines, tail
+
+
+def _checksum(data: bytes) -> bytes:
+    """Checksum of the bytes compared to detect a file rewritten in place."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class EngineWatcher:
+    """
+    Rebuild the search engine when its data file changes.
+
+    `engine` is the published engine; readers take the reference once per
+    lookup. Reloads are serialized, and a failed build keeps the previous
+    engine serving.
+
+    Args:
+        file_path: Path to the data file
+        build: Builds a new engine from the file, returning None on failure
+    """
+
+    def __init__(self, file_path: str, build: Callable[[], Optional[Any]]) -> None:
+        self.file_path: str = file_path
+        self.build: Callable[[], Optional[Any]] = build
+        self.engine: Optional[Any] = None
+        self.generation: int = 0
+        self.last_reload_ms: float = 0.0
+        self.last_error: str = ""
+        self._signature: Optional[FileSignature] = None
+        # Signature seen by the previous poll, to wait until writes settle
+        self._polled: Optional[FileSignature] = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Set once the first build finished, whether it succeeded or not
+        self._warmed = threading.Event()
+        self._warm_lock = threading.Lock()
+        self._warm_thread: Optional[threading.Thread] = None
+        self._warm_start: float = 0.0
+
+    def reload(self, force: bool = True) -> bool:
+        """
+        Build a new engine and publish it.
+
+        A caller that waited for another reload in progress gets the result
+        of that reload instead of starting one more.
+
+        Args:
+            force: Rebuild even if the file looks unchanged
+
+        Returns:
+            bool: Whether a new generation was published.
+        """
+        generation: int = self.generation
+        with self._reload_lock:
+            if self.generation != generation:
+                return True
+            signature: Optional[FileSignature] = file_signature(self.file_path)
+            if not force and signature == self._signature:
+                return False
+            start: float = timer()
+            try:
+                engine: Optional[Any] = self.build()
+            except Exception as e:
+                logger.error(f"Error rebuilding engine from '{self.file_path}': {e}")
+                engine = None
+            if engine is None:
+                self.last_error = f"Failed to load '{self.file_path}'"
+                # Not retried until the file changes again
+                self._signature = signature
+                return False
+            self.engine = engine
+            self._signature = signature
+            self.generation += 1
+            self.last_reload_ms = (timer() - start) * 1000
+            self.last_error = ""
+        logger.info(
+            f"Published generation {self.generation} of {self.file_path} "
+            f"({len(engine)} records) in {self.last_reload_ms:.2f}ms"
+        )
+        return True
+
+    def warm_up(self) -> None:
+        """Start the first build in the background, once per process."""
+        with self._warm_lock:
+            if self._warm_thread is not None:
+                return
+            self._warm_start = timer()
+            self._warm_thread = threading.Thread(
+                target=self._warm_up, name="data-warmup", daemon=True
+            )
+            self._warm_thread.start()
+
+    def _warm_up(self) -> None:
+        if self.engine is not None:
+            self._warmed.set()
+            return
+        signature: Optional[FileSignature] = file_signature(self.file_path)
+        logger.info(
+            f"Warming up: loading {self.file_path} "
+            f"({(signature[2] if signature else 0) / 2**20:.1f}MB)"
+        )
+        builder: threading.Thread = threading.Thread(
+            target=self.reload, name="data-build", daemon=True
+        )
+        builder.start()
+        while True:
+            builder.join(WARMUP_LOG_INTERVAL)
+            if not builder.is_alive():
+                break
+            logger.info(f"Warming up: still loading after {self.warming_seconds:.0f}s")
+        self._warmed.set()
+        if self.engine is None:
+            logger.error(f"Warm-up failed: {self.last_error}")
+        else:
+            logger.info(f"Ready after {self.warming_seconds:.2f}s")
+
+    @property
+    def warming_seconds(self) -> float:
+        """Seconds since the warm-up started."""
+        return timer() - self._warm_start if self._warm_start else 0.0
+
+    @property
+    def warming(self) -> bool:
+        """Whether the first build is still running."""
+        return self.engine is None and not self._warmed.is_set()
+
+    def wait_ready(self, timeout: Optional[float]) -> bool:
+        """
+        Wait for the first build, starting it if needed.
+
+        Args:
+            timeout: Seconds to wait at most, None to wait until it is done
+
+        Returns:
+            bool: Whether the first build finished, successfully or not.
+        """
+        if self.engine is not None:
+            return True
+        self.warm_up()
+        return self._warmed.wait(timeout)
+
+    def poll(self) -> bool:
+        """
+        Reload if the file changed and has not changed since the last poll.
+
+        Returns:
+            bool: Whether a new generation was published.
+        """
+        signature: Optional[FileSignature] = file_signature(self.file_path)
+        settled: bool = signature == self._polled
+        self._polled = signature
+        if signature is None or signature == self._signature or not settled:
+            return False
+        return self.reload(force=False)
+
+    def start(self, interval: float) -> None:
+        """Start polling the file every `interval` seconds, once per process."""
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="data-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error watching '{self.file_path}': {e}")
+
+    def describe(self) -> Dict[str, Any]:
+        """Summarize the published generation for the stats."""
+        return {
+            "generation": self.generation,
+            "last_reload_ms": round(self.last_reload_ms, 2),
+            "last_error": self.last_error,
+            "warming": self.warming,
+        }
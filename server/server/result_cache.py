@@ -0,0 +1,150 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+"""
+Bounded cache of query results in front of the search path.
+
+Query traffic is heavily skewed towards a few strings, so their answers
+are kept in memory. Two eviction policies are available: plain LRU, and
+TinyLFU, which only admits a new string in place of the LRU victim if it
+has been queried more often recently, so one-off queries cannot flush the
+hot set. All entries are dropped when the data generation changes, i.e.
+when a different index is searched after a reload.
+"""
+
+POLICIES = ("lru", "tinylfu")
+# Counters per sketch row for small caches, so one-off queries rarely
+# share all of their counters with a hot string
+SKETCH_MIN_WIDTH: int = 64
+# Multipliers deriving the count-min sketch rows from one hash
+_SEEDS = (
+    0x9E3779B97F4A7C15,
+    0xC2B2AE3D27D4EB4F,
+    0x165667B19E3779F9,
+    0xD6E8FEB86659FD93,
+)
+_MASK_64: int = (1 << 64) - 1
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of recent query frequencies with 4-bit counters.
+
+    Counters are halved every `sample_size` increments, so the estimates
+    follow the recent popularity of the strings.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        width: int = 1
+        while width < max(SKETCH_MIN_WIDTH, capacity):
+            width <<= 1
+        # Slots are the top bits of the 64-bit products, which depend on
+        # every bit of the hash
+        self._shift: int = 64 - width.bit_length() + 1
+        self._table: List[bytearray] = [bytearray(width) for _ in _SEEDS]
+        self.sample_size: int = 10 * width
+        self._additions: int = 0
+
+    def _slots(self, key: Hashable) -> List[int]:
+        h: int = hash(key) & _MASK_64
+        return [(h * seed & _MASK_64) >> self._shift for seed in _SEEDS]
+
+    def increment(self, key: Hashable) -> None:
+        """Count one occurrence of a key."""
+        for row, slot in zip(self._table, self._slots(key)):
+            if row[slot] < 15:
+                row[slot] += 1
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            self._age()
+
+    def frequency(self, key: Hashable) -> int:
+        """Estimate how often a key occurred recently."""
+        return min(row[slot] for row, slot in zip(self._table, self._slots(key)))
+
+    def _age(self) -> None:
+        self._table = [bytearray(count >> 1 for count in row) for row in self._table]
+        self._additions //= 2
+
+
+class ResultCache:
+    """
+    Thread-safe cache of query results with LRU or TinyLFU eviction.
+
+    Args:
+        capacity: Maximum number of cached results
+        policy: "lru" or "tinylfu"
+    """
+
+    def __init__(self, capacity: int, policy: str = "lru") -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.capacity: int = capacity
+        self.policy: str = policy
+        self.generation: Optional[Hashable] = None
+        self._entries: "OrderedDict[str, bool]" = OrderedDict()
+        self._sketch: Optional[FrequencySketch] = (
+            FrequencySketch(capacity) if policy == "tinylfu" else None
+        )
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, generation: Hashable = None) -> Optional[bool]:
+        """
+        Look up a cached result.
+
+        Args:
+            key: The query string
+            generation: A token of the data being searched, such as the
+                index object; cached results of any other generation are
+                dropped first
+
+        Returns:
+            Optional[bool]: The cached result, or None on a miss.
+        """
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+            if self._sketch is not None:
+                self._sketch.increment(key)
+            found: Optional[bool] = self._entries.get(key)
+            if found is not None:
+                self._entries.move_to_end(key)
+            return found
+
+    def put(self, key: str, found: bool, generation: Hashable = None) -> None:
+        """
+        Cache the result of a query, evicting another entry if full.
+
+        Args:
+            key: The query string
+            found: Whether the string exists
+            generation: The generation of the data the result comes from
+        """
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                # Searched before a reload that another thread already saw
+                return
+            if key in self._entries:
+                self._entries[key] = found
+                return
+            if len(self._entries) >= self.capacity:
+                victim: str = next(iter(self._entries))
+                if self._sketch is not None and (
+                    self._sketch.frequency(key) <= self._sketch.frequency(victim)
+                ):
+                    # The candidate is not more popular than the victim
+                    return
+                del self._entries[victim]
+            self._entries[key] = found
+
+    def clear(self) -> None:
+        """Drop all cached results."""
+        with self._lock:
+            self._entries.clear()
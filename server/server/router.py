@@ -0,0 +1,452 @@
+import json
+import socket
+import ssl
+import threading
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from timeit import default_timer as timer
+from typing import Any, Dict, List, Optional
+
+from .exceptions import DataWarmingError, ShardUnavailableError
+from .metrics import Counter, Histogram, MetricsRegistry
+from .range_index import parse_range_query
+from .server import (
+    CONFIG,
+    FOUND_RESPONSE,
+    MAX_PAYLOAD,
+    NOT_FOUND_RESPONSE,
+    SERVER_ERROR_RESPONSE,
+    WARMING_RESPONSE,
+    StringSearchServer,
+    start_server,
+)
+from .sharding import Address, parse_shards, shard_of
+
+logger = logging.getLogger(__name__)
+
+"""
+Router of a sharded deployment, speaking the same wire protocol as the
+search servers.
+
+Every query is forwarded to the shard owning it (`sharding.shard_of`)
+and batches are split into one slice per shard, forwarded concurrently.
+PREFIX and FIELD queries go to every shard and their counts are summed.
+Each replica of a shard is reached over a pool of persistent, pipelined
+connections. A replica that fails is skipped for `RETRY_AFTER` seconds
+and the query is retried on the next replica of the shard. STATS reports
+the latency and errors of every shard and replica.
+"""
+
+ROUTER_SHARDS: str = CONFIG["router_shards"]
+ROUTER_SHARD_SSL: bool = CONFIG["router_shard_ssl"]
+ROUTER_POOL_SIZE: int = CONFIG["router_pool_size"]
+ROUTER_TIMEOUT: float = CONFIG["router_timeout"]
+ROUTER_RETRY_AFTER: float = CONFIG["router_retry_after"]
+
+# Queries sent at once on a connection before reading their answers, so
+# that neither side blocks on a full socket buffer
+PIPELINE_WINDOW: int = 512
+
+
+class _Connection:
+    """One persistent connection to a replica."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock: socket.socket = sock
+        self.reader = sock.makefile("rb")
+
+    def request(self, queries: List[bytes], batch: bool = False) -> List[str]:
+        """
+        Send newline-terminated queries at once and read their answers.
+
+        As a batch, the queries are sent after a `BATCH <n>` header, so the
+        replica checks them in one pass, and the echoed header is skipped.
+        """
+        payload: bytes = b"".join(query + b"\n" for query in queries)
+        if batch:
+            payload = b"BATCH %d\n" % len(queries) + payload
+        self.sock.sendall(payload)
+        answers: List[str] = []
+        for _ in range(len(queries) + batch):
+            line: bytes = self.reader.readline()
+            if not line.endswith(b"\n"):
+                raise ConnectionError(
+                    f"Connection closed by the replica: {line.decode('utf-8', 'replace')}"
+                )
+            answers.append(line[:-1].decode("utf-8", "replace"))
+            if batch and answers[-1] == WARMING_RESPONSE:
+                # The replica ends the connection after a failed batch
+                raise DataWarmingError("Replica is still loading its data")
+        return answers[1:] if batch else answers
+
+    def close(self) -> None:
+        self.reader.close()
+        self.sock.close()
+
+
+class Replica:
+    """
+    One search server holding a shard, reached over pooled connections.
+
+    Args:
+        address: Host and port of the server
+        ssl_context: Context for TLS connections, or None for plain TCP
+        pool_size: Maximum number of open connections
+        timeout: Seconds allowed to connect and to receive an answer
+    """
+
+    def __init__(
+        self,
+        address: Address,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        pool_size: int = ROUTER_POOL_SIZE,
+        timeout: float = ROUTER_TIMEOUT,
+    ) -> None:
+        self.address: Address = address
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.timeout: float = timeout
+        # Monotonic time before which the replica is only tried last
+        self.down_until: float = 0.0
+        self.latency: Histogram = Histogram()
+        self.errors: Counter = Counter()
+        self._idle: List[_Connection] = []
+        self._lock = threading.Lock()
+        self.pool_size: int = max(1, pool_size)
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+
+    @property
+    def name(self) -> str:
+        return f"{self.address[0]}:{self.address[1]}"
+
+    def request(self, queries: List[bytes], batch: bool = False) -> List[str]:
+        """
+        Forward queries over one pooled connection, pipelined.
+
+        Args:
+            queries: The encoded queries
+            batch: Whether to send them as batches, only for exact matches
+
+        Raises:
+            OSError: If the replica cannot be reached or closed the connection.
+            DataWarmingError: If the replica is still loading its data.
+        """
+        if not self._slots.acquire(timeout=self.timeout or None):
+            raise TimeoutError(f"No connection to {self.name} available")
+        connection: Optional[_Connection] = None
+        try:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                connection = self._connect()
+            answers: List[str] = []
+            for start in range(0, len(queries), PIPELINE_WINDOW):
+                answers.extend(
+                    connection.request(queries[start : start + PIPELINE_WINDOW], batch)
+                )
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            raise
+        else:
+            with self._lock:
+                self._idle.append(connection)
+        finally:
+            self._slots.release()
+        if WARMING_RESPONSE in answers:
+            raise DataWarmingError(f"{self.name} is still loading its data")
+        return answers
+
+    def _connect(self) -> _Connection:
+        sock: socket.socket = socket.create_connection(
+            self.address, timeout=self.timeout or None
+        )
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.ssl_context is not None:
+            sock = self.ssl_context.wrap_socket(sock, server_hostname=self.address[0])
+        return _Connection(sock)
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "address": self.name,
+            "down": self.down_until > time.monotonic(),
+            "errors": self.errors.value,
+            "latency_us": self.latency.snapshot().to_dict(),
+        }
+
+
+class Shard:
+    """
+    The replicas of one partition, tried in turn until one answers.
+
+    Args:
+        number: Position of the shard, from 0
+        replicas: The servers holding the partition
+        retry_after: Seconds a failed replica is only tried after the others
+    """
+
+    def __init__(
+        self,
+        number: int,
+        replicas: List[Replica],
+        retry_after: float = ROUTER_RETRY_AFTER,
+    ) -> None:
+        self.number: int = number
+        self.replicas: List[Replica] = replicas
+        self.retry_after: float = retry_after
+        self.latency: Histogram = Histogram()
+        self.failovers: Counter = Counter()
+        self._next: int = 0
+
+    def request(self, queries: List[bytes], batch: bool = False) -> List[str]:
+        """
+        Forward queries to the first replica that answers them.
+
+        Replicas take turns first; the ones that recently failed come last.
+
+        Raises:
+            DataWarmingError: If the replicas reached are all still loading.
+            ShardUnavailableError: If no replica answered.
+        """
+        now: float = time.monotonic()
+        first: int = self._next % len(self.replicas)
+        self._next = first + 1
+        rotated: List[Replica] = self.replicas[first:] + self.replicas[:first]
+        error: Optional[Exception] = None
+        for replica in sorted(rotated, key=lambda replica: replica.down_until > now):
+            if error is not None:
+                self.failovers.inc()
+            start: float = timer()
+            try:
+                answers: List[str] = replica.request(queries, batch)
+            except DataWarmingError as e:
+                error = e
+                continue
+            except OSError as e:
+                replica.errors.inc()
+                replica.down_until = time.monotonic() + self.retry_after
+                logger.warning(f"Replica {replica.name} of shard {self.number} failed: {e}")
+                error = e
+                continue
+            elapsed: float = timer() - start
+            replica.latency.record(elapsed)
+            self.latency.record(elapsed)
+            return answers
+        if isinstance(error, DataWarmingError):
+            raise error
+        raise ShardUnavailableError(
+            f"No replica of shard {self.number} answered: {error}"
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "shard": self.number,
+            "failovers": self.failovers.value,
+            "latency_us": self.latency.snapshot().to_dict(),
+            "replicas": [replica.describe() for replica in self.replicas],
+        }
+
+
+class ShardRouter(StringSearchServer):
+    """
+    Answer the wire protocol by forwarding queries to the shard servers.
+
+    Args:
+        shards: The shards, in the order used to partition the data
+        metrics: Registry of the router's own metrics
+    """
+
+    def __init__(
+        self, shards: List[Shard], metrics: Optional[MetricsRegistry] = None
+    ) -> None:
+        super().__init__(metrics, result_cache_size=0)
+        self.shards: List[Shard] = shards
+        # Shared by every client connection: one thread per connection the
+        # replicas accept, so concurrent fan-outs do not queue behind each
+        # other while connections are free
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=sum(
+                replica.pool_size for shard in shards for replica in shard.replicas
+            ),
+            thread_name_prefix="shard",
+        )
+
+    def start_loading(self) -> None:
+        """The shard servers load the data; nothing to do here."""
+
+    def owner(self, request: str) -> Shard:
+        """Return the shard owning a query."""
+        return self.shards[shard_of(request.encode("utf-8"), len(self.shards))]
+
+    def _fan_out(
+        self, slices: Dict[int, List[bytes]], batch: bool = False
+    ) -> Dict[int, List[str]]:
+        """Forward one slice of queries per shard, concurrently."""
+        if len(slices) == 1:
+            (number, queries), = slices.items()
+            return {number: self.shards[number].request(queries, batch)}
+        futures: Dict[int, Future] = {
+            number: self._executor.submit(self.shards[number].request, queries, batch)
+            for number, queries in slices.items()
+        }
+        return {number: future.result() for number, future in futures.items()}
+
+    def process_request(self, request: str) -> str:
+        """Forward a query to its shard and return the shard's answer."""
+        if not request or parse_range_query(request) is not None:
+            return super().process_request(request)
+        try:
+            start: float = timer()
+            answer: str = self.owner(request).request([request.encode("utf-8")])[0]
+            self.metrics.record("lookup", timer() - start)
+            self.metrics.inc("queries")
+            return answer
+        except DataWarmingError:
+            self.metrics.inc("warming")
+            return WARMING_RESPONSE
+        except Exception as e:
+            self.metrics.inc("errors")
+            logger.error("Error forwarding query: %s", e)
+            return SERVER_ERROR_RESPONSE
+
+    def process_range_query(self, command: str, argument: str) -> str:
+        """Sum the counts of a PREFIX or FIELD query over every shard."""
+        query: bytes = f"{command} {argument}".encode("utf-8")
+        try:
+            start: float = timer()
+            answers: Dict[int, List[str]] = self._fan_out(
+                {number: [query] for number in range(len(self.shards))}
+            )
+            self.metrics.record("lookup", timer() - start)
+            self.metrics.inc("queries")
+        except DataWarmingError:
+            self.metrics.inc("warming")
+            return WARMING_RESPONSE
+        except Exception as e:
+            self.metrics.inc("errors")
+            logger.error("Error forwarding %s query: %s", command, e)
+            return SERVER_ERROR_RESPONSE
+        count: int = 0
+        for (answer,) in answers.values():
+            response, _, number = answer.rpartition(" ")
+            if response not in (FOUND_RESPONSE, NOT_FOUND_RESPONSE) or not number.isdigit():
+                # ERROR answers are the same from every shard
+                return answer
+            count += int(number)
+        if count:
+            return f"{FOUND_RESPONSE} {count}"
+        return f"{NOT_FOUND_RESPONSE} 0"
+
+    def process_batch(self, requests: List[str]) -> List[bool]:
+        """Split a batch by shard, forward the slices and merge the answers."""
+        positions: Dict[int, List[int]] = {}
+        slices: Dict[int, List[bytes]] = {}
+        for position, request in enumerate(requests):
+            query: bytes = request.encode("utf-8")
+            # Never found, and would end the shard connection
+            if not query or len(query) > MAX_PAYLOAD:
+                continue
+            number: int = shard_of(query, len(self.shards))
+            positions.setdefault(number, []).append(position)
+            slices.setdefault(number, []).append(query)
+        start: float = timer()
+        found: List[bool] = [False] * len(requests)
+        if slices:
+            for number, answers in self._fan_out(slices, batch=True).items():
+                for position, answer in zip(positions[number], answers):
+                    found[position] = answer == FOUND_RESPONSE
+        self.metrics.record("lookup", timer() - start)
+        self.metrics.inc("batches")
+        self.metrics.inc("queries", len(requests))
+        return found
+
+    def stats_report(self) -> str:
+        """Answer STATS with the router metrics and those of every shard."""
+        stats: Dict[str, Any] = self.stats_source()
+        stats["shards"] = [shard.describe() for shard in self.shards]
+        return json.dumps(stats, separators=(",", ":"))
+
+    def ready_report(self) -> str:
+        """Answer READY once every shard has a replica with its data loaded."""
+        for shard in self.shards:
+            try:
+                answer: str = shard.request([b"READY"])[0]
+            except Exception as e:
+                return f"NOT READY: {e}"
+            if not answer.startswith("READY"):
+                return f"WARMING shard {shard.number}"
+        return f"READY {len(self.shards)} shards"
+
+    def reload_report(self) -> str:
+        """Forward RELOAD to every replica of every shard."""
+        replicas: List[Replica] = [
+            replica for shard in self.shards for replica in shard.replicas
+        ]
+        reloaded: int = 0
+        for replica in replicas:
+            try:
+                reloaded += replica.request([b"RELOAD"])[0].startswith("RELOADED")
+            except Exception as e:
+                logger.error(f"Error reloading {replica.name}: {e}")
+        return f"RELOADED {reloaded} of {len(replicas)} replicas"
+
+    def close(self) -> None:
+        """Close the connections to the shards."""
+        self._executor.shutdown(wait=False)
+        for shard in self.shards:
+            for replica in shard.replicas:
+                replica.close()
+
+
+def create_router(
+    spec: str = ROUTER_SHARDS, shard_ssl: bool = ROUTER_SHARD_SSL
+) -> ShardRouter:
+    """
+    Create the router for the shards in the config.
+
+    Args:
+        spec: The `[ROUTER] SHARDS` setting
+        shard_ssl: Whether the shard servers use TLS
+
+    Raises:
+        ValueError: If no shard is configured or an address is malformed.
+    """
+    if not spec.strip():
+        raise ValueError("No shard configured in [ROUTER] SHARDS")
+    ssl_context: Optional[ssl.SSLContext] = None
+    if shard_ssl:
+        # The shard servers use the same self-signed certificate
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    shards: List[Shard] = [
+        Shard(number, [Replica(address, ssl_context) for address in replicas])
+        for number, replicas in enumerate(parse_shards(spec))
+    ]
+    logger.info(
+        f"Routing to {len(shards)} shards: "
+        + ", ".join(
+            f"{shard.number}: {'|'.join(replica.name for replica in shard.replicas)}"
+            for shard in shards
+        )
+    )
+    return ShardRouter(shards)
+
+
+def start_router(host: str, port: int, debug: bool) -> None:
+    """
+    Start the router on the threaded engine.
+
+    Args:
+        host: The host address to bind to
+        port: The port number to listen on
+        debug: Whether to print debug information
+    """
+    start_server(host, port, debug, client_operation=create_router())
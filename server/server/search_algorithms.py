@@ -1,15 +1,6 @@
 import bisect
 import math
-from typing import List, Optional
-
-from . import config_loader
-
-"""
-Load the configuration using the `config_loader`
-Set the `DEBUG` variable to the value of the 'debug' key in the configuration.
-"""
-CONFIG: dict = config_loader.load_config()
-DEBUG: bool = CONFIG["debug"]
+from typing import Collection, List, Optional
 
 
 def linear_search(search_string: str, content: List[str]) -> bool:
@@ -35,22 +26,14 @@ def binary_search(search_string: str, content: List[str]) -> bool:
 
     Arg:
         search_string (str)-> The string being searched.
-        content (List[str])-> List of strings being searched
+        content (List[str])-> Presorted list of strings being searched
 
     Return:
         bool: True if found, False otherwise.
     """
-    # Flatten if needed
-    flat_content: List[str] = [
-        item if isinstance(item, str) else item[0] for item in content
-    ]
-
-    # Sort content
-    sorted_content: List[str] = sorted(flat_content)
-
     # Use bisect to find index
-    index = bisect.bisect_left(sorted_content, search_string)
-    return index != len(sorted_content) and sorted_content[index] == search_string
+    index = bisect.bisect_left(content, search_string)
+    return index != len(content) and content[index] == search_string
 
 
 def jump_search(search_string: str, content: List[str]) -> Optional[bool]:
@@ -59,7 +42,7 @@ def jump_search(search_string: str, content: List[str]) -> Optional[bool]:
 
     Arg:
         search_string (str)-> The string being searched.
-        content (List[str])-> List of strings being searched
+        content (List[str])-> Presorted list of strings being searched
 
     Return:
         bool: True if found, False otherwise.
@@ -68,7 +51,6 @@ def jump_search(search_string: str, content: List[str]) -> Optional[bool]:
     block_size: int = int(math.sqrt(n))
     prev: int = 0
     curr: int = 0
-    content = sorted(content)
 
     # Jump ahead to find the block where the element may be present
     while curr < n and content[curr] <= search_string:
@@ -85,21 +67,18 @@ def jump_search(search_string: str, content: List[str]) -> Optional[bool]:
     return False
 
 
-def search_in_set(search_item: str, content: List[str]) -> bool:
+def search_in_set(search_item: str, content: Collection[str]) -> bool:
     """
     Checks if a given item exists in the set.
 
     Args:
         search_item (str): Item to search for.
-        content (List[str]): List of strings.
+        content (Collection[str]): Prebuilt set (or frozenset) of strings.
 
     Returns:
         bool: True if found, False otherwise.
     """
-    if content:
-        content = sorted(content)
-    data_set: set[str] = set(content)
-    return search_item in data_set
+    return search_item in content
 
 
 def exponential_search(search_string: str, content: List[str]) -> bool:
@@ -107,13 +86,14 @@ def exponential_search(search_string: str, content: List[str]) -> bool:
     Perform exponential search to find the target value in the given sorted list.
 
     Parameters:
-        content (List[str]): The list to be searched.
+        content (List[str]): The presorted list to be searched.
         search_string (str): The value to be searched for.
 
     Returns:
         bool: True if found, False otherwise.
     """
-    content = sorted(content)
+    if not content:
+        return False
     if content[0] == search_string:
         return True
 
@@ -121,5 +101,7 @@ def exponential_search(search_string: str, content: List[str]) -> bool:
     while i < len(content) and content[i] <= search_string:
         i *= 2
 
-    result: bool = binary_search(search_string, content[i // 2 : min(i, len(content))])
-    return result
+    # Bisect within the bounds instead of slicing to avoid a copy
+    hi: int = min(i, len(content))
+    index = bisect.bisect_left(content, search_string, i // 2, hi)
+    return index != hi and content[index] == search_string
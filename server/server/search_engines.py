@@ -0,0 +1,435 @@
+import abc
+import sys
+import logging
+from array import array
+from timeit import default_timer as timer
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from . import parallel_build, utils
+from .bloom_filter import BloomFilter, FilteredIndex
+from .index import SortedListIndex, StringIndex
+from .index_file import IndexFile, load_index_file
+from .metrics import METRICS
+from .mmap_index import MmapIndex, snapshot
+from .search_algorithms import exponential_search, jump_search, linear_search
+
+logger = logging.getLogger(__name__)
+
+"""
+Registry of the search engines selectable with `[SEARCH] ALGORITHM`.
+
+Every engine is built once from the data file and then answers any number
+of queries through the same interface as the indexes it wraps. Engines
+record how long the build took and how much memory they hold, so the
+right one can be chosen for the size of the dataset.
+"""
+
+SEARCH_ENGINES: Dict[str, Type["SearchEngine"]] = {}
+
+
+def register_engine(*names: str) -> Callable[[type], type]:
+    """Class decorator registering a search engine under the given names."""
+
+    def register(cls: Type["SearchEngine"]) -> Type["SearchEngine"]:
+        for name in names:
+            SEARCH_ENGINES[name] = cls
+        cls.name = names[0]
+        return cls
+
+    return register
+
+
+def _lines_size(lines: Iterable[str]) -> int:
+    """Memory held by the given strings themselves."""
+    return sum(sys.getsizeof(line) for line in lines)
+
+
+class SearchEngine(abc.ABC):
+    """
+    Base class of the search engines: build once, query many.
+
+    Subclasses implement `_load` and `_memory`; lookups are delegated to the
+    index they load, with the engine's algorithm if it has one.
+    """
+
+    name: str = ""
+    # Function from `search_algorithms` run against the sorted lines, if any
+    algorithm: Optional[Callable[[str, Sequence[str]], bool]] = None
+
+    def __init__(
+        self,
+        index: Any,
+        build_time_ms: float,
+        build_stages: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.index = index
+        self.build_time_ms: float = build_time_ms
+        # Time of each stage of a parallel build (in ms)
+        self.build_stages: Dict[str, float] = build_stages or {}
+        self.memory_bytes, self.mapped_bytes = self._memory()
+
+    @classmethod
+    def build(cls, file_path: str, **options: Any) -> Optional["SearchEngine"]:
+        """
+        Build the engine for a data file.
+
+        Args:
+            file_path: Path to the data file
+            **options: Engine specific settings (index_path, filter_path,
+                fp_rate, build_workers, snapshot)
+
+        Returns:
+            Optional[SearchEngine]: The engine, or None if the data could not
+            be loaded.
+        """
+        start: float = timer()
+        stages: Dict[str, float] = {}
+        index: Any = cls._load(file_path, stages=stages, **options)
+        if index is None:
+            return None
+        engine: SearchEngine = cls(index, (timer() - start) * 1000, stages)
+        logger.info(
+            f"Search engine '{engine.name}': {len(engine)} records built in "
+            f"{engine.build_time_ms:.2f}ms, {engine.memory_bytes / 2**20:.1f}MB "
+            f"resident, {engine.mapped_bytes / 2**20:.1f}MB mapped"
+        )
+        return engine
+
+    @classmethod
+    @abc.abstractmethod
+    def _load(cls, file_path: str, **options: Any) -> Any:
+        """Load the index of a data file, or return None if it cannot be read."""
+
+    @abc.abstractmethod
+    def _memory(self) -> Tuple[int, int]:
+        """Return the bytes held in memory and the bytes mapped from files."""
+
+    @property
+    def sorted_lines(self) -> Sequence[str]:
+        return self.index.sorted_lines
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, search_string: object) -> bool:
+        return isinstance(search_string, str) and self.contains(search_string)
+
+    def contains(
+        self,
+        search_string: str,
+        algorithm: Optional[Callable[[str, Sequence[str]], bool]] = None,
+    ) -> bool:
+        """
+        Check whether the given string exists.
+
+        Args:
+            search_string (str): The string being searched.
+            algorithm: Optional function from `search_algorithms` overriding
+                the engine's own lookup.
+
+        Returns:
+            bool: True if found, False otherwise.
+        """
+        return self.index.contains(search_string, algorithm or self.algorithm)
+
+    def contains_many(self, search_strings: Iterable[str]) -> List[bool]:
+        """
+        Check a batch of strings.
+
+        Args:
+            search_strings (Iterable[str]): The strings being searched.
+
+        Returns:
+            List[bool]: Whether each string exists, in the same order.
+        """
+        if self.algorithm is None:
+            return self.index.contains_many(search_strings)
+        return [self.contains(search_string) for search_string in search_strings]
+
+    def describe(self) -> Dict[str, Any]:
+        """Summarize the engine for the stats."""
+        summary: Dict[str, Any] = {
+            "algorithm": self.name,
+            "records": len(self),
+            "build_time_ms": round(self.build_time_ms, 2),
+            "memory_bytes": self.memory_bytes,
+            "mapped_bytes": self.mapped_bytes,
+        }
+        if self.build_stages:
+            summary["build_stages_ms"] = {
+                stage: round(ms, 2) for stage, ms in self.build_stages.items()
+            }
+        return summary
+
+
+def _read_lines(file_path: str, **options: Any) -> Tuple[Optional[List[str]], bool]:
+    """
+    Read the lines of the data file, in parallel if it is large enough.
+
+    Args:
+        file_path: Path to the data file
+        **options: Engine settings: build_workers, and stages receiving the
+            time of each stage of a parallel build
+
+    Returns:
+        Tuple[Optional[List[str]], bool]: The lines, or None on failure, and
+        whether they are already sorted and deduplicated.
+    """
+    workers: int = parallel_build.workers_for(
+        file_path, options.get("build_workers", 1)
+    )
+    if workers > 1:
+        try:
+            lines: List[str] = parallel_build.read_sorted_lines(
+                file_path, workers, options.get("stages")
+            )
+            return lines, True
+        except Exception as e:
+            logger.warning(
+                f"Parallel build of '{file_path}' failed, reading it serially: {e}"
+            )
+    return utils.reread_file(file_path), False
+
+
+@register_engine("set")
+class HashSetEngine(SearchEngine):
+    """Hash set of the lines: O(1) lookups, the most memory."""
+
+    @classmethod
+    def _load(cls, file_path: str, **options: Any) -> Optional[StringIndex]:
+        lines, presorted = _read_lines(file_path, **options)
+        return StringIndex(lines, presorted) if lines is not None else None
+
+    def _memory(self) -> Tuple[int, int]:
+        index: StringIndex = self.index
+        return (
+            sys.getsizeof(index.members)
+            + sys.getsizeof(index.sorted_lines)
+            + _lines_size(index.sorted_lines),
+            0,
+        )
+
+
+@register_engine("columnar", "numpy")
+class ColumnarEngine(HashSetEngine):
+    """
+    Numeric records packed into sorted integer keys, batches vectorized.
+
+    Needs NumPy; without it the hash set of the lines is built instead.
+    """
+
+    @classmethod
+    def _load(cls, file_path: str, **options: Any) -> Any:
+        # Imported here so that NumPy is only loaded when the engine is used
+        from .columnar_index import ColumnarIndex, np
+
+        if np is None:
+            logger.warning("NumPy is not installed, using the hash set index")
+            return super()._load(file_path, **options)
+        lines, presorted = _read_lines(file_path, **options)
+        return ColumnarIndex(lines, presorted) if lines is not None else None
+
+    def _memory(self) -> Tuple[int, int]:
+        if isinstance(self.index, StringIndex):
+            return super()._memory()
+        return self.index.footprint()
+
+
+@register_engine("bisect", "binary")
+class SortedArrayEngine(SearchEngine):
+    """Sorted list of the lines with binary search: O(log n), less memory."""
+
+    @classmethod
+    def _load(cls, file_path: str, **options: Any) -> Optional[SortedListIndex]:
+        lines, presorted = _read_lines(file_path, **options)
+        return SortedListIndex(lines, presorted) if lines is not None else None
+
+    def _memory(self) -> Tuple[int, int]:
+        lines: List[str] = self.index.sorted_lines
+        return sys.getsizeof(lines) + _lines_size(lines), 0
+
+
+@register_engine("linear")
+class LinearEngine(SortedArrayEngine):
+    """Linear scan of the sorted lines, for comparison only."""
+
+    algorithm = staticmethod(linear_search)
+
+
+@register_engine("jump")
+class JumpEngine(SortedArrayEngine):
+    """Jump search over the sorted lines."""
+
+    algorithm = staticmethod(jump_search)
+
+
+@register_engine("exponential")
+class ExponentialEngine(SortedArrayEngine):
+    """Exponential search over the sorted lines."""
+
+    algorithm = staticmethod(exponential_search)
+
+
+@register_engine("mmap")
+class MappedEngine(SearchEngine):
+    """
+    Binary search over the memory-mapped data, for files larger than RAM.
+
+    Maps the prebuilt index file while it is up to date, otherwise the data
+    file with an in-memory array of line offsets. The data file is mapped
+    directly, so it must be replaced by renaming a new file over it; with
+    the `snapshot` option a private copy of it is mapped instead.
+    """
+
+    @classmethod
+    def _load(cls, file_path: str, **options: Any) -> Any:
+        index: Optional[IndexFile] = load_index_file(
+            file_path, options.get("index_path", "")
+        )
+        if index is not None:
+            logger.info(f"Using index file {index.index_path} ({len(index)} records)")
+            return index
+        if not options.get("snapshot", False):
+            return cls._map(file_path, **options)
+        try:
+            with snapshot(file_path) as snapshot_path:
+                return cls._map(snapshot_path, **options)
+        except OSError as e:
+            logger.error(f"Error copying file '{file_path}': {e}")
+            return None
+
+    @classmethod
+    def _map(cls, file_path: str, **options: Any) -> Optional[MmapIndex]:
+        """Map a data file and build its offsets, in parallel if it is large."""
+        starts: Optional[array] = None
+        workers: int = parallel_build.workers_for(
+            file_path, options.get("build_workers", 1)
+        )
+        if workers > 1:
+            try:
+                starts = parallel_build.sorted_line_starts(
+                    file_path, workers, options.get("stages")
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Parallel build of '{file_path}' failed, indexing it serially: {e}"
+                )
+        try:
+            return MmapIndex(file_path, starts)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error mapping file '{file_path}': {e}")
+            return None
+
+    def _memory(self) -> Tuple[int, int]:
+        return self.index.footprint()
+
+
+@register_engine("filter")
+class FilteredEngine(MappedEngine):
+    """
+    Bloom filter in front of the mapped binary search.
+
+    Most misses are answered from the filter without touching the data;
+    only filter positives are searched exactly.
+    """
+
+    @classmethod
+    def _load(cls, file_path: str, **options: Any) -> Optional[FilteredIndex]:
+        index: Any = super()._load(file_path, **options)
+        if index is None:
+            return None
+        bloom: BloomFilter = load_filter(
+            file_path,
+            index,
+            options.get("filter_path", ""),
+            options.get("fp_rate", 0.01),
+        )
+        return FilteredIndex(index, bloom, options.get("metrics", METRICS))
+
+    def _memory(self) -> Tuple[int, int]:
+        index: FilteredIndex = self.index
+        resident, mapped = index.index.footprint()
+        if index.bloom.mapped:
+            return resident, mapped + index.bloom.size_bytes
+        return resident + index.bloom.size_bytes, mapped
+
+
+def load_filter(
+    file_path: str, index: Any, filter_path: str = "", fp_rate: float = 0.01
+) -> BloomFilter:
+    """
+    Load the saved Bloom filter of the data file, or build and save it.
+
+    Args:
+        file_path: Path to the data file
+        index: The mapped index holding the lines of the data file
+        filter_path: Path of the saved filter, if any
+        fp_rate: Target false-positive rate
+
+    Returns:
+        The filter holding every line of the index.
+    """
+    bloom: Optional[BloomFilter] = BloomFilter.load(filter_path, file_path)
+    if bloom is not None and bloom.fp_rate == fp_rate:
+        logger.info(f"Using filter file {filter_path} ({bloom.keys} keys)")
+        return bloom
+    start: float = timer()
+    bloom = BloomFilter.from_keys(index.lines, fp_rate)
+    logger.info(
+        f"Built filter of {bloom.keys} keys in {(timer() - start) * 1000:.2f}ms "
+        f"({bloom.bits_per_key:.1f} bits per key)"
+    )
+    if filter_path:
+        try:
+            bloom.save(filter_path, file_path)
+        except OSError as e:
+            logger.warning(f"Failed to save filter file {filter_path}: {e}")
+    return bloom
+
+
+def get_engine(name: str) -> Type[SearchEngine]:
+    """
+    Return the search engine registered under the given name.
+
+    Args:
+        name: The `[SEARCH] ALGORITHM` setting
+
+    Raises:
+        ValueError: If no engine is registered under the name.
+    """
+    try:
+        return SEARCH_ENGINES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown search algorithm '{name}', expected one of "
+            f"{', '.join(sorted(SEARCH_ENGINES))}"
+        ) from None
+
+
+def build_engine(name: str, file_path: str, **options: Any) -> Optional[SearchEngine]:
+    """
+    Build the registered search engine with the given name.
+
+    Args:
+        name: The `[SEARCH] ALGORITHM` setting
+        file_path: Path to the data file
+        **options: Engine specific settings
+
+    Returns:
+        Optional[SearchEngine]: The engine, or None if the data could not be
+        loaded.
+
+    Raises:
+        ValueError: If no engine is registered under the name.
+    """
+    return get_engine(name).build(file_path, **options)
@@ -1,22 +1,45 @@
+import collections
+import functools
+import json
 import socket
 import threading
+import time
+import queue
+import random
+import select
+import selectors
 import os
 import ssl
 from timeit import default_timer as timer
-from typing import List, Optional, Union, Tuple
+from typing import Any, Callable, Deque, Dict, List, Optional, Union, Tuple
 import traceback
 import logging
 
 from . import config_loader
 from . import utils
+from .async_logging import BatchLogWriter, setup_logging
+from .bloom_filter import FilteredIndex
+from .index import DeltaIndex, StringIndex
+from .reloader import EngineWatcher, FileReloader
+from .result_cache import ResultCache
+from .search_engines import SearchEngine, build_engine, get_engine
 from .search_algorithms import (
     binary_search,
     linear_search,
     jump_search,
     exponential_search,
-    search_in_set,
 )
-from .exceptions import InvalidPayloadError, FileAccessError
+from .exceptions import DataWarmingError, FileAccessError
+from .metrics import METRICS, MetricsRegistry
+from .protocol import RELOAD_COMMAND, ClientSession
+from .range_index import (
+    FIELD_COMMAND,
+    PREFIX_COMMAND,
+    RangeIndex,
+    RangeQuery,
+    parse_range_query,
+)
+from .tls import create_server_context, record_handshake
 
 CONFIG: dict = config_loader.load_config()
 """
@@ -24,15 +47,50 @@ Load the configuration settings using the `config_loader` module and retrieve
 configuration variables
 """
 MAX_PAYLOAD: int = CONFIG["max_payload"]
+MAX_BATCH_SIZE: int = CONFIG["max_batch_size"]
+MAX_BATCH_PAYLOAD: int = CONFIG["max_batch_payload"]
 BIND_IP: str = CONFIG["host"]
 BIND_PORT: int = CONFIG["port"]
 STRINGS_FILE_PATH: str = CONFIG["linuxpath"]
+ALGORITHM: str = CONFIG["algorithm"]
+INDEX_FILE_PATH: str = CONFIG["index_file"]
+BLOOM_FP_RATE: float = CONFIG["bloom_fp_rate"]
+BUILD_WORKERS: int = CONFIG["build_workers"]
+BLOOM_FILE_PATH: str = CONFIG["bloom_file"]
+WATCH_INTERVAL: float = CONFIG["watch_interval"]
+MMAP_SNAPSHOT: bool = CONFIG["mmap_snapshot"]
 REREAD_QUERY: bool = CONFIG["reread_on_query"]
+RESULT_CACHE_SIZE: int = CONFIG["result_cache_size"]
+RESULT_CACHE_POLICY: str = CONFIG["result_cache_policy"]
 SSL_ENABLED: bool = CONFIG["ssl_enabled"]
 DEBUG: bool = CONFIG["debug"]
-CACHE_DATA: Optional[List[str]] = utils.reread_file(STRINGS_FILE_PATH)
 SSL_CERT: str = CONFIG["ssl_certificate"]
 SSL_KEY: str = CONFIG["ssl_private_key"]
+SSL_CIPHERS: str = CONFIG["ssl_ciphers"]
+SSL_ECDH_CURVE: str = CONFIG["ssl_ecdh_curve"]
+SSL_SESSION_TICKETS: bool = CONFIG["ssl_session_tickets"]
+SSL_NUM_TICKETS: int = CONFIG["ssl_num_tickets"]
+ENGINE: str = CONFIG["engine"]
+BACKLOG: int = CONFIG["backlog"]
+MAX_CONNECTIONS: int = CONFIG["max_connections"]
+WORKERS: int = CONFIG["workers"]
+QUEUE_SIZE: int = CONFIG["queue_size"]
+CLIENT_TIMEOUT: float = CONFIG["client_timeout"]
+IDLE_TIMEOUT: float = CONFIG["idle_timeout"]
+DRAIN_TIMEOUT: float = CONFIG["drain_timeout"]
+# Seconds between checks of the stop event of a draining server
+STOP_POLL_INTERVAL: float = 0.1
+WARMUP_WAIT: float = CONFIG["warmup_wait"]
+LOG_FILE: str = CONFIG["log_file"]
+LOG_QUEUE_SIZE: int = CONFIG["log_queue_size"]
+ACCESS_LOG_SAMPLE_RATE: float = CONFIG["access_log_sample_rate"]
+
+# Wire protocol responses
+FOUND_RESPONSE: str = "STRING EXISTS"
+NOT_FOUND_RESPONSE: str = "STRING NOT EXIST"
+SERVER_ERROR_RESPONSE: str = "SERVER ERROR"
+BUSY_RESPONSE: str = "SERVER BUSY"
+WARMING_RESPONSE: str = "SERVER WARMING"
 
 
 """
@@ -48,126 +106,472 @@ if STRINGS_FILE_PATH.startswith("../"):
         os.path.join(project_root, STRINGS_FILE_PATH[3:])
     )
 
+if INDEX_FILE_PATH.startswith("../"):
+    INDEX_FILE_PATH = os.path.abspath(
+        os.path.join(project_root, INDEX_FILE_PATH[3:])
+    )
+
+if BLOOM_FILE_PATH.startswith("../"):
+    BLOOM_FILE_PATH = os.path.abspath(
+        os.path.join(project_root, BLOOM_FILE_PATH[3:])
+    )
+
+if LOG_FILE.startswith("../"):
+    LOG_FILE = os.path.abspath(os.path.join(project_root, LOG_FILE[3:]))
+
 if SSL_CERT.startswith("../"):
     SSL_CERT = os.path.abspath(os.path.join(project_root, SSL_CERT[3:]))
 
 if SSL_KEY.startswith("../"):
     SSL_KEY = os.path.abspath(os.path.join(project_root, SSL_KEY[3:]))
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG if DEBUG else logging.INFO,
-    format="[%(asctime)s] %(levelname)s: %(message)s",
-)
+# Change-detecting reloader used when the file is re-read on each query
+RELOADER: FileReloader = FileReloader(STRINGS_FILE_PATH)
+
 logger = logging.getLogger(__name__)
+# Sampled per-request access log
+access_logger = logging.getLogger(f"{__name__}.access")
 
 
-# Get the file size of string file path file
-FILE_SIZE: Optional[int] = utils.get_file_size(STRINGS_FILE_PATH)
-# print(f"[INFO] File size: {FILE_SIZE}" if DEBUG else "")
-"""
-Create an SSL context with a specified protocol and load the
-certificate chain and key for the server.
+# Lookup index types: the configured engine, or the reloaded index in
+# reread mode
+SearchIndex = Union[SearchEngine, StringIndex, DeltaIndex]
 
-Args:
-    ssl.PROTOCOL_TLS_SERVER - The protocol to use for the SSL context.
-    "../security/server.crt" - The path to the server certificate.
-    "../security/server.key" - The path to the server key file.
-"""
-context = ssl._create_unverified_context(ssl.PROTOCOL_TLS_SERVER)
-context.load_cert_chain(SSL_CERT, SSL_KEY)
+
+# Algorithm of the engine, also used on the reloaded index in reread mode;
+# an unknown [SEARCH] ALGORITHM fails here, naming the registered ones
+SEARCH_ALGORITHM = get_engine(ALGORITHM).algorithm
+
+
+def load_engine() -> Optional[SearchEngine]:
+    """Build the configured search engine from the data file."""
+    return build_engine(
+        ALGORITHM,
+        STRINGS_FILE_PATH,
+        index_path=INDEX_FILE_PATH,
+        filter_path=BLOOM_FILE_PATH,
+        fp_rate=BLOOM_FP_RATE,
+        build_workers=BUILD_WORKERS,
+        snapshot=MMAP_SNAPSHOT,
+    )
+
+
+# Shared, read-only search engine, built in the background once the port
+# is bound (`warm_up`); the watcher publishes a rebuilt engine when the
+# file changes
+WATCHER: EngineWatcher = EngineWatcher(STRINGS_FILE_PATH, load_engine)
+
+
+def warm_up() -> None:
+    """Start loading the data in the background, once per process."""
+    if str(REREAD_QUERY) == "True":
+        threading.Thread(target=_preload, name="data-warmup", daemon=True).start()
+    else:
+        WATCHER.warm_up()
+
+
+def _preload() -> None:
+    """Load the reread-mode index ahead of the first query."""
+    try:
+        RELOADER.current()
+    except FileAccessError as e:
+        logger.error(f"Warm-up failed: {e}")
+
+
+@functools.lru_cache(maxsize=None)
+def server_context() -> ssl.SSLContext:
+    """
+    Create the server SSL context with the certificate chain and key, the
+    configured ciphers and curve, and session resumption, on first use.
+    """
+    return create_server_context(
+        SSL_CERT,
+        SSL_KEY,
+        ciphers=SSL_CIPHERS,
+        ecdh_curve=SSL_ECDH_CURVE,
+        session_tickets=SSL_SESSION_TICKETS,
+        num_tickets=SSL_NUM_TICKETS,
+    )
 
 
 # Validate and handle client request
 class StringSearchServer:
     # Initiate object
-    def __init__(self):
+    def __init__(
+        self,
+        metrics: Optional[MetricsRegistry] = None,
+        result_cache_size: int = RESULT_CACHE_SIZE,
+        warmup_wait: float = WARMUP_WAIT,
+    ):
         self.cache_lock = threading.Lock()
+        # Results of hot queries, shared by all connections
+        self.result_cache: Optional[ResultCache] = (
+            ResultCache(result_cache_size, RESULT_CACHE_POLICY)
+            if result_cache_size > 0
+            else None
+        )
         if not SSL_ENABLED:
             logger.info("SSL is disabled")
 
-        # Performance metrics
-        self.performance_stats = {
-            "total_queries": 0,
-            "avg_response_time": 0,
-            "max_concurrent": 0,
-        }
+        # Performance metrics, shared by every handler of the process
+        self.metrics: MetricsRegistry = metrics or METRICS
+        # What the STATS command reports; the pre-fork workers replace it
+        # with the metrics of all workers
+        self.stats_source: Callable[[], Dict[str, Any]] = self.metrics.snapshot
+        # PREFIX/FIELD index and the search index it was built for
+        self._range_index: Optional[Tuple[SearchIndex, RangeIndex]] = None
+        # Seconds a query waits for the data during the warm-up
+        self.warmup_wait: float = warmup_wait
+
+    def start_loading(self) -> None:
+        """Load the data in the background and keep it up to date."""
+        warm_up()
+        if str(REREAD_QUERY) != "True":
+            WATCHER.start(WATCH_INTERVAL)
 
     def handle_client(
         self,
         client_sock: Union[socket.socket, ssl.SSLSocket],
         client_addr: Tuple[str, int],
+        session: Optional[ClientSession] = None,
+        park: Optional[Callable[..., None]] = None,
     ) -> None:
         """
-        Handle a client connection by receiving a request, processing it,
-        and sending a response.
+        Handle a client connection by receiving requests, processing them,
+        and sending the responses.
+
+        Single-shot clients get one answer before the connection is closed;
+        persistent clients are served until they close or go idle.
 
         Args:
             client_socket: The client socket object (regular or SSL)
             client_address: The address of the client (ip, port)
+            session: The protocol state of a persistent connection resumed
+                after it was parked, None for a new connection
+            park: If given, called with the socket, address and session
+                instead of waiting for the next query of a persistent
+                connection with nothing left to read, so the connection
+                does not hold the calling thread while it is idle
         """
+        metrics: MetricsRegistry = self.metrics
+        resumed: bool = session is not None
+        if session is None:
+            session = self.new_session()
+            metrics.inc("connections")
+            metrics.gauges["active_connections"].inc()
+        parked: bool = False
         try:
-            request: str = self._strip_exceeding_received_data(client_sock, MAX_PAYLOAD)
-            # Check if the request is empty and return STRING NOT EXIST to client
-            if not request:
-                response = "STRING NOT EXIST"
-                client_sock.sendall(response.encode())
-                logger.error("Empty payload received from client")
-                return
-
-            response: str = ""
-            logger.info(f"Search query: {request}")
-            # Load the file content
-            search_data: List[str] = []
-            if str(REREAD_QUERY) == "True":
-                logger.info(f"Reading file: {STRINGS_FILE_PATH}")
-                reread_time_start = timer()
-                file_dt: Optional[List[str]] = self._load_file_contents(
-                    STRINGS_FILE_PATH
-                )
-                if isinstance(file_dt, list):
-                    reread_time_end = timer()
-                    search_data = file_dt
-                    reread_time: float = (reread_time_end - reread_time_start) * 1000
-                    logger.info(f"Reread search time: {reread_time:.2f}ms")
-            else:
-                search_data = CACHE_DATA
-            # Search query in the file
-            try:
-                logger.info(f"Searching for string: {request}")
+            if not resumed and isinstance(client_sock, ssl.SSLSocket):
+                # Handshake here rather than in accept, off the accept loop
                 start: float = timer()
-                found: bool = search_in_set(request, search_data)
-                end: float = timer()
-                response_time: float = (end - start) * 1000
-                logger.info(f"Search time: {response_time:.2f}ms")
-
-                # Update performance stats
-                with threading.Lock():
-                    self.performance_stats["total_queries"] += 1
-                    self.performance_stats["avg_response_time"] = (
-                        self.performance_stats["avg_response_time"]
-                        * (self.performance_stats["total_queries"] - 1)
-                        + response_time
-                    ) / self.performance_stats["total_queries"]
-
-                response = "STRING EXISTS" if found else "STRING NOT EXIST"
-                logger.info(f"{response}- {'200:OK' if found else '404:NOT FOUND'}")
+                client_sock.do_handshake()
+                record_handshake(metrics, client_sock, timer() - start)
+            while not session.closed:
+                # Waiting for the next query of an idle connection is not
+                # receive time
+                timed: bool = not session.keep_alive or len(session.buffer) > 0
+                start = timer()
+                try:
+                    nbytes: int = self._receive(client_sock, session)
+                except socket.timeout:
+                    logger.debug("Connection from %s timed out", client_addr)
+                    break
+                if timed:
+                    metrics.record("recv", timer() - start)
+                response: bytes = session.process(eof=not nbytes)
                 # Send response to client
-                client_sock.sendall(response.encode())
-                logger.debug(f"Response sent: {response}")
-                return
-            except Exception as e:
-                logger.error(f"Error searching: {e}")
-                response = "SERVER ERROR"
-                client_sock.sendall(response.encode())
-        except InvalidPayloadError as e:
-            logger.error(f"Invalid payload: {str(e)}")
-            client_sock.sendall(f"ERROR: {str(e)}".encode())
+                if response:
+                    start = timer()
+                    client_sock.sendall(response)
+                    metrics.record("send", timer() - start)
+                    logger.debug("Response sent: %r", response)
+                if session.keep_alive and not session.closed:
+                    if park is not None and not _data_pending(client_sock):
+                        parked = True
+                        break
+                    client_sock.settimeout(IDLE_TIMEOUT or None)
+            if not parked:
+                logger.debug(
+                    "Closing connection from %s after %d queries",
+                    client_addr,
+                    session.queries,
+                )
+        except (ConnectionError, ssl.SSLError, socket.timeout) as e:
+            logger.debug("Connection from %s closed: %s", client_addr, e)
         except Exception:
-            logger.error(f"Unexpected error:\n{traceback.format_exc()}")
-            client_sock.sendall("SERVER ERROR".encode())
+            metrics.inc("errors")
+            logger.error("Unexpected error:\n%s", traceback.format_exc())
+            client_sock.sendall(SERVER_ERROR_RESPONSE.encode())
         finally:
-            client_sock.close()
+            if parked:
+                park(client_sock, client_addr, session)
+            else:
+                metrics.gauges["active_connections"].dec()
+                client_sock.close()
+
+    def _receive(
+        self,
+        client_sock: Union[socket.socket, ssl.SSLSocket],
+        session: ClientSession,
+    ) -> int:
+        """
+        Receive straight into the session buffer.
+
+        A first message without a newline is a single-shot query. As TLS
+        record splitting or Nagle can deliver it in several pieces, data
+        that is already available is collected before it is answered.
+
+        Args:
+            client_sock: The client socket object (regular or SSL)
+            session: The protocol state of the connection
+
+        Returns:
+            The number of bytes received, 0 on end of stream
+        """
+        nbytes: int = client_sock.recv_into(session.buffer.writable())
+        session.buffer.commit(nbytes)
+        total: int = nbytes
+        while gather_more(session, nbytes, total, client_sock):
+            nbytes = client_sock.recv_into(session.buffer.writable())
+            session.buffer.commit(nbytes)
+            total += nbytes
+        return total
+
+    def process_request(self, request: str) -> str:
+        """
+        Search the request in the loaded data and build the response.
+
+        This holds the transport-independent part of the protocol, so the
+        threaded and asyncio engines answer queries the same way.
+
+        Args:
+            request: The decoded and stripped query string
+
+        Returns:
+            The response string to send back to the client
+        """
+        # Check if the request is empty and return STRING NOT EXIST to client
+        if not request:
+            logger.error("Empty payload received from client")
+            return NOT_FOUND_RESPONSE
+
+        range_query: Optional[RangeQuery] = parse_range_query(request)
+        if range_query is not None:
+            return self.process_range_query(*range_query)
+
+        try:
+            search_index: SearchIndex = self._current_index()
+            # Search query in the file, unless the result is cached for
+            # the index being searched
+            start: float = timer()
+            found: Optional[bool] = None
+            if self.result_cache is not None:
+                found = self.result_cache.get(request, search_index)
+                self.metrics.inc("cache_misses" if found is None else "cache_hits")
+            if found is None:
+                found = search_index.contains(request, SEARCH_ALGORITHM)
+                if self.result_cache is not None:
+                    self.result_cache.put(request, found, search_index)
+            end: float = timer()
+            self.metrics.record("lookup", end - start)
+            self.metrics.inc("queries")
+
+            response: str = FOUND_RESPONSE if found else NOT_FOUND_RESPONSE
+            if random.random() < ACCESS_LOG_SAMPLE_RATE:
+                access_logger.info(
+                    "Search query: %s - %s - %.3fms",
+                    request,
+                    "200:OK" if found else "404:NOT FOUND",
+                    (end - start) * 1000,
+                )
+            return response
+        except DataWarmingError:
+            self.metrics.inc("warming")
+            return WARMING_RESPONSE
+        except Exception as e:
+            self.metrics.inc("errors")
+            logger.error("Error searching: %s", e)
+            return SERVER_ERROR_RESPONSE
+
+    def process_range_query(self, command: str, argument: str) -> str:
+        """
+        Count the records matching a PREFIX or FIELD query.
+
+        Args:
+            command: PREFIX or FIELD
+            argument: The prefix, or `<field>=<value>` with the field
+                position counted from 1
+
+        Returns:
+            The response string with the number of matching records
+        """
+        if command == FIELD_COMMAND:
+            field, separator, value = argument.partition("=")
+            if not separator or not field.isdigit():
+                return f"ERROR: Invalid {FIELD_COMMAND} query, expected <field>=<value>"
+        try:
+            range_index: RangeIndex = self._current_range_index()
+            start: float = timer()
+            if command == FIELD_COMMAND:
+                count: int = range_index.count_field(int(field), value)
+            else:
+                count = range_index.count_prefix(argument)
+            self.metrics.record("lookup", timer() - start)
+            self.metrics.inc("queries")
+        except DataWarmingError:
+            self.metrics.inc("warming")
+            return WARMING_RESPONSE
+        except Exception as e:
+            self.metrics.inc("errors")
+            logger.error("Error searching: %s", e)
+            return SERVER_ERROR_RESPONSE
+        if count:
+            return f"{FOUND_RESPONSE} {count}"
+        return f"{NOT_FOUND_RESPONSE} 0"
+
+    def _current_range_index(self) -> RangeIndex:
+        """Return the range index of the current data generation."""
+        search_index: SearchIndex = self._current_index()
+        cached: Optional[Tuple[SearchIndex, RangeIndex]] = self._range_index
+        if cached is not None and cached[0] is search_index:
+            return cached[1]
+        range_index: RangeIndex = RangeIndex(search_index.sorted_lines)
+        self._range_index = (search_index, range_index)
+        return range_index
+
+    def process_batch(self, requests: List[str]) -> List[bool]:
+        """
+        Check a batch of queries against the loaded data in one pass.
+
+        Args:
+            requests: The decoded and stripped query strings
+
+        Returns:
+            Whether each query exists, in the same order
+        """
+        search_index: SearchIndex = self._current_index()
+        start: float = timer()
+        found: List[bool] = search_index.contains_many(requests)
+        elapsed: float = timer() - start
+        self.metrics.record("lookup", elapsed)
+        self.metrics.inc("batches")
+        self.metrics.inc("queries", len(requests))
+        if random.random() < ACCESS_LOG_SAMPLE_RATE:
+            access_logger.info(
+                "Batch search of %d queries: %d found in %.3fms",
+                len(requests),
+                sum(found),
+                elapsed * 1000,
+            )
+        return found
+
+    def _current_index(self) -> SearchIndex:
+        """Return the index to search, checking the file in reread mode."""
+        # Load the file content
+        # One read of the published engine: a reload swapping in a new
+        # generation does not affect the lookups already holding this one
+        search_index: Optional[SearchIndex] = WATCHER.engine
+        if str(REREAD_QUERY) == "True":
+            reread_time_start = timer()
+            search_index = RELOADER.current()
+            reread_time: float = timer() - reread_time_start
+            self.metrics.record("reload", reread_time)
+            logger.debug(
+                "Reread check of %s: %.3fms (generation %d)",
+                STRINGS_FILE_PATH,
+                reread_time * 1000,
+                RELOADER.generation,
+            )
+        elif search_index is None:
+            if not WATCHER.wait_ready(self.warmup_wait):
+                raise DataWarmingError()
+            search_index = WATCHER.engine
+        if search_index is None:
+            raise FileAccessError("Search data not loaded")
+        return search_index
+
+    def stats_report(self) -> str:
+        """Answer the STATS command with the metrics as one line of JSON."""
+        stats: Dict[str, Any] = self.stats_source()
+        if str(REREAD_QUERY) == "True":
+            stats["data"] = {
+                "generation": RELOADER.generation,
+                "last_reload_ms": round(RELOADER.last_reload_ms, 2),
+            }
+        else:
+            stats["data"] = WATCHER.describe()
+        engine: Optional[SearchEngine] = WATCHER.engine
+        if engine is not None:
+            stats["engine"] = engine.describe()
+            if isinstance(engine.index, FilteredIndex):
+                stats["filter"] = engine.index.describe(stats["counters"])
+        return json.dumps(stats, separators=(",", ":"))
+
+    def reload_report(self) -> str:
+        """Answer the RELOAD command once the data file is rebuilt."""
+        if str(REREAD_QUERY) == "True":
+            return "ERROR: Data is re-read on each query"
+        if not WATCHER.reload():
+            return f"RELOAD FAILED: {WATCHER.last_error}"
+        return (
+            f"RELOADED generation {WATCHER.generation} "
+            f"in {WATCHER.last_reload_ms:.2f}ms"
+        )
+
+    def ready_report(self) -> str:
+        """Answer the READY command with whether the data is loaded."""
+        if str(REREAD_QUERY) == "True":
+            if RELOADER.index is None:
+                return "WARMING"
+            return f"READY generation {RELOADER.generation}"
+        if WATCHER.engine is not None:
+            return f"READY generation {WATCHER.generation}"
+        if WATCHER.warming:
+            return f"WARMING {WATCHER.warming_seconds:.1f}s"
+        return f"NOT READY: {WATCHER.last_error}"
+
+    def may_block(self, session: ClientSession) -> bool:
+        """
+        Check whether answering the buffered data may wait on the data file.
+
+        That is a RELOAD, any query in reread mode, which checks the file
+        and loads it on first use, and a PREFIX or FIELD query before the
+        range index of the current generation is built. Commands are
+        matched anywhere in the buffer, so a false positive only costs a
+        thread switch.
+
+        Args:
+            session: The protocol state of the connection, with the
+                received data buffered
+
+        Returns:
+            True if the data should be answered off the event loop.
+        """
+        if str(REREAD_QUERY) == "True":
+            return True
+        buffer = session.buffer
+        if buffer.contains(RELOAD_COMMAND.encode()):
+            return True
+        field: bool = buffer.contains(FIELD_COMMAND.encode())
+        if not field and not buffer.contains(PREFIX_COMMAND.encode()):
+            return False
+        cached: Optional[Tuple[SearchIndex, RangeIndex]] = self._range_index
+        if cached is None or cached[0] is not WATCHER.engine:
+            return True
+        return field and not cached[1].fields_built
+
+    def new_session(self) -> ClientSession:
+        """Create the protocol state for a new connection."""
+        return ClientSession(
+            self.process_request,
+            MAX_PAYLOAD,
+            process_batch=self.process_batch,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_batch_payload_size=MAX_BATCH_PAYLOAD,
+            stats=self.stats_report,
+            reload=self.reload_report,
+            ready=self.ready_report,
+        )
 
     def _load_file_contents(self, path: str) -> Optional[List[str]]:
         """Thread-safe file loading with metrics"""
@@ -184,48 +588,367 @@ class StringSearchServer:
                 logger.error(f"Error loading file: {e}")
                 raise FileAccessError(f"Failed to load file: {str(e)}")
 
-    def _strip_exceeding_received_data(
-        self, sock: socket.socket, max_payload_size: int
-    ) -> Optional[bytes]:
+
+def gather_more(
+    session: ClientSession, nbytes: int, total: int, client_sock: Any
+) -> bool:
+    """
+    Check whether to read again before answering, as the first message of
+    a connection may be a single-shot query split in several pieces.
+
+    Args:
+        session: The protocol state of the connection
+        nbytes: The bytes received by the last read, 0 on end of stream
+        total: The bytes received since the last answer
+        client_sock: The client socket, or the socket under a transport
+
+    Returns:
+        True if the message is incomplete and more of it can be read
+        without waiting.
+    """
+    return bool(
+        not session.started
+        and nbytes
+        and total <= MAX_PAYLOAD
+        and not session.buffer.has_frame()
+        and _data_pending(client_sock)
+    )
+
+
+def _data_pending(client_sock: Union[socket.socket, ssl.SSLSocket]) -> bool:
+    """Check whether more data can be read from the socket without waiting."""
+    if isinstance(client_sock, ssl.SSLSocket) and client_sock.pending():
+        return True
+    readable, _, _ = select.select([client_sock], [], [], 0)
+    return bool(readable)
+
+
+class IdleConnections:
+    """
+    Persistent connections waiting for their next query, off the workers.
+
+    A single thread waits on all of them with a selector. A connection is
+    handed back to `resume` once it is readable, and closed once it has
+    been idle for `idle_timeout` seconds (0 = never), or at once after
+    `drain`.
+    """
+
+    def __init__(
+        self,
+        resume: Callable[[Tuple[Any, Tuple[str, int], ClientSession]], bool],
+        metrics: MetricsRegistry,
+        idle_timeout: float = IDLE_TIMEOUT,
+    ) -> None:
+        self.resume = resume
+        self.metrics: MetricsRegistry = metrics
+        self.idle_timeout: float = idle_timeout
+        self.selector: selectors.BaseSelector = selectors.DefaultSelector()
+        # Connections parked by the workers, registered by the idle thread
+        self._parked: List[Tuple[Any, Tuple[str, int], ClientSession]] = []
+        # Readable connections the full worker queue did not take yet
+        self._ready: List[Tuple[Any, Tuple[str, int], ClientSession]] = []
+        # (time parked, socket) in parking order, to find expired ones
+        self._expiry: Deque[Tuple[float, Any]] = collections.deque()
+        self._lock = threading.Lock()
+        self.draining: bool = False
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self.selector.register(self._wake_reader, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._run, name="idle", daemon=True)
+        self.thread.start()
+
+    def __len__(self) -> int:
+        return len(self.selector.get_map()) - 1 + len(self._parked) + len(self._ready)
+
+    def park(
+        self,
+        client_socket: Union[socket.socket, ssl.SSLSocket],
+        address: Tuple[str, int],
+        session: ClientSession,
+    ) -> None:
+        """Wait for the next query of a connection without holding a worker."""
+        with self._lock:
+            self._parked.append((client_socket, address, session))
+        self._wake()
+
+    def drain(self) -> None:
+        """Close the idle connections, resuming those with a query to read."""
+        self.draining = True
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            self._wake_writer.send(b"\0")
+        except BlockingIOError:
+            # A wake-up is already pending
+            pass
+
+    def _run(self) -> None:
+        """Resume readable connections and close expired ones, forever."""
+        while True:
+            timeout: Optional[float] = None
+            if self._ready or self.draining:
+                # Retry soon, once a worker took a queued connection
+                timeout = 0.01
+            elif self._expiry:
+                timeout = max(0.0, self._expiry[0][0] + self.idle_timeout - timer())
+            selected_at: float = timer()
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self._wake_reader:
+                    try:
+                        while self._wake_reader.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.selector.unregister(key.fileobj)
+                self._ready.append(key.data[1])
+            with self._lock:
+                parked, self._parked = self._parked, []
+            now: float = timer()
+            for connection in parked:
+                self.selector.register(
+                    connection[0], selectors.EVENT_READ, (now, connection)
+                )
+                if self.idle_timeout:
+                    self._expiry.append((now, connection[0]))
+            self._ready = [c for c in self._ready if not self.resume(c)]
+            if self.draining:
+                # Parked before the last select and still not readable
+                self._close_idle(selected_at)
+            else:
+                self._expire(now - self.idle_timeout)
+
+    def _close_idle(self, parked_before: float) -> None:
+        """Close the connections parked before the given time."""
+        for key in list(self.selector.get_map().values()):
+            if key.fileobj is not self._wake_reader and key.data[0] < parked_before:
+                self.selector.unregister(key.fileobj)
+                self._close(key.fileobj, key.data[1])
+
+    def _expire(self, deadline: float) -> None:
+        """Close the connections idle since before the deadline."""
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= deadline:
+            parked_at, client_socket = expiry.popleft()
+            try:
+                key: selectors.SelectorKey = self.selector.get_key(client_socket)
+            except (KeyError, ValueError):
+                # Resumed, and possibly closed, since
+                continue
+            if key.data[0] != parked_at:
+                # Resumed and parked again since
+                continue
+            self.selector.unregister(client_socket)
+            self._close(client_socket, key.data[1])
+
+    def _close(
+        self,
+        client_socket: Union[socket.socket, ssl.SSLSocket],
+        connection: Tuple[Any, Tuple[str, int], ClientSession],
+    ) -> None:
+        _, address, session = connection
+        logger.debug(
+            "Closing idle connection from %s after %d queries",
+            address,
+            session.queries,
+        )
+        self.metrics.gauges["active_connections"].dec()
+        client_socket.close()
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of worker threads fed by a bounded accept queue.
+
+    Accepted connections are queued for the workers instead of getting a
+    thread each. When the queue is full the connection is rejected with
+    the busy response, so bursts cannot create unbounded threads. Idle
+    persistent connections are parked in `IdleConnections` between
+    queries, so the workers bound the connections being served, not the
+    open ones.
+    """
+
+    def __init__(
+        self,
+        client_operation: StringSearchServer,
+        workers: int,
+        queue_size: int,
+        idle_timeout: float = IDLE_TIMEOUT,
+    ) -> None:
+        self.client_operation: StringSearchServer = client_operation
+        # A zero maxsize would make the queue unbounded
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.idle: IdleConnections = IdleConnections(
+            self._resume, client_operation.metrics, idle_timeout
+        )
+        self.threads: List[threading.Thread] = [
+            threading.Thread(target=self._run, name=f"worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(
+        self,
+        client_socket: Union[socket.socket, ssl.SSLSocket],
+        address: Tuple[str, int],
+    ) -> bool:
         """
-        Receive data from a socket connection with size validation.
+        Queue an accepted connection for the workers.
 
         Args:
-            sock: The socket connection
-            max_payload_size: The maximum allowed payload size in bytes
+            client_socket: The accepted client socket
+            address: The address of the client (ip, port)
 
         Returns:
-            The received data as bytes, or None if connection was closed
+            bool: False if the queue is full and the connection was not queued.
         """
         try:
-            data: str = sock.recv(max_payload_size).decode().strip()
-            if not data:
-                raise InvalidPayloadError("Empty payload received")
-            if len(data) > max_payload_size:
-                data = data.rstrip("\x00")
-            return data
-        except Exception as e:
-            logger.error(f"Error receiving data: {e}")
-            raise InvalidPayloadError from e
+            self.queue.put_nowait((client_socket, address, None))
+        except queue.Full:
+            return False
+        self.client_operation.metrics.gauges["queue_depth"].set(self.queue.qsize())
+        return True
+
+    def drain(self, timeout: float = DRAIN_TIMEOUT) -> bool:
+        """
+        Finish the queued and running requests and close idle connections.
+
+        New connections must no longer be submitted. Persistent connections
+        are closed once they wait for their next query.
+
+        Args:
+            timeout: Seconds to wait for the requests (0 = no limit)
+
+        Returns:
+            bool: True if every connection was served and closed in time.
+        """
+        self.idle.drain()
+        deadline: float = timer() + (timeout or float("inf"))
+        while timer() < deadline:
+            # A worker parks its connection before it finishes its task
+            if (
+                not self.queue.unfinished_tasks
+                and not len(self.idle)
+                and not self.queue.unfinished_tasks
+            ):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _resume(
+        self, connection: Tuple[Any, Tuple[str, int], ClientSession]
+    ) -> bool:
+        """Queue a parked connection with a query to read, if there is room."""
+        try:
+            self.queue.put_nowait(connection)
+        except queue.Full:
+            return False
+        self.client_operation.metrics.gauges["queue_depth"].set(self.queue.qsize())
+        return True
+
+    def reject(self, client_socket: Union[socket.socket, ssl.SSLSocket]) -> None:
+        """
+        Answer a connection that cannot be queued with the busy response.
+
+        This runs on the accept loop, so it never waits for the client: the
+        response is written without blocking, and TLS connections, whose
+        handshake has not run yet, are closed without an answer.
+        """
+        self.client_operation.metrics.inc("rejected_connections")
+        try:
+            if not isinstance(client_socket, ssl.SSLSocket):
+                # Fits in the empty send buffer of a new connection
+                client_socket.setblocking(False)
+                client_socket.send(BUSY_RESPONSE.encode())
+        except OSError as e:
+            logger.debug("Failed to send busy response: %s", e)
+        finally:
+            client_socket.close()
 
+    def _run(self) -> None:
+        """Serve queued connections until the process exits."""
+        queue_depth = self.client_operation.metrics.gauges["queue_depth"]
+        while True:
+            client_socket, address, session = self.queue.get()
+            queue_depth.set(self.queue.qsize())
+            try:
+                self.client_operation.handle_client(
+                    client_socket, address, session, self.idle.park
+                )
+            except Exception as e:
+                logger.error("Worker error: %s", e)
+            finally:
+                self.queue.task_done()
+
+
+def _dispatch(
+    pool: WorkerPool,
+    client_socket: Union[socket.socket, ssl.SSLSocket],
+    address: Tuple[str, int],
+) -> None:
+    """Queue an accepted connection for the worker pool, or shed load."""
+    logger.debug("Connection from %s", address)
+    # Bound the time a stalled client can hold a worker
+    client_socket.settimeout(CLIENT_TIMEOUT or None)
+    if not pool.submit(client_socket, address):
+        logger.warning("Accept queue full, rejecting %s", address)
+        pool.reject(client_socket)
+
+
+def configure_logging() -> BatchLogWriter:
+    """
+    Route the logs of the process through the asynchronous batch writer.
 
-def start_server(host: str, port: int, debug: bool) -> None:
+    Called by the entry point rather than on import, so importing the
+    server modules leaves the logging configuration alone.
+    """
+    return setup_logging(DEBUG, LOG_FILE, queue_size=LOG_QUEUE_SIZE)
+
+
+def start_server(
+    host: str,
+    port: int,
+    debug: bool,
+    reuse_port: bool = False,
+    client_operation: Optional[StringSearchServer] = None,
+    on_listening: Optional[Callable[[], None]] = None,
+    stop: Optional[threading.Event] = None,
+) -> None:
     """
     Start the server and handle incoming client connections.
 
+    Once `stop` is set, the connections already queued on the socket are
+    accepted, the socket is closed and the server returns after its
+    connections were served and closed, or `DRAIN_TIMEOUT` seconds.
+
     Args:
         host: The host address to bind to
         port: The port number to listen on
         debug: Whether to print debug information
+        reuse_port: Whether to share the port with other processes
+            (SO_REUSEPORT), as the pre-fork workers do
+        client_operation: The handler shared by the workers, created if None
+        on_listening: Called once connections are accepted and served
+        stop: Set to drain the connections and return, None to serve forever
     """
     try:
         sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Allow quick restarts while old connections are in TIME_WAIT
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         server_socket: Union[socket.socket, ssl.SSLSocket] = sock
 
         if SSL_ENABLED:
             # Wrap socket if ssl is enabled
             try:
-                server_socket = context.wrap_socket(sock, server_side=True)
+                # The handshake is done by the worker serving the connection
+                server_socket = server_context().wrap_socket(
+                    sock, server_side=True, do_handshake_on_connect=False
+                )
                 logger.info("SSL enabled connection")
             except Exception as e:
                 logger.error(f"SSL error: {e}")
@@ -235,45 +958,45 @@ def start_server(host: str, port: int, debug: bool) -> None:
         # Bind connection
         server_socket.bind((host, port))
         # Listent to requests from clients
-        server_socket.listen(5)
+        server_socket.listen(BACKLOG)
         logger.info(
             f"Server listening on {host}:{port} {'(DEBUG MODE)' if debug else ''}"
         )
 
-        while True:
+        # One handler shared by the workers
+        if client_operation is None:
+            client_operation = StringSearchServer()
+        # Load the data now that connections are accepted, and swap in a
+        # rebuilt engine when the data file changes
+        client_operation.start_loading()
+        pool: WorkerPool = WorkerPool(client_operation, WORKERS, QUEUE_SIZE)
+        if on_listening is not None:
+            on_listening()
+
+        while stop is None or not stop.is_set():
             try:
-                # Get connection details of the client making request
-                client_socket: Union[socket.socket, ssl.SSLSocket]
-                address: Tuple[str, int]
-                client_socket, address = server_socket.accept()
-                logger.debug(f"Connection from {address}")
-
-                # Create an instance of client operation class
-                client_operation: StringSearchServer = StringSearchServer()
-
-                # Update concurrency metrics
-                with threading.Lock():
-                    current_threads = (
-                        threading.active_count() - 1
-                    )  # Subtract main thread
-                    client_operation.performance_stats["max_concurrent"] = max(
-                        client_operation.performance_stats["max_concurrent"],
-                        current_threads,
-                    )
-                    logger.info(f"Current threads: {current_threads}")
-                    logger.info(
-                        f"Max concurrent: {client_operation.performance_stats['max_concurrent']}"
-                    )
-
-                # Implement threading to enable simultenous connections
-                client_thread: threading.Thread = threading.Thread(
-                    target=client_operation.handle_client, args=(client_socket, address)
-                )
-                client_thread.start()
-
+                if stop is not None and not select.select(
+                    [server_socket], [], [], STOP_POLL_INTERVAL
+                )[0]:
+                    continue
+                _dispatch(pool, *server_socket.accept())
             except Exception as e:
                 logger.error(f"Connection error: {e}")
                 raise
+
+        # Connections queued on a closed socket would be reset
+        server_socket.setblocking(False)
+        while True:
+            try:
+                _dispatch(pool, *server_socket.accept())
+            except BlockingIOError:
+                break
+        server_socket.close()
+        logger.info("Stopped accepting, draining the open connections")
+        if not pool.drain(DRAIN_TIMEOUT):
+            logger.warning(
+                f"Connections still open after {DRAIN_TIMEOUT}s, closing them"
+            )
     except Exception as e:
         logger.error(f"Server error: {e}")
         raise
@@ -0,0 +1,146 @@
+import configparser
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+from .utils import strip_line_end
+
+"""
+Hash partitioning of the data file for sharded deployments.
+
+Each line belongs to the shard `crc32(line) % shards`, a hash that is
+stable across processes and platforms, so the shard tool
+(`data/shard_data.py`) and the router agree on the owner of every query.
+Each shard is served by ordinary search servers (its replicas) started
+with their own config file, and the router fans queries out to them.
+"""
+
+# (host, port) of a server
+Address = Tuple[str, int]
+
+
+def shard_of(key: bytes, shards: int) -> int:
+    """Return the shard owning a line or query, given as UTF-8 bytes."""
+    return zlib.crc32(key) % shards
+
+
+def shard_path(data_file: str, output_dir: str, shard: int, shards: int) -> str:
+    """Path of one partition of the data file."""
+    stem, suffix = os.path.splitext(os.path.basename(data_file))
+    return os.path.join(output_dir, f"{stem}.shard{shard}of{shards}{suffix}")
+
+
+def split_file(data_file: str, shards: int, output_dir: str) -> List[Tuple[str, int]]:
+    """
+    Split a data file into hash partitions, streaming it line by line.
+
+    Args:
+        data_file: Path to the data file
+        shards: Number of partitions
+        output_dir: Directory the partitions are written to
+
+    Returns:
+        List[Tuple[str, int]]: The path and line count of each partition.
+
+    Raises:
+        ValueError: If the number of shards is not positive.
+    """
+    if shards < 1:
+        raise ValueError("The number of shards must be at least 1")
+    os.makedirs(output_dir, exist_ok=True)
+    paths: List[str] = [
+        shard_path(data_file, output_dir, shard, shards) for shard in range(shards)
+    ]
+    counts: List[int] = [0] * shards
+    outputs = [open(path, "wb") for path in paths]
+    try:
+        with open(data_file, "rb") as source:
+            for line in source:
+                key: bytes = strip_line_end(line)
+                if not key:
+                    continue
+                shard: int = shard_of(key, shards)
+                # A "\r" ending the key would be read as part of the line ending
+                outputs[shard].write(key + (b"\r\n" if key.endswith(b"\r") else b"\n"))
+                counts[shard] += 1
+    finally:
+        for output in outputs:
+            output.close()
+    return list(zip(paths, counts))
+
+
+def parse_shards(spec: str) -> List[List[Address]]:
+    """
+    Parse the `[ROUTER] SHARDS` setting.
+
+    Args:
+        spec: Shards separated by commas, each a list of `host:port`
+            replicas separated by |
+
+    Returns:
+        List[List[Address]]: The replica addresses of each shard, in order.
+
+    Raises:
+        ValueError: If an address is malformed or a shard has no replica.
+    """
+    shards: List[List[Address]] = []
+    for shard in spec.split(","):
+        replicas: List[Address] = []
+        for replica in shard.split("|"):
+            host, separator, port = replica.strip().rpartition(":")
+            if not separator or not host or not port.isdigit():
+                raise ValueError(f"Invalid shard address '{replica.strip()}'")
+            replicas.append((host, int(port)))
+        shards.append(replicas)
+    return shards
+
+
+def format_shards(shards: List[List[Address]]) -> str:
+    """Format shard addresses as the `[ROUTER] SHARDS` setting."""
+    return ", ".join(
+        "|".join(f"{host}:{port}" for host, port in replicas) for replicas in shards
+    )
+
+
+def write_instance_config(
+    base_config: str,
+    config_path: str,
+    port: int,
+    data_file: Optional[str] = None,
+    shards: Optional[List[List[Address]]] = None,
+) -> None:
+    """
+    Write the config file of one instance, derived from a base config.
+
+    Args:
+        base_config: Path to the config file to start from
+        config_path: Path of the config file to write
+        port: Port the instance listens on
+        data_file: Partition served by a shard server, with its own index
+            and filter files
+        shards: Shard addresses, for the router
+    """
+    config: configparser.ConfigParser = configparser.ConfigParser(interpolation=None)
+    config.optionxform = str  # keep the option names as written
+    config.read(base_config)
+    for section in ("SERVER", "FILES", "ROUTER"):
+        if not config.has_section(section):
+            config.add_section(section)
+    config.set("SERVER", "PORT", str(port))
+    if data_file is not None:
+        data_file = os.path.abspath(data_file)
+        stem: str = os.path.splitext(data_file)[0]
+        config.set("SERVER", "ROLE", "search")
+        config.set("FILES", "linuxpath", data_file)
+        config.set("FILES", "INDEX_FILE", f"{stem}.idx")
+        config.set("FILES", "BLOOM_FILE", f"{stem}.bloom")
+    if shards is not None:
+        config.set("SERVER", "ROLE", "router")
+        config.set("ROUTER", "SHARDS", format_shards(shards))
+        config.set(
+            "ROUTER",
+            "SHARD_SSL",
+            config.get("SSL", "SSL_ENABLED", fallback="False"),
+        )
+    with open(config_path, "w") as f:
+        config.write(f)
@@ -0,0 +1,79 @@
+import ssl
+from typing import Optional, Union
+
+from .metrics import MetricsRegistry
+
+"""
+Server TLS context tuned for short connections.
+
+A full handshake costs far more than a query, so clients that reconnect
+should resume their session instead: with session tickets (TLS 1.2 and
+1.3) the session state travels with the client, and with session IDs
+(TLS 1.2) it is kept in the server's session cache. Ticket keys belong to
+the context, which is created before the pre-fork workers start, so a
+ticket issued by one worker is accepted by all of them; the session ID
+cache is per process.
+"""
+
+
+def create_server_context(
+    cert_file: str,
+    key_file: str,
+    ciphers: str = "",
+    ecdh_curve: str = "",
+    session_tickets: bool = True,
+    num_tickets: int = 2,
+) -> ssl.SSLContext:
+    """
+    Create the server TLS context.
+
+    Args:
+        cert_file: Path to the server certificate
+        key_file: Path to the server private key
+        ciphers: OpenSSL cipher list for TLS 1.2 (TLS 1.3 suites are not
+            configurable), empty for the library default
+        ecdh_curve: Key exchange curve such as X25519 or prime256v1, empty
+            for the library default
+        session_tickets: Whether to issue session tickets for resumption
+        num_tickets: Tickets sent after a TLS 1.3 handshake
+
+    Returns:
+        ssl.SSLContext: The context wrapping the listening socket.
+
+    Raises:
+        ssl.SSLError: If no cipher matches the cipher list.
+        ValueError: If the curve is unknown.
+    """
+    context: ssl.SSLContext = ssl._create_unverified_context(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    if ciphers:
+        context.set_ciphers(ciphers)
+    if ecdh_curve:
+        context.set_ecdh_curve(ecdh_curve)
+    if session_tickets:
+        context.num_tickets = num_tickets
+    else:
+        context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = 0
+    return context
+
+
+def record_handshake(
+    metrics: MetricsRegistry,
+    ssl_object: Optional[Union[ssl.SSLSocket, ssl.SSLObject]],
+    seconds: Optional[float] = None,
+) -> None:
+    """
+    Count a completed handshake as full or resumed, with its duration.
+
+    Args:
+        metrics: The registry to record into
+        ssl_object: The TLS socket or object of the connection
+        seconds: How long the handshake took, if measured
+    """
+    if ssl_object is None:
+        return
+    resumed: bool = ssl_object.session_reused
+    metrics.inc("tls_resumed" if resumed else "tls_handshakes")
+    if seconds is not None:
+        metrics.record("tls_resumed" if resumed else "tls", seconds)
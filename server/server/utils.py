@@ -4,6 +4,60 @@ import logging
 logger = logging.getLogger("string_match_server")
 
 
+def split_lines(text: str) -> List[str]:
+    """
+    Split the text of a data file into its non-empty lines.
+
+    Lines end at "\n" only, and a "\r" just before it is dropped: the same
+    rule as `split_byte_lines` and `strip_line_end` for the readers working
+    on the raw bytes, unlike `str.splitlines`, which also breaks at "\r",
+    "\x1c" or "\u2028" inside a record.
+
+    Args:
+        text (str): The decoded file contents.
+
+    Returns:
+        List[str]: The non-empty lines, in file order.
+    """
+    lines: List[str] = text.split("\n")
+    if "\r" in text:
+        lines = [line[:-1] if line.endswith("\r") else line for line in lines]
+    return [line for line in lines if line]
+
+
+def strip_line_end(line: bytes) -> bytes:
+    """
+    Drop the line ending of a raw line: its "\n" and one "\r" before it.
+
+    Args:
+        line (bytes): A line as read from the file, with or without "\n".
+
+    Returns:
+        bytes: The line as searched, the same key as from `split_lines`.
+    """
+    if line.endswith(b"\n"):
+        line = line[:-1]
+    if line.endswith(b"\r"):
+        line = line[:-1]
+    return line
+
+
+def split_byte_lines(data: bytes) -> List[bytes]:
+    """
+    Split the raw contents of a data file into its non-empty lines.
+
+    Args:
+        data (bytes): The file contents.
+
+    Returns:
+        List[bytes]: The non-empty lines, in file order, without line endings.
+    """
+    lines: List[bytes] = data.split(b"\n")
+    if b"\r" in data:
+        lines = [strip_line_end(line) for line in lines]
+    return [line for line in lines if line]
+
+
 def reread_file(file_path: str) -> Optional[List[str]]:
     """
     Reads a file each line and returns a list of stripped lines.
@@ -15,9 +69,9 @@ def reread_file(file_path: str) -> Optional[List[str]]:
         Optional[List[str]]: List of lines in the file, or None on failure.
     """
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.read().splitlines()
-            return [line for line in lines if line]  # filter out empty lines
+        # No newline translation, so a lone "\r" stays part of its line
+        with open(file_path, "r", encoding="utf-8", newline="") as f:
+            return split_lines(f.read())
     except FileNotFoundError:
         logger.error(f"File not found: {file_path}")
     except Exception as e:
@@ -0,0 +1,46 @@
+import socket
+import threading
+import time
+import pytest
+
+from server.server import server as server_module
+
+
+def free_port():
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+def wait_for(port):
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+@pytest.fixture
+def unused_port():
+    """A port nothing listens on"""
+    return free_port()
+
+@pytest.fixture(scope="session")
+def start_server():
+    """Start a threaded server on a free port and return the port"""
+
+    def start(ssl_enabled=False, client_operation=None):
+        port = free_port()
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(server_module, "SSL_ENABLED", ssl_enabled)
+            threading.Thread(
+                target=server_module.start_server,
+                args=("127.0.0.1", port, False),
+                kwargs={"client_operation": client_operation},
+                daemon=True,
+            ).start()
+            wait_for(port)
+        return port
+
+    return start
@@ -0,0 +1,403 @@
+import argparse
+import json
+import os
+import random
+import socket
+import ssl
+import sys
+import threading
+import time
+from timeit import default_timer as timer
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from server.server.metrics import PERCENTILES, Histogram
+
+"""
+Standalone load generator for the string search server.
+
+Runs from the repository root with the standard library only:
+
+    python -m tests.load_generator --port 8080 --tls --connections 8
+    python -m tests.load_generator --mode open --rate 2000 --connect-per-query
+
+Closed loop: every connection sends its next query as soon as the previous
+one is answered, measuring the throughput the server sustains. Open loop:
+queries arrive at a fixed total rate whatever the server does. Latency is
+then measured from the time each query was due, not from when it was
+sent, so a stalled server is charged for the queries that queued up
+behind the stall (coordinated omission); the time from send to answer is
+reported separately as the service time.
+
+Queries are drawn from a data file with the given share of hits; misses
+are lines of the file with one field changed, so they look like real
+queries. Latencies are kept in HDR histograms in constant memory.
+"""
+
+BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_FILE: str = os.path.join(BASE_DIR, "data", "200k.txt")
+RESPONSES: Dict[str, bool] = {"STRING EXISTS": True, "STRING NOT EXIST": False}
+# Distinct queries of each kind drawn from the data file
+QUERY_POOL_SIZE: int = 10000
+MAX_PAYLOAD: int = 1024
+
+Query = Tuple[str, bool]
+
+
+def load_queries(
+    data_file: str,
+    hit_ratio: float,
+    pool_size: int = QUERY_POOL_SIZE,
+    seed: Optional[int] = None,
+) -> List[Query]:
+    """
+    Build the query mix from the lines of a data file.
+
+    Args:
+        data_file: Path to the data file the server searches
+        hit_ratio: Share of queries that exist in the file, from 0 to 1
+        pool_size: Number of queries to build
+        seed: Seed of the random generator, for repeatable runs
+
+    Returns:
+        List[Query]: Shuffled (query, expected to exist) pairs.
+    """
+    if not 0 <= hit_ratio <= 1:
+        raise ValueError(f"Hit ratio must be between 0 and 1: {hit_ratio}")
+    with open(data_file, "r", encoding="utf-8") as f:
+        lines: List[str] = sorted({line.strip() for line in f if line.strip()})
+    if not lines:
+        raise ValueError(f"No queries in data file {data_file}")
+    members = set(lines)
+    rng = random.Random(seed)
+    hits: int = round(pool_size * hit_ratio)
+    queries: List[Query] = [(rng.choice(lines), True) for _ in range(hits)]
+    while len(queries) < pool_size:
+        fields: List[str] = rng.choice(lines).split(";")
+        fields[rng.randrange(len(fields))] = str(rng.randrange(1000, 1000000))
+        miss: str = ";".join(fields)
+        if miss not in members:
+            queries.append((miss, False))
+    rng.shuffle(queries)
+    return queries
+
+
+class LoadResult:
+    """Histograms and counters shared by the load generator threads."""
+
+    def __init__(self) -> None:
+        # From the time a query was due to its answer
+        self.response: Histogram = Histogram()
+        # From the time a query was sent to its answer
+        self.service: Histogram = Histogram()
+        self.errors: int = 0
+        self.unexpected: int = 0
+        self.elapsed: float = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, due: float, sent: float, done: float) -> None:
+        self.response.record(done - due)
+        self.service.record(done - sent)
+
+    def count_error(self, unexpected: bool = False) -> None:
+        with self._lock:
+            if unexpected:
+                self.unexpected += 1
+            else:
+                self.errors += 1
+
+    @property
+    def requests(self) -> int:
+        return self.service.snapshot().count
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarize the run, with latencies in microseconds."""
+        requests: int = self.requests
+        return {
+            "requests": requests,
+            "errors": self.errors,
+            "unexpected_answers": self.unexpected,
+            "elapsed_s": round(self.elapsed, 3),
+            "requests_per_sec": (
+                round(requests / self.elapsed, 1) if self.elapsed else 0.0
+            ),
+            "response_us": self.response.snapshot().to_dict(),
+            "service_us": self.service.snapshot().to_dict(),
+        }
+
+
+class Connection:
+    """
+    Client connection sending one query at a time.
+
+    With `reuse`, queries are sent newline-terminated over one persistent
+    connection; otherwise every query opens its own single-shot connection.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        context: Optional[ssl.SSLContext],
+        reuse: bool,
+        timeout: float,
+        resume: bool = False,
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.context: Optional[ssl.SSLContext] = context
+        self.reuse: bool = reuse
+        self.timeout: float = timeout
+        # TLS session offered again on the next connection
+        self.resume: bool = resume
+        self._session: Optional[ssl.SSLSession] = None
+        self._sock: Optional[Union[socket.socket, ssl.SSLSocket]] = None
+        self._buffer: bytes = b""
+
+    def _connect(self) -> Union[socket.socket, ssl.SSLSocket]:
+        sock: Union[socket.socket, ssl.SSLSocket] = socket.create_connection(
+            (self.host, self.port), timeout=self.timeout
+        )
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.context is not None:
+            sock = self.context.wrap_socket(
+                sock, server_hostname=self.host, session=self._session
+            )
+        return sock
+
+    def query(self, query: str) -> str:
+        """Send a query and return the answer."""
+        if not self.reuse:
+            with self._connect() as sock:
+                sock.sendall(query.encode())
+                chunks: List[bytes] = []
+                while True:
+                    chunk: bytes = sock.recv(MAX_PAYLOAD)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                if self.resume and isinstance(sock, ssl.SSLSocket):
+                    # TLS 1.3 tickets arrive after the handshake, so the
+                    # session is taken once the answer has been read
+                    self._session = sock.session
+                return b"".join(chunks).decode()
+        if self._sock is None:
+            self._sock = self._connect()
+            self._buffer = b""
+        self._sock.sendall(query.encode() + b"\n")
+        while b"\n" not in self._buffer:
+            chunk = self._sock.recv(MAX_PAYLOAD)
+            if not chunk:
+                raise ConnectionError("Connection closed by the server")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode()
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def _worker(
+    connection: Connection,
+    queries: List[Query],
+    result: LoadResult,
+    start: float,
+    end: float,
+    worker: int,
+    workers: int,
+    rate: float,
+) -> None:
+    """
+    Send queries until the end of the run.
+
+    In open loop (rate > 0) the workers take turns: worker w sends the
+    queries due at start + k / rate for k = w, w + workers, ...
+    """
+    arrival: int = worker
+    rng = random.Random(worker)
+    while True:
+        if rate > 0:
+            due: float = start + arrival / rate
+            arrival += workers
+            if due >= end:
+                break
+            delay: float = due - timer()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            due = timer()
+            if due >= end:
+                break
+        query, expected = queries[rng.randrange(len(queries))]
+        sent: float = timer()
+        try:
+            answer: str = connection.query(query)
+        except (OSError, ConnectionError, UnicodeDecodeError):
+            connection.close()
+            result.count_error()
+            continue
+        result.record(due, sent, timer())
+        if RESPONSES.get(answer) is not expected:
+            result.count_error(unexpected=True)
+    connection.close()
+
+
+def run_load(
+    host: str,
+    port: int,
+    queries: List[Query],
+    duration: float,
+    connections: int = 1,
+    rate: float = 0.0,
+    reuse: bool = True,
+    tls: bool = False,
+    timeout: float = 5.0,
+    resume: bool = False,
+) -> LoadResult:
+    """
+    Run a closed-loop (rate 0) or open-loop (rate > 0) load test.
+
+    Args:
+        host: Server address
+        port: Server port
+        queries: The query mix, from `load_queries`
+        duration: Seconds to send queries for
+        connections: Number of concurrent connections
+        rate: Total queries per second in open loop, 0 for closed loop
+        reuse: Whether to reuse persistent connections or connect per query
+        tls: Whether to connect with TLS
+        timeout: Socket timeout in seconds
+        resume: Whether to resume the previous TLS session when connecting
+            per query
+
+    Returns:
+        LoadResult: The latency histograms and error counts.
+    """
+    context: Optional[ssl.SSLContext] = None
+    if tls:
+        # The server certificate is self-signed
+        context = ssl._create_unverified_context()
+    result: LoadResult = LoadResult()
+    start: float = timer()
+    threads: List[threading.Thread] = [
+        threading.Thread(
+            target=_worker,
+            args=(
+                Connection(host, port, context, reuse, timeout, resume),
+                queries,
+                result,
+                start,
+                start + duration,
+                worker,
+                connections,
+                rate,
+            ),
+            daemon=True,
+        )
+        for worker in range(connections)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = timer() - start
+    return result
+
+
+def format_summary(summary: Dict[str, Any], open_loop: bool) -> str:
+    """Render a run summary as a table of latency percentiles."""
+    columns: List[str] = ["count", "mean"] + [name for name, _ in PERCENTILES] + ["max"]
+    lines: List[str] = [
+        f"Requests: {summary['requests']} in {summary['elapsed_s']}s "
+        f"({summary['requests_per_sec']}/s), errors: {summary['errors']}, "
+        f"unexpected answers: {summary['unexpected_answers']}",
+        f"{'Latency (us)':<14}" + "".join(f"{column:>10}" for column in columns),
+    ]
+    rows: List[Tuple[str, str]] = [("service", "service_us")]
+    if open_loop:
+        rows.insert(0, ("response", "response_us"))
+    for label, key in rows:
+        lines.append(
+            f"{label:<14}" + "".join(f"{summary[key][column]:>10}" for column in columns)
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load generator for the string search server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tls", action="store_true", help="connect with TLS")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="resume the previous TLS session on each new connection",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=("closed", "open"),
+        default="closed",
+        help="closed loop, or open loop at a fixed arrival rate",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=1000.0, help="queries/s in open loop"
+    )
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument(
+        "--connect-per-query",
+        action="store_true",
+        help="open a single-shot connection per query instead of reusing one",
+    )
+    parser.add_argument("--data", default=DEFAULT_DATA_FILE, help="data file")
+    parser.add_argument(
+        "--hit-ratio", type=float, default=0.5, help="share of existing strings"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=5.0, help="socket timeout")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args: argparse.Namespace = parser.parse_args(argv)
+    if args.connections < 1:
+        parser.error("--connections must be at least 1")
+    if args.mode == "open" and args.rate <= 0:
+        parser.error("--rate must be positive in open loop")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args: argparse.Namespace = parse_args(argv)
+    queries: List[Query] = load_queries(args.data, args.hit_ratio, seed=args.seed)
+    open_loop: bool = args.mode == "open"
+    print(
+        f"Load test: {args.mode} loop"
+        f"{f' at {args.rate:g}/s' if open_loop else ''}, "
+        f"{args.connections} connections, "
+        f"{'connect per query' if args.connect_per_query else 'reused connections'}, "
+        f"TLS {'on' if args.tls else 'off'}{' (resumed)' if args.resume else ''}, "
+        f"{args.hit_ratio:.0%} hits, "
+        f"{args.duration:g}s against {args.host}:{args.port}",
+        file=sys.stderr,
+    )
+    result: LoadResult = run_load(
+        args.host,
+        args.port,
+        queries,
+        args.duration,
+        connections=args.connections,
+        rate=args.rate if open_loop else 0.0,
+        reuse=not args.connect_per_query,
+        tls=args.tls,
+        timeout=args.timeout,
+        resume=args.resume,
+    )
+    summary: Dict[str, Any] = result.summary()
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(format_summary(summary, open_loop))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
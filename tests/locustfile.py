@@ -1,3 +1,4 @@
+import os
 import socket
 import ssl
 import random
@@ -6,12 +7,10 @@ from typing import List
 
 from locust import User, task, between
 
-# Configuration
-HOST = "127.0.0.1"
-PORT = 8080
-USE_SSL = True
-CERT_FILE = "../security/server.crt"
-KEY_FILE = "../security/server.key"
+# Configuration, overridable from the environment
+HOST = os.environ.get("SEARCH_HOST", "127.0.0.1")
+PORT = int(os.environ.get("SEARCH_PORT", "8080"))
+USE_SSL = os.environ.get("SEARCH_SSL", "1") not in ("0", "false", "False")
 MAX_PAYLOAD = 1024
 
 
@@ -57,9 +56,6 @@ def create_test_string() -> List[str]:
 
 TEST_STRINGS: List[str] = create_test_string()
 
-not_found: List[str] = []
-found: List[str] = []
-
 """
    A class for a socket client that can connect to a server, send and receive messages, and close the connection.
    - `connect()`: Establishes a connection to the server.
@@ -106,27 +102,23 @@ class SocketUser(User):
     @task
     def search_string(self) -> None:
         query: str = random.choice(TEST_STRINGS)
-        start_time: float = time.time()
+        start_time: float = time.perf_counter()
+        response: str = ""
+        exception = None
         try:
             self.client.connect()
             response = self.client.send_and_receive(query)
-            total_time: float = (time.time() - start_time) * 1000  # ms
-
-            # Use simple logging instead of events API
-            if response in ["STRING EXISTS", "STRING NOT EXIST"]:
-                print(f"Success: {query} -> {response} ({total_time:.2f}ms)")
-                if response == "STRING EXISTS":
-                    found.append(query)
-                else:
-                    not_found.append(query)
-                print(f"Found: {len(found)}")
-                print(f"Not Found: {len(not_found)}")
-                print(f"Total: {len(found) + len(not_found)}")
-
-            else:
+            if response not in ["STRING EXISTS", "STRING NOT EXIST"]:
                 raise ValueError(f"Unexpected response: {response}")
         except Exception as e:
-            total_time = (time.time() - start_time) * 1000
-            print(f"Error: {query} -> {str(e)} ({total_time:.2f}ms)")
+            exception = e
         finally:
             self.client.close()
+        # Report to Locust's statistics instead of printing every query
+        self.environment.events.request.fire(
+            request_type="TCP",
+            name=response if exception is None else "search",
+            response_time=(time.perf_counter() - start_time) * 1000,
+            response_length=len(response),
+            exception=exception,
+        )
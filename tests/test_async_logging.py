@@ -0,0 +1,74 @@
+import logging
+import os
+import subprocess
+import sys
+from server.server.async_logging import BatchLogWriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Unprintable:
+    formatted = 0
+
+    def __str__(self):
+        Unprintable.formatted += 1
+        return "formatted"
+
+
+def test_writer_batches_records_to_file(tmp_path):
+    """Queued records are formatted by the writer and appended to the file"""
+    log_file = tmp_path / "server.log"
+    writer = BatchLogWriter(str(log_file), batch_size=2)
+    writer.start()
+    logger = logging.getLogger("test_async_logging.file")
+    logger.propagate = False
+    logger.addHandler(writer.handler)
+    logger.setLevel(logging.INFO)
+    for i in range(5):
+        logger.info("query %d", i)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    writer.stop()
+    content = log_file.read_text()
+    assert [f"query {i}" in content for i in range(5)] == [True] * 5
+    assert "ValueError: boom" in content
+
+def test_disabled_level_is_not_formatted():
+    """Arguments of records below the logger level are never formatted"""
+    writer = BatchLogWriter()
+    logger = logging.getLogger("test_async_logging.level")
+    logger.propagate = False
+    logger.addHandler(writer.handler)
+    logger.setLevel(logging.INFO)
+    logger.debug("value %s", Unprintable())
+    assert writer.handler.queue.empty()
+    assert Unprintable.formatted == 0
+
+def test_full_queue_drops_and_reports_records(tmp_path):
+    """Records over the queue size are dropped, and the loss is logged"""
+    log_file = tmp_path / "server.log"
+    writer = BatchLogWriter(str(log_file), queue_size=3)
+    logger = logging.getLogger("test_async_logging.full")
+    logger.propagate = False
+    logger.addHandler(writer.handler)
+    logger.setLevel(logging.INFO)
+    # Not started yet, so nothing drains the queue
+    for i in range(5):
+        logger.info("query %d", i)
+    writer.start()
+    writer.stop()
+    content = log_file.read_text()
+    assert [f"query {i}" in content for i in range(5)] == [True] * 3 + [False] * 2
+    assert "Log queue full, 2 records dropped" in content
+
+def test_importing_the_server_leaves_logging_alone():
+    """Only the entry point installs the batch writer"""
+    script = (
+        "import logging\n"
+        "handlers = list(logging.getLogger().handlers)\n"
+        "import server.server.server\n"
+        "assert logging.getLogger().handlers == handlers\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True)
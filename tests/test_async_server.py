@@ -0,0 +1,139 @@
+import asyncio
+import os
+import socket
+import ssl
+import threading
+from server.server import server as server_module
+from server.server.async_server import AsyncStringSearchServer
+from server.server.index import StringIndex
+from server.server.reloader import EngineWatcher
+from server.server.server import WATCHER, StringSearchServer
+from server.server.tls import create_server_context
+
+EXISTING = "3;0;1;28;0;7;5;0;"
+SECURITY_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "security"
+)
+
+
+async def query(port, message):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(message.encode())
+    await writer.drain()
+    response = await reader.read(1024)
+    writer.close()
+    return response.decode()
+
+async def run_queries(search_server, messages):
+    # As `serve` does, load the data once the port is bound
+    WATCHER.wait_ready(None)
+    server = await asyncio.start_server(search_server.handle_client, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        return [await query(port, message) for message in messages]
+
+def test_async_engine_answers_queries():
+    """The asyncio engine speaks the same protocol as the threaded one"""
+    responses = asyncio.run(
+        run_queries(AsyncStringSearchServer(), [EXISTING, "0;0;0;0;", "  "])
+    )
+    assert responses == [
+        "STRING EXISTS",
+        "STRING NOT EXIST",
+        "ERROR: Empty payload received",
+    ]
+
+def test_async_engine_rejects_over_connection_limit():
+    """Connections over the limit get the busy response"""
+    responses = asyncio.run(
+        run_queries(AsyncStringSearchServer(max_connections=0), [EXISTING])
+    )
+    assert responses == ["SERVER BUSY"]
+
+def test_reload_does_not_block_other_connections(tmp_path, monkeypatch):
+    """A slow RELOAD runs off the event loop while queries are answered"""
+    data_file = tmp_path / "data.txt"
+    data_file.write_text("1;0;1;\n")
+    release = threading.Event()
+    builds = iter([StringIndex(["1;0;1;"]), StringIndex(["2;0;2;"])])
+    # The first build is immediate, the reload waits for the release
+    watcher = EngineWatcher(
+        str(data_file),
+        lambda: (watcher.engine is None or release.wait(5)) and next(builds),
+    )
+    watcher.reload()
+    monkeypatch.setattr(server_module, "WATCHER", watcher)
+
+    async def scenario():
+        search_server = AsyncStringSearchServer()
+        server = await asyncio.start_server(search_server.handle_client, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"RELOAD\n")
+            await writer.drain()
+            answer = await asyncio.wait_for(query(port, "1;0;1;"), 5)
+            release.set()
+            reloaded = await asyncio.wait_for(reader.readline(), 5)
+            # Let the handler see the end of stream before the loop stops
+            writer.write_eof()
+            await reader.read()
+            writer.close()
+            return answer, reloaded.decode()
+
+    answer, reloaded = asyncio.run(scenario())
+    assert answer == "STRING EXISTS"
+    assert reloaded.startswith("RELOADED generation 2 ")
+
+def test_single_shot_query_split_in_pieces_is_gathered():
+    """The rest of a query already received is read before it is answered"""
+    search_server = AsyncStringSearchServer()
+
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(EXISTING[:5].encode())
+        # The rest is waiting on the socket, read by the "transport" later
+        client, sock = socket.socketpair()
+        client.sendall(EXISTING[5:].encode())
+        asyncio.get_running_loop().call_later(
+            0.05, lambda: reader.feed_data(sock.recv(1024))
+        )
+        session = search_server.search_server.new_session()
+        try:
+            nbytes = await search_server._receive(reader, sock, session)
+        finally:
+            client.close()
+            sock.close()
+        return nbytes, session.process(eof=False)
+
+    WATCHER.wait_ready(None)
+    nbytes, response = asyncio.run(scenario())
+    assert nbytes == len(EXISTING)
+    assert response == b"STRING EXISTS"
+
+def test_tls_handshakes_are_timed():
+    """The handler runs the handshake, so STATS reports its latency"""
+    context = create_server_context(
+        os.path.join(SECURITY_DIR, "server.crt"),
+        os.path.join(SECURITY_DIR, "server.key"),
+    )
+    search_server = AsyncStringSearchServer(search_server=StringSearchServer())
+
+    async def scenario():
+        search_server.ssl_context = context
+        server = await asyncio.start_server(search_server.handle_client, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection(
+                "127.0.0.1", port, ssl=ssl._create_unverified_context()
+            )
+            writer.write(EXISTING.encode())
+            response = await reader.read(1024)
+            writer.close()
+            return response.decode()
+
+    WATCHER.wait_ready(None)
+    assert asyncio.run(scenario()) == "STRING EXISTS"
+    snapshot = search_server.search_server.metrics.snapshot()
+    assert snapshot["counters"]["tls_handshakes"] == 1
+    assert snapshot["latency_us"]["tls"]["count"] == 1
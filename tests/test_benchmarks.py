@@ -0,0 +1,197 @@
+import os
+import random
+import socket
+import ssl
+import time
+import tracemalloc
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from server.server import server as server_module
+from server.server import utils
+from server.server.search_algorithms import (
+    binary_search,
+    exponential_search,
+    jump_search,
+    linear_search,
+    search_in_set,
+)
+from server.server.search_engines import SEARCH_ENGINES, build_engine
+
+"""
+Benchmarks of the search algorithms, data loading, engine builds and the
+running server.
+
+    pytest tests/test_benchmarks.py --benchmark-only --benchmark-autosave
+    pytest tests/test_benchmarks.py --benchmark-only \
+        --benchmark-compare --benchmark-compare-fail=mean:10%
+
+Results are saved as JSON under .benchmarks/ (or to a given file with
+--benchmark-json=PATH); peak memory, requests/sec and latency
+percentiles are stored in the "extra_info" of each benchmark.
+"""
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_SIZES = ["10k", "50k", "100k", "200k"]
+ALGORITHMS = [linear_search, binary_search, jump_search, exponential_search, search_in_set]
+MISSING = "0;0;0;0;0;0;0;0;"
+# One name per engine class, skipping aliases
+ENGINES = sorted({engine.name for engine in SEARCH_ENGINES.values()})
+# Queries per end-to-end latency sample
+SERVER_QUERIES = 2000
+# Distinct strings of the skewed query traffic in front of the result cache
+HOT_QUERIES = 1000
+
+_data_cache = {}
+
+
+def data_path(size):
+    return os.path.join(BASE_DIR, "data", f"{size}.txt")
+
+def load(size):
+    """Return the lines of a data file, unique and sorted, read once per run"""
+    if size not in _data_cache:
+        lines = sorted(set(utils.reread_file(data_path(size))))
+        _data_cache[size] = (lines, frozenset(lines))
+    return _data_cache[size]
+
+def percentiles(latencies):
+    """p50/p95/p99/p999 of latencies in seconds, in microseconds"""
+    ordered = sorted(latencies)
+    return {
+        name: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6, 1)
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+    }
+
+
+@pytest.mark.parametrize("size", DATA_SIZES)
+@pytest.mark.parametrize("case", ["hit", "miss"])
+@pytest.mark.parametrize("algorithm", ALGORITHMS, ids=lambda a: a.__name__)
+def test_algorithm(benchmark, algorithm, size, case):
+    """Lookup time of each algorithm against each data file"""
+    lines, members = load(size)
+    content = members if algorithm is search_in_set else lines
+    # A hit in the middle of the sorted lines, as a typical case for the scans
+    query = lines[len(lines) // 2] if case == "hit" else MISSING
+    benchmark.group = f"algorithm-{size}-{case}"
+    assert bool(benchmark(algorithm, query, content)) == (case == "hit")
+
+
+@pytest.mark.parametrize("size", DATA_SIZES)
+def test_file_load(benchmark, size):
+    """Time and peak memory of reading a data file with utils.reread_file"""
+    tracemalloc.start()
+    lines = utils.reread_file(data_path(size))
+    benchmark.extra_info["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    benchmark.group = "file-load"
+    assert benchmark(utils.reread_file, data_path(size)) == lines
+
+
+@pytest.mark.parametrize("size", DATA_SIZES)
+@pytest.mark.parametrize("name", ENGINES)
+def test_engine_build(benchmark, name, size):
+    """Build time and peak memory of each search engine"""
+    tracemalloc.start()
+    engine = build_engine(name, data_path(size))
+    benchmark.extra_info["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    benchmark.extra_info.update(engine.describe())
+    benchmark.group = f"engine-build-{size}"
+    # No saved index or filter files, so every round builds from scratch
+    benchmark.pedantic(build_engine, args=(name, data_path(size)), rounds=3)
+
+
+class EngineServer(server_module.StringSearchServer):
+    """The request handler, searching a given engine instead of the data file"""
+
+    def __init__(self, engine, result_cache_size):
+        super().__init__(result_cache_size=result_cache_size)
+        self.engine = engine
+
+    def _current_index(self):
+        return self.engine
+
+
+@pytest.mark.parametrize("cache_size", [0, 10000], ids=["no-cache", "cache"])
+@pytest.mark.parametrize("name", ["set", "bisect", "linear"])
+def test_result_cache(benchmark, name, cache_size):
+    """Per-query cost of the result cache in front of each engine, on skewed traffic"""
+    engine = build_engine(name, data_path("200k"))
+    lines, _ = load("200k")
+    rng = random.Random(1)
+    hot = rng.sample(lines, HOT_QUERIES - 1) + [MISSING]
+    # Zipf-like popularity, as the cache assumes
+    queries = rng.choices(
+        hot, weights=[1 / rank for rank in range(1, len(hot) + 1)], k=SERVER_QUERIES
+    )
+    handler = EngineServer(engine, cache_size)
+
+    def run():
+        return [handler.process_request(query) for query in queries]
+
+    benchmark.group = f"result-cache-{name}"
+    responses = benchmark(run)
+    if benchmark.stats:
+        benchmark.extra_info["us_per_query"] = round(
+            benchmark.stats["mean"] / len(queries) * 1e6, 2
+        )
+    assert responses.count(server_module.NOT_FOUND_RESPONSE) == queries.count(MISSING)
+
+
+@pytest.fixture(scope="module", params=["plain", "tls"])
+def server_address(request, start_server):
+    """Start the threaded server on a free port, with or without TLS"""
+    return request.param, start_server(ssl_enabled=request.param == "tls")
+
+def connect(mode, port):
+    sock = socket.create_connection(("127.0.0.1", port))
+    if mode == "tls":
+        sock = ssl._create_unverified_context().wrap_socket(sock)
+    return sock
+
+def test_server_persistent(benchmark, server_address):
+    """Requests/sec and latency of queries on one persistent connection"""
+    mode, port = server_address
+    lines, _ = load("200k")
+    queries = [(lines[i % len(lines)] + "\n").encode() for i in range(SERVER_QUERIES)]
+    sock = connect(mode, port)
+    reader = sock.makefile("rb")
+
+    def run():
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            sock.sendall(query)
+            reader.readline()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    latencies = benchmark.pedantic(run, rounds=3, warmup_rounds=1)
+    sock.close()
+    benchmark.group = f"server-{mode}"
+    benchmark.extra_info["requests_per_sec"] = round(len(latencies) / sum(latencies))
+    benchmark.extra_info.update(percentiles(latencies))
+
+def test_server_single_shot(benchmark, server_address):
+    """Requests/sec and latency with a new connection per query"""
+    mode, port = server_address
+    lines, _ = load("200k")
+    queries = [lines[i % len(lines)].encode() for i in range(SERVER_QUERIES // 10)]
+
+    def run():
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            sock = connect(mode, port)
+            sock.sendall(query)
+            sock.recv(1024)
+            sock.close()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    latencies = benchmark.pedantic(run, rounds=3, warmup_rounds=1)
+    benchmark.group = f"server-{mode}"
+    benchmark.extra_info["requests_per_sec"] = round(len(latencies) / sum(latencies))
+    benchmark.extra_info.update(percentiles(latencies))
@@ -0,0 +1,53 @@
+import os
+import pytest
+from server.server.bloom_filter import BloomFilter, FilteredIndex
+from server.server.index import StringIndex
+from server.server.metrics import MetricsRegistry
+
+KEYS = [f"{i};0;{i};".encode() for i in range(2000)]
+
+
+def test_no_false_negatives_and_bounded_false_positives():
+    """Added keys are always found; misses pass at about the target rate"""
+    bloom = BloomFilter.from_keys(KEYS, fp_rate=0.01)
+    assert all(key in bloom for key in KEYS)
+    misses = [f"{i};1;{i};".encode() for i in range(20000)]
+    false_positives = sum(key in bloom for key in misses)
+    assert false_positives / len(misses) < 0.02
+    assert 9 < bloom.bits_per_key < 10.5
+
+def test_saved_filter_loads_while_source_unchanged(tmp_path):
+    """A saved filter is mapped back until its source file changes"""
+    source = tmp_path / "data.txt"
+    source.write_bytes(b"\n".join(KEYS) + b"\n")
+    path = str(tmp_path / "data.bloom")
+    BloomFilter.from_keys(KEYS, fp_rate=0.001).save(path, str(source))
+    bloom = BloomFilter.load(path, str(source))
+    assert bloom is not None and bloom.fp_rate == 0.001
+    assert all(key in bloom for key in KEYS)
+    with open(source, "ab") as f:
+        f.write(b"extra\n")
+    assert BloomFilter.load(path, str(source)) is None
+    assert BloomFilter.load(str(tmp_path / "missing.bloom"), str(source)) is None
+    assert not os.path.exists(path + ".tmp")
+
+def test_filtered_index_counts_rejects():
+    """Misses are answered by the filter and reported in the stats"""
+    lines = [key.decode() for key in KEYS]
+    metrics = MetricsRegistry()
+    index = FilteredIndex(StringIndex(lines), BloomFilter.from_keys(KEYS), metrics)
+    assert index.contains("5;0;5;") and not index.contains("5;1;5;")
+    assert index.contains_many(["1;0;1;", "x", "2;0;2;"]) == [True, False, True]
+    counters = metrics.snapshot()["counters"]
+    assert counters["filter_rejects"] + counters["filter_false_positives"] == 2
+    stats = index.describe(counters)
+    assert stats["keys"] == len(KEYS) and stats["target_fp_rate"] == 0.01
+
+@pytest.mark.parametrize("fp_rate", [0.05, 0.01, 0.001])
+def test_measured_false_positive_rate_matches_target(fp_rate):
+    """The false-positive rate measured on unseen keys is near the target"""
+    keys = [f"{i};0;{i * 7};".encode() for i in range(20000)]
+    bloom = BloomFilter.from_keys(keys, fp_rate=fp_rate)
+    probes = 200000
+    false_positives = sum(f"{i};1;{i};".encode() in bloom for i in range(probes))
+    assert fp_rate / 2 < false_positives / probes < fp_rate * 1.5
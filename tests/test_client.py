@@ -0,0 +1,107 @@
+import asyncio
+import socket
+import threading
+import pytest
+
+from client.src.async_client import AsyncSearchClient
+from client.src.client import ClientError, SearchClient
+
+EXISTING = "3;0;1;28;0;7;5;0;"
+MISSING = "0;0;0;0;0;"
+
+
+@pytest.fixture(scope="module")
+def port(start_server):
+    """A plain threaded server on a free port"""
+    return start_server()
+
+@pytest.fixture(scope="module")
+def single_shot_port():
+    """A server answering one query per connection, as older servers do"""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def serve():
+        while True:
+            conn, _ = listener.accept()
+            with conn:
+                query = conn.recv(1024).decode().strip()
+                if query:
+                    conn.sendall(b"STRING EXISTS" if query == EXISTING else b"STRING NOT EXIST")
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener.getsockname()[1]
+
+def test_pooled_queries(port):
+    """Queries reuse one persistent connection"""
+    with SearchClient("127.0.0.1", port, pool_size=2) as client:
+        assert client.exists(EXISTING)
+        assert not client.exists(MISSING)
+        assert len(client.pool._idle) == 1
+        assert client.stats()["counters"]["queries"] >= 2
+        assert client.count_prefix(EXISTING) == 1
+        assert client.count_field(1, "0") == 0
+        assert client.single_shot is False
+
+def test_exists_many_is_pipelined_in_windows(port):
+    """Answers come back in order across pipeline windows"""
+    queries = [EXISTING, MISSING] * 50
+    with SearchClient("127.0.0.1", port, pipeline_window=16) as client:
+        assert client.exists_many(queries) == [True, False] * 50
+
+def test_pool_is_thread_safe(port):
+    with SearchClient("127.0.0.1", port, pool_size=3) as client:
+        results = []
+
+        def work():
+            results.append(client.exists_many([EXISTING, MISSING] * 20))
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [[True, False] * 20] * 8
+        assert len(client.pool._idle) <= 3
+
+def test_error_responses_raise(port):
+    with SearchClient("127.0.0.1", port) as client:
+        with pytest.raises(ClientError):
+            client.exists("  ")
+        with pytest.raises(ValueError):
+            client.exists("a\nb")
+
+def test_stale_connection_is_retried(port):
+    """A pooled connection closed by the server is replaced transparently"""
+    with SearchClient("127.0.0.1", port) as client:
+        assert client.exists(EXISTING)
+        client.pool._idle[0].sock.close()
+        assert client.exists(EXISTING)
+
+def test_unreachable_server_fails_after_retries(unused_port):
+    with SearchClient("127.0.0.1", unused_port, retries=1) as client:
+        with pytest.raises(OSError):
+            client.exists(EXISTING)
+
+def test_single_shot_fallback(single_shot_port):
+    """Servers closing after one answer get one connection per query"""
+    with SearchClient("127.0.0.1", single_shot_port) as client:
+        assert client.exists_many([EXISTING, MISSING, EXISTING]) == [True, False, True]
+        assert client.single_shot
+        assert not client.exists(MISSING)
+
+def test_async_client(port, single_shot_port):
+    async def run():
+        async with AsyncSearchClient("127.0.0.1", port, pipeline_window=8) as client:
+            assert await client.exists(EXISTING)
+            assert await client.exists_many([EXISTING, MISSING] * 10) == [True, False] * 10
+            results = await asyncio.gather(
+                *(client.exists_many([MISSING, EXISTING]) for _ in range(6))
+            )
+            assert results == [[False, True]] * 6
+        async with AsyncSearchClient("127.0.0.1", single_shot_port) as client:
+            assert await client.exists_many([MISSING, EXISTING]) == [False, True]
+            assert client.single_shot
+
+    asyncio.run(run())
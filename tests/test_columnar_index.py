@@ -0,0 +1,46 @@
+import pytest
+from server.server.columnar_index import parse_record, render_record
+from server.server.index import StringIndex
+from server.server.range_index import RangeIndex
+
+np = pytest.importorskip("numpy")
+from server.server.columnar_index import ColumnarIndex  # noqa: E402
+
+LINES = ["1;0;1;11;", "25;0;16;21;", "3;0;2;5;", "1;0;1;11;", "01;0;1;1;", "a;b;", "7;7;"]
+
+
+def test_parse_record_only_accepts_canonical_records():
+    assert parse_record("1;0;25;") == [1, 0, 25]
+    assert parse_record("1;0;25;", fields=2) is None
+    for line in ("1;0;25", "01;0;", "-1;0;", "1 ;0;", "²;0;", ";", ""):
+        assert parse_record(line) is None
+    assert render_record([1, 0, 25]) == "1;0;25;"
+
+def test_lookups_match_the_string_index():
+    """Records outside the numeric schema are still found exactly"""
+    index = ColumnarIndex(LINES)
+    expected = StringIndex(LINES)
+    assert len(index) == len(expected) == 6
+    assert index.others == ["01;0;1;1;", "7;7;", "a;b;"]
+    assert list(index.sorted_lines) == expected.sorted_lines
+    queries = LINES + ["1;0;1;1;", "99;0;1;11;", "1;0;1;11", "7;7;7;7;", ""]
+    assert index.contains_many(queries) == expected.contains_many(queries)
+    assert [index.contains(query) for query in queries] == [query in expected for query in queries]
+
+def test_keys_pack_the_narrowest_fields():
+    index = ColumnarIndex(LINES)
+    assert index.widths == [5, 1, 5, 5] and index.key_bits == 64
+    assert index.keys.dtype == np.uint64 and index.columns.dtype == np.uint8
+    assert index.columns.shape == (3, 4)
+
+def test_wide_records_use_128_bit_keys():
+    lines = [f"{2**40 + i};{2**35 - i};{i};" for i in range(0, 1000, 7)]
+    index = ColumnarIndex(lines)
+    assert index.key_bits == 128
+    queries = lines[::3] + ["1;1;1;", f"{2**40};{2**35};0;"]
+    assert index.contains_many(queries) == StringIndex(lines).contains_many(queries)
+
+def test_range_queries_run_on_the_rendered_records():
+    index = RangeIndex(ColumnarIndex(LINES).sorted_lines)
+    assert index.count_prefix("1;0;") == 1
+    assert index.count_field(2, "0") == 4
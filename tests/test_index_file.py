@@ -0,0 +1,54 @@
+import os
+import pytest
+from server.server.index_file import IndexFile, load_index_file, write_index_file
+from server.server.mmap_index import MmapIndex
+from server.server.sharding import split_file
+from server.server.utils import reread_file
+
+
+@pytest.fixture
+def files(tmp_path):
+    source = tmp_path / "data.txt"
+    source.write_text("2;0;2;\n1;0;1;\n2;0;2;\n")
+    index = tmp_path / "data.idx"
+    write_index_file(str(source), str(index))
+    return source, index
+
+def test_index_file_lookups(files):
+    """The mapped index holds the sorted unique records"""
+    index = load_index_file(str(files[0]), str(files[1]))
+    assert isinstance(index, IndexFile)
+    assert list(index.sorted_lines) == ["1;0;1;", "2;0;2;"]
+    assert index.contains("1;0;1;") and not index.contains("1;0;")
+
+def test_index_file_stale_after_change(files):
+    """A changed source file makes the index stale"""
+    source, index = files
+    with open(source, "a") as f:
+        f.write("3;0;3;\n")
+    assert load_index_file(str(source), str(index)) is None
+
+def test_index_file_fresh_after_touch(files):
+    """A touched but unchanged source file is validated by its checksum"""
+    source, index = files
+    os.utime(source, ns=(0, 0))
+    assert load_index_file(str(source), str(index)) is not None
+
+def test_index_file_corrupt(files):
+    """A truncated index file is ignored"""
+    source, index = files
+    index.write_bytes(index.read_bytes()[:-1])
+    assert load_index_file(str(source), str(index)) is None
+
+def test_every_reader_drops_one_carriage_return(tmp_path):
+    """Lines ending in several "\\r" get the same key from every reader"""
+    source = tmp_path / "data.txt"
+    source.write_bytes(b"1;0;1;\r\r\n2;0;2;\r\n\r\r\n3;0;3;\r\r")
+    expected = ["\r", "1;0;1;\r", "2;0;2;", "3;0;3;\r"]
+    assert sorted(reread_file(str(source))) == expected
+    assert list(MmapIndex(str(source)).sorted_lines) == expected
+    index = tmp_path / "data.idx"
+    write_index_file(str(source), str(index))
+    assert list(load_index_file(str(source), str(index)).sorted_lines) == expected
+    shards = split_file(str(source), 2, str(tmp_path / "shards"))
+    assert sorted(line for path, _ in shards for line in reread_file(path)) == expected
@@ -0,0 +1,48 @@
+import pytest
+
+from tests.load_generator import format_summary, load_queries, run_load
+
+LINES = ["3;0;1;28;0;7;5;0;", "10;0;1;26;0;8;3;0;", "18;0;6;28;0;23;5;0;"]
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("\n".join(LINES) + "\n")
+    return str(path)
+
+@pytest.fixture(scope="module")
+def port(start_server):
+    """A plain threaded server on a free port"""
+    return start_server()
+
+def test_query_mix(data_file):
+    """Hits come from the data file and misses do not"""
+    queries = load_queries(data_file, 0.25, pool_size=100, seed=1)
+    assert len(queries) == 100
+    assert sum(expected for _, expected in queries) == 25
+    for query, expected in queries:
+        assert (query in LINES) == expected
+
+def test_query_mix_rejects_bad_ratio(data_file):
+    with pytest.raises(ValueError):
+        load_queries(data_file, 1.5)
+
+@pytest.mark.parametrize("reuse", [True, False])
+def test_closed_loop(port, reuse):
+    """Every query is answered and counted once"""
+    queries = [("0;0;0;0;0;", False)]
+    result = run_load("127.0.0.1", port, queries, 0.3, connections=2, reuse=reuse)
+    summary = result.summary()
+    assert summary["requests"] > 0
+    assert summary["errors"] == summary["unexpected_answers"] == 0
+    assert summary["service_us"]["count"] == summary["requests"]
+    assert "service" in format_summary(summary, open_loop=False)
+
+def test_open_loop_sends_at_the_given_rate(port):
+    """Open loop sends the scheduled number of queries, timed from their due time"""
+    queries = [("0;0;0;0;0;", False)]
+    result = run_load("127.0.0.1", port, queries, 0.5, connections=2, rate=100)
+    summary = result.summary()
+    assert summary["requests"] == 50
+    assert summary["response_us"]["max"] >= summary["service_us"]["max"]
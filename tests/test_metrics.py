@@ -0,0 +1,60 @@
+import json
+import threading
+from server.server.metrics import (
+    BUCKETS,
+    MAX_VALUE,
+    Histogram,
+    MetricsRegistry,
+    bucket_high,
+    bucket_index,
+)
+from server.server.protocol import ClientSession
+from server.server.server import StringSearchServer
+
+
+def test_buckets_are_contiguous():
+    """Every value falls in the bucket whose upper bound covers it"""
+    for value in list(range(5000)) + [MAX_VALUE]:
+        index = bucket_index(value)
+        assert index < BUCKETS
+        assert bucket_high(index - 1) < value <= bucket_high(index)
+
+def test_histogram_percentiles_within_precision():
+    """Percentiles are within the relative error of the buckets"""
+    histogram = Histogram()
+    for value in range(1, 10001):
+        histogram.record(value / 1_000_000)
+    snapshot = histogram.snapshot()
+    assert snapshot.count == 10000
+    assert abs(snapshot.percentile(0.5) - 5000) / 5000 < 0.04
+    assert abs(snapshot.percentile(0.99) - 9900) / 9900 < 0.04
+    assert snapshot.percentile(1.0) == snapshot.max == 10000
+
+def test_counters_sum_across_threads():
+    """Increments from every thread's shard are counted"""
+    metrics = MetricsRegistry()
+    threads = [
+        threading.Thread(
+            target=lambda: [metrics.inc("queries") for _ in range(1000)]
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.counters["queries"].value == 4000
+
+def test_stats_command_reports_metrics():
+    """STATS answers with the server metrics as one line of JSON"""
+    server = StringSearchServer(MetricsRegistry())
+    server.process_request("3;0;1;28;0;7;5;0;")
+    server.process_batch(["3;0;1;28;0;7;5;0;", "0;0;0;0;"])
+    session = server.new_session()
+    assert isinstance(session, ClientSession)
+    response = session.feed(b"STATS\n")
+    assert response.endswith(b"\n") and response.count(b"\n") == 1
+    stats = json.loads(response)
+    assert stats["counters"]["queries"] == 3
+    assert stats["counters"]["batches"] == 1
+    assert stats["latency_us"]["lookup"]["count"] == 2
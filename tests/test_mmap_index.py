@@ -0,0 +1,49 @@
+import pytest
+from server.server import mmap_index
+from server.server.mmap_index import MmapIndex, SortedBytesIndex
+from server.server.search_engines import SearchEngine
+from server.server.search_algorithms import binary_search, jump_search, linear_search
+
+LINES = ["3;0;1;28;0;7;5;0;", "10;0;1;26;0;8;3;0;", "18;0;6;28;0;23;5;0;", "3;0;1;28;0;7;5;0;"]
+
+
+@pytest.fixture(params=[LINES, sorted(LINES)], ids=["unsorted", "sorted"])
+def index(request, tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(("\r\n".join(request.param) + "\n\n").encode())
+    return MmapIndex(str(path))
+
+def test_mmap_index_is_deduplicated_and_sorted(index):
+    """Only the unique non-empty lines are indexed, in sorted order"""
+    assert len(index) == 3
+    assert list(index.sorted_lines) == sorted(set(LINES))
+
+@pytest.mark.parametrize("algorithm", [None, linear_search, binary_search, jump_search])
+def test_mmap_index_lookups(index, algorithm):
+    """Lookups match whole lines only"""
+    for line in LINES:
+        assert index.contains(line, algorithm)
+    assert not index.contains("3;0;1;", algorithm)
+    assert index.contains_many(["0;", LINES[1]]) == [False, True]
+
+def test_mmap_index_empty_file(tmp_path):
+    """An empty file gives an empty index"""
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert not MmapIndex(str(path)).contains("1;")
+
+def test_unsorted_file_is_sorted_in_runs(tmp_path, monkeypatch):
+    """Unsorted files are sorted in bounded runs and merged without duplicates"""
+    monkeypatch.setattr(mmap_index, "SORT_RUN_LINES", 7)
+    lines = [f"{i * 37 % 100};0;{i % 40};" for i in range(100)]
+    path = tmp_path / "data.txt"
+    path.write_text("\n".join(lines) + "\n")
+    index = MmapIndex(str(path))
+    assert list(index.sorted_lines) == sorted(set(lines), key=str.encode)
+
+def test_indexes_must_report_their_footprint():
+    """Indexes and engines without their memory accounting cannot be created"""
+    with pytest.raises(TypeError):
+        type("Index", (SortedBytesIndex,), {})()
+    with pytest.raises(TypeError):
+        type("Engine", (SearchEngine,), {})(None, 0.0)
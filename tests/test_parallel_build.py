@@ -0,0 +1,83 @@
+import os
+import random
+import pytest
+
+from server.server import parallel_build
+from server.server.mmap_index import MmapIndex
+from server.server.search_engines import build_engine
+from server.server.utils import reread_file
+
+random.seed(7)
+LINES = [f"{random.randint(0, 300)};0;{random.randint(0, 9)};" for _ in range(3000)]
+
+
+@pytest.fixture(
+    params=[
+        "\n".join(LINES) + "\n\n",
+        "\r\n".join(LINES),
+        "\n".join(sorted(LINES)) + "\n",
+        # Only "\n" ends a record, whatever str.splitlines would break at
+        "\n".join(LINES) + "\na\u2028b;\nc\rd;\ne\x1cf;\r\ng;\r\r\n",
+    ],
+    ids=["unsorted", "crlf", "sorted", "separators"],
+)
+def data_file(request, tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(request.param.encode())
+    return str(path)
+
+def test_line_ranges_cover_the_file_at_line_boundaries():
+    data = b"1;\n22;\n333;\n4444;\n"
+    for parts in range(1, 8):
+        ranges = parallel_build.line_ranges(data, parts)
+        assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert end == start and data[end - 1 : end] == b"\n"
+    assert parallel_build.line_ranges(b"1;", 4) == [(0, 2)]
+
+@pytest.mark.parametrize("workers", [1, 2, 5])
+def test_parallel_build_matches_the_serial_build(data_file, workers):
+    """Same offsets as the mmap index build, same lines as reading the file"""
+    stages = {}
+    starts = parallel_build.sorted_line_starts(data_file, workers, stages)
+    assert list(starts) == list(MmapIndex(data_file)._starts)
+    assert set(stages) == {"split", "sort", "merge", "collect"}
+    lines = parallel_build.read_sorted_lines(data_file, workers)
+    assert lines == sorted(set(reread_file(data_file)))
+    # Every shared memory block was removed
+    if os.path.isdir("/dev/shm"):
+        assert not [name for name in os.listdir("/dev/shm") if name.startswith("psm_")]
+
+def test_parallel_build_of_empty_files(tmp_path):
+    for content in (b"", b"\n\r\n"):
+        path = tmp_path / "empty.txt"
+        path.write_bytes(content)
+        assert list(parallel_build.sorted_line_starts(str(path), 3)) == []
+        assert parallel_build.read_sorted_lines(str(path), 3) == []
+
+def test_small_files_are_built_serially(data_file, monkeypatch):
+    assert parallel_build.workers_for(data_file, 4) == 1
+    monkeypatch.setattr(parallel_build, "PARALLEL_MIN_BYTES", 0)
+    assert parallel_build.workers_for(data_file, 4) == 4
+    assert parallel_build.workers_for(data_file, 1) == 1
+    assert parallel_build.workers_for(data_file, 0) == (os.cpu_count() or 1)
+
+@pytest.mark.parametrize("name", ["set", "bisect", "mmap", "columnar"])
+def test_engines_built_in_parallel(data_file, monkeypatch, name):
+    """Engines built in parallel answer like serial ones and report the stages"""
+    serial = build_engine(name, data_file, build_workers=1)
+    monkeypatch.setattr(parallel_build, "PARALLEL_MIN_BYTES", 0)
+    engine = build_engine(name, data_file, build_workers=3)
+    assert list(engine.sorted_lines) == list(serial.sorted_lines)
+    assert engine.contains_many(LINES[:50] + ["0;0;"]) == [True] * 50 + [False]
+    assert set(engine.describe()["build_stages_ms"]) == {
+        "split",
+        "sort",
+        "merge",
+        "collect",
+    }
+    assert "build_stages_ms" not in serial.describe()
+
+def test_workers_are_not_forked_from_the_server():
+    """A fork of the threaded server could inherit a lock held by another thread"""
+    assert parallel_build._context().get_start_method() in ("forkserver", "spawn")
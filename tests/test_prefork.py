@@ -0,0 +1,123 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from server.server.metrics import MetricsRegistry
+from server.server.prefork import WorkerStats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Serve a test data file, without TLS, from two workers of the given engine
+PREFORK_SCRIPT = """
+import sys
+from server.server import prefork, server
+
+path, port, engine = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+server.SSL_ENABLED = prefork.SSL_ENABLED = False
+prefork.ENGINE = engine
+server.STRINGS_FILE_PATH = server.WATCHER.file_path = path
+prefork.start_prefork_server("127.0.0.1", port, False, 2)
+"""
+
+
+def ask(port, message):
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(message.encode())
+        return sock.recv(65536).decode()
+
+def wait_until(check, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            result = check()
+            if result:
+                return result
+        except ConnectionRefusedError:
+            # Not listening yet
+            pass
+        time.sleep(0.1)
+    raise AssertionError("timed out")
+
+def test_worker_stats_aggregate():
+    """Worker metrics are summed and their histograms merged"""
+    stats = WorkerStats(3)
+    first, second = MetricsRegistry(), MetricsRegistry()
+    first.inc("queries", 10)
+    first.record("lookup", 0.000010)
+    second.inc("queries", 30)
+    second.record("lookup", 0.000030)
+    stats.publish(0, first)
+    stats.publish(2, second)
+    aggregated = stats.aggregate()
+    assert aggregated["processes"] == 2
+    assert aggregated["counters"]["queries"] == 40
+    assert aggregated["latency_us"]["lookup"]["count"] == 2
+    assert aggregated["latency_us"]["lookup"]["max"] == 30
+    stats.clear(0)
+    assert stats.aggregate()["counters"]["queries"] == 30
+
+@pytest.mark.parametrize("engine", ["threaded", "asyncio"])
+def test_workers_serve_queries_and_reload_from_the_parent(
+    tmp_path, unused_port, engine
+):
+    """Workers answer and report through STATS; RELOAD replaces them"""
+    data_file = tmp_path / "data.txt"
+    data_file.write_text("1;0;1;\n2;0;2;\n")
+    port = unused_port
+    supervisor = subprocess.Popen(
+        [sys.executable, "-c", PREFORK_SCRIPT, str(data_file), str(port), engine],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        assert wait_until(lambda: ask(port, "1;0;1;")) == "STRING EXISTS"
+        for _ in range(20):
+            assert ask(port, "3;0;3;") == "STRING NOT EXIST"
+
+        def stats(queries=0):
+            report = json.loads(ask(port, "STATS"))
+            if len(report["workers"]) == 2 and report["counters"]["queries"] >= queries:
+                return report
+            return None
+
+        workers = set(wait_until(lambda: stats(21))["workers"])
+        # Queries sent while the workers are replaced are all answered
+        answers = []
+        reloaded = threading.Event()
+
+        def query_during_reload():
+            while not reloaded.is_set():
+                try:
+                    answers.append(ask(port, "1;0;1;"))
+                except OSError as e:
+                    answers.append(repr(e))
+
+        load = [threading.Thread(target=query_during_reload) for _ in range(4)]
+        for thread in load:
+            thread.start()
+        try:
+            data_file.write_text("1;0;1;\n3;0;3;\n")
+            assert ask(port, "RELOAD") == "RELOAD SCHEDULED"
+            # The replacements are forked from the new generation
+            report = wait_until(
+                lambda: (r := stats()) and not workers & set(r["workers"]) and r
+            )
+        finally:
+            reloaded.set()
+            for thread in load:
+                thread.join()
+        assert answers and set(answers) == {"STRING EXISTS"}
+        assert len(report["workers"]) == 2
+        assert ask(port, "READY") == "READY generation 2"
+        assert ask(port, "3;0;3;") == "STRING EXISTS"
+    finally:
+        supervisor.send_signal(signal.SIGTERM)
+        try:
+            supervisor.wait(10)
+        except subprocess.TimeoutExpired:
+            supervisor.kill()
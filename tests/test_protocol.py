@@ -0,0 +1,93 @@
+import pytest
+from server.server.exceptions import InvalidPayloadError
+from server.server.framing import FrameBuffer
+from server.server.protocol import ClientSession
+
+
+def process_request(request):
+    return "STRING EXISTS" if request == "1;0;1;" else "STRING NOT EXIST"
+
+@pytest.fixture
+def session():
+    return ClientSession(process_request, max_payload_size=16)
+
+def test_single_shot_query_closes(session):
+    """A first message without newline is answered once, without newline"""
+    assert session.feed(b"1;0;1;") == b"STRING EXISTS"
+    assert session.closed and not session.keep_alive
+
+def test_single_shot_empty_payload(session):
+    """An empty single-shot message gets the invalid payload error"""
+    assert session.feed(b"") == b"ERROR: Empty payload received"
+    assert session.closed
+
+def test_persistent_queries_answered_in_order(session):
+    """Newline-delimited queries are answered in order on one connection"""
+    assert session.feed(b"1;0;1;\n2;0;") == b"STRING EXISTS\n"
+    assert session.keep_alive and not session.closed
+    assert session.feed(b"2;\n1;0;1;\n") == b"STRING NOT EXIST\nSTRING EXISTS\n"
+    assert session.feed(b"") == b""
+    assert session.closed and session.queries == 3
+
+def test_persistent_last_query_without_newline(session):
+    """A last query before end of stream is still answered"""
+    session.feed(b"2;0;2;\n")
+    assert session.feed(b"1;0;1;") == b""
+    assert session.feed(b"") == b"STRING EXISTS\n"
+
+def test_persistent_oversized_query(session):
+    """A query over the payload limit closes the connection with an error"""
+    session.feed(b"1;0;1;\n")
+    assert session.feed(b"9" * 17) == b"ERROR: Payload too large\n"
+    assert session.closed
+
+def process_batch(requests):
+    return [request == "1;0;1;" for request in requests]
+
+@pytest.fixture
+def batch_session():
+    return ClientSession(
+        process_request, 16, process_batch=process_batch, max_batch_size=10
+    )
+
+def test_batch_text_answers_stream_in_order(batch_session):
+    """A TEXT batch is answered line by line as the queries arrive"""
+    assert batch_session.feed(b"BATCH 3\n1;0;1;\n2;") == (
+        b"BATCH 3 TEXT\nSTRING EXISTS\n"
+    )
+    assert batch_session.feed(b"0;\n1;0;1;\n1;0;1;\n") == (
+        b"STRING NOT EXIST\nSTRING EXISTS\nSTRING EXISTS\n"
+    )
+    assert batch_session.queries == 4
+
+def test_batch_bits_are_packed(batch_session):
+    """A BITS batch answers with one bit per query, least significant first"""
+    queries = b"".join(b"1;0;1;\n" if i in (0, 8) else b"x\n" for i in range(10))
+    assert batch_session.feed(b"BATCH 10 BITS\n" + queries) == (
+        b"BATCH 10 BITS\n" + bytes([0b00000001, 0b00000001])
+    )
+
+def test_batch_too_large(batch_session):
+    """Batches over the size limit are refused"""
+    assert batch_session.feed(b"BATCH 11\n") == b"ERROR: Batch too large\n"
+    assert batch_session.closed
+
+def test_frame_buffer_partial_and_pipelined_frames():
+    """Frames split across receives and pipelined frames are both returned"""
+    buffer = FrameBuffer(max_frame_size=8)
+    view = buffer.writable()
+    view[:6] = b"ab\ncd\n"
+    buffer.commit(6)
+    assert [bytes(frame) for frame in buffer.frames()] == [b"ab", b"cd"]
+    buffer.write(b"e")
+    assert list(buffer.frames()) == []
+    buffer.write(b"f\n")
+    assert [bytes(frame) for frame in buffer.frames()] == [b"ef"]
+    assert len(buffer) == 0
+
+def test_frame_buffer_rejects_oversized_frame_before_delimiter():
+    """An oversized frame is rejected before its delimiter arrives"""
+    buffer = FrameBuffer(max_frame_size=4)
+    buffer.write(b"12345")
+    with pytest.raises(InvalidPayloadError, match="Payload too large"):
+        list(buffer.frames())
@@ -0,0 +1,53 @@
+import pytest
+from server.server.metrics import MetricsRegistry
+from server.server.range_index import RangeIndex, parse_range_query, record_fields
+from server.server.server import StringSearchServer
+
+LINES = sorted(
+    ["1;0;1;11;0;10;5;0;", "1;0;16;16;0;14;30;", "10;0;23;16;0;22;4;0;", "2;0;16;21;0;14;3;0;"]
+)
+
+
+@pytest.fixture
+def index():
+    return RangeIndex(LINES)
+
+@pytest.mark.parametrize(
+    "prefix, count",
+    [("1", 3), ("1;", 2), ("1;0;1", 2), ("1;0;16;", 1), ("10;", 1), ("2", 1), ("3", 0), ("1;0;1;11;0;10;5;0;", 1)],
+)
+def test_prefix_counts(index, prefix, count):
+    """Prefix ranges match a scan of the records"""
+    assert index.count_prefix(prefix) == count == sum(line.startswith(prefix) for line in LINES)
+
+def test_prefix_of_maximal_characters():
+    assert RangeIndex(["a\U0010ffffb", "b"]).count_prefix("a\U0010ffff") == 1
+    assert RangeIndex(["a", "\U0010ffff"]).count_prefix("\U0010ffff") == 1
+
+@pytest.mark.parametrize(
+    "field, value, count",
+    [(1, "1", 2), (3, "16", 2), (4, "16", 2), (8, "0", 3), (8, "", 0), (9, "0", 0), (0, "1", 0)],
+)
+def test_field_counts(index, field, value, count):
+    """Field indexes ignore the trailing separator and count distinct records"""
+    assert index.count_field(field, value) == count
+
+def test_record_fields():
+    assert record_fields("1;0;1;") == ["1", "0", "1"]
+    assert record_fields("1;0;1") == ["1", "0", "1"]
+
+def test_parse_range_query():
+    assert parse_range_query("PREFIX 1;0;") == ("PREFIX", "1;0;")
+    assert parse_range_query("FIELD 2=0") == ("FIELD", "2=0")
+    assert parse_range_query("PREFIX") is None
+    assert parse_range_query("1;0;1;") is None
+
+def test_server_answers_range_queries():
+    """PREFIX and FIELD answers carry the number of matching records"""
+    server = StringSearchServer(MetricsRegistry(), result_cache_size=0)
+    assert server.process_request("PREFIX 3;0;1;28;0;7;5;0;") == "STRING EXISTS 1"
+    assert server.process_request("PREFIX 0;0;") == "STRING NOT EXIST 0"
+    assert server.process_request("FIELD 1=3").startswith("STRING EXISTS ")
+    assert server.process_request("FIELD 1=999999") == "STRING NOT EXIST 0"
+    assert server.process_request("FIELD one=3").startswith("ERROR: ")
+    assert server.metrics.counters["queries"].value == 4
@@ -0,0 +1,200 @@
+import os
+import subprocess
+import sys
+import threading
+import pytest
+from server.server import server as server_module
+from server.server.exceptions import FileAccessError
+from server.server import index as index_module
+from server.server.index import DeltaIndex, StringIndex
+from server.server.reloader import EngineWatcher, FileReloader
+from server.server.search_algorithms import binary_search
+from server.server.search_engines import build_engine
+from server.server.server import WATCHER, StringSearchServer
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("1;0;1;\n2;0;2;\n")
+    return path
+
+def test_unchanged_file_keeps_index(data_file):
+    """An unchanged file is not read again"""
+    reloader = FileReloader(str(data_file))
+    index = reloader.current()
+    assert reloader.current() is index
+    assert reloader.generation == 1
+
+def test_appended_lines_are_merged(data_file):
+    """Appended lines are read incrementally, including a partial last line"""
+    reloader = FileReloader(str(data_file))
+    reloader.current()
+    with open(data_file, "a") as f:
+        f.write("3;0;3;\n4;0")
+    index = reloader.current()
+    assert "3;0;3;" in index and "4;0" in index and "1;0;1;" in index
+    with open(data_file, "a") as f:
+        f.write(";4;\n")
+    index = reloader.current()
+    assert "4;0;4;" in index and "4;0" not in index
+    assert reloader.generation == 3
+
+def test_truncated_file_is_rebuilt(data_file):
+    """A truncated or replaced file triggers a full rebuild"""
+    reloader = FileReloader(str(data_file))
+    reloader.current()
+    replacement = data_file.with_suffix(".new")
+    replacement.write_text("9;9;\n")
+    os.replace(replacement, data_file)
+    index = reloader.current()
+    assert "9;9;" in index and "1;0;1;" not in index
+
+def test_grown_rewrite_is_rebuilt(data_file):
+    """A file rewritten in place with more data is not taken for an append"""
+    reloader = FileReloader(str(data_file))
+    reloader.current()
+    with open(data_file, "r+") as f:
+        f.write("7;0;7;\n8;0;8;\n9;0;9;\n")
+    index = reloader.current()
+    assert "9;0;9;" in index and "1;0;1;" not in index
+
+def test_appends_do_not_copy_the_base(data_file, monkeypatch):
+    """Small appends are layered on the base index, then merged into it"""
+    monkeypatch.setattr(index_module, "DELTA_MIN_LINES", 3)
+    reloader = FileReloader(str(data_file))
+    base = reloader.current()
+    for i in range(3):
+        with open(data_file, "a") as f:
+            f.write(f"{i};1;{i};\n")
+        index = reloader.current()
+        assert isinstance(index, DeltaIndex) and index.base is base
+        assert f"{i};1;{i};" in index and index.contains("1;0;1;", binary_search)
+    with open(data_file, "a") as f:
+        f.write("3;1;3;\n")
+    index = reloader.current()
+    assert isinstance(index, StringIndex) and len(index) == 6
+    assert index.sorted_lines == sorted(data_file.read_text().splitlines())
+
+def test_missing_file_raises():
+    """A missing file without a previous index raises FileAccessError"""
+    with pytest.raises(FileAccessError, match="Failed to load file"):
+        FileReloader("/nonexistent/file.txt").current()
+
+def build_from(path):
+    return lambda: StringIndex(path.read_text().splitlines())
+
+def test_watcher_publishes_new_generation(data_file):
+    """A changed file is rebuilt and swapped in once its writes settle"""
+    watcher = EngineWatcher(str(data_file), build_from(data_file))
+    assert watcher.reload() and watcher.generation == 1
+    old = watcher.engine
+    assert not watcher.poll()
+    data_file.write_text("1;0;1;\n5;0;5;\n")
+    # The first poll sees the change, the next one confirms it is complete
+    assert not watcher.poll()
+    assert watcher.poll()
+    assert watcher.generation == 2
+    assert "5;0;5;" in watcher.engine and "5;0;5;" not in old
+    assert not watcher.poll()
+
+# Run in a child process, as a truncated mapping kills it with SIGBUS
+REWRITE_SCRIPT = """
+import sys
+from server.server.reloader import EngineWatcher
+from server.server.search_engines import build_engine
+
+path, name = sys.argv[1:]
+lines = [f"{i};0;{i * 7};" for i in range(20000)]
+with open(path, "w") as f:
+    f.write("\\n".join(lines) + "\\n")
+watcher = EngineWatcher(path, lambda: build_engine(name, path, snapshot=True))
+assert watcher.reload()
+old = watcher.engine
+# Rewritten in place, much shorter, while the old generation is in use
+with open(path, "w") as f:
+    f.write("1;0;7;\\n")
+assert all(old.contains(line) for line in lines)
+assert watcher.reload() and len(watcher.engine) == 1
+print("ok")
+"""
+
+@pytest.mark.parametrize("name", ["mmap", "filter"])
+def test_mapped_engine_survives_in_place_rewrite(tmp_path, name):
+    """Mapped engines keep answering from their snapshot when the file is truncated"""
+    result = subprocess.run(
+        [sys.executable, "-c", REWRITE_SCRIPT, str(tmp_path / "data.txt"), name],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert result.stdout.strip().endswith("ok")
+    # The snapshots are deleted
+    assert sorted(os.listdir(tmp_path)) == ["data.txt"]
+
+@pytest.mark.parametrize("name", ["mmap", "filter"])
+def test_mapped_engine_survives_replacement_by_rename(tmp_path, name):
+    """By default the data file is mapped itself and may be replaced with mv"""
+    path = tmp_path / "data.txt"
+    lines = [f"{i};0;{i * 7};" for i in range(2000)]
+    path.write_text("\n".join(lines) + "\n")
+    watcher = EngineWatcher(str(path), lambda: build_engine(name, str(path)))
+    assert watcher.reload()
+    old = watcher.engine
+    (tmp_path / "new.txt").write_text("1;0;7;\n")
+    os.replace(tmp_path / "new.txt", path)
+    assert all(old.contains(line) for line in lines)
+    assert watcher.reload() and len(watcher.engine) == 1
+    # No copy of the file was made
+    assert sorted(os.listdir(tmp_path)) == ["data.txt"]
+
+def test_failed_rebuild_keeps_previous_engine(data_file):
+    engine = StringIndex(["1;0;1;"])
+    builds = iter([engine, None])
+    watcher = EngineWatcher(str(data_file), lambda: next(builds))
+    watcher.reload()
+    assert not watcher.reload()
+    assert watcher.engine is engine and watcher.generation == 1
+    assert watcher.describe()["last_error"]
+
+def test_reload_command():
+    """RELOAD rebuilds the data and reports the new generation"""
+    session = StringSearchServer().new_session()
+    generation = WATCHER.generation
+    response = session.feed(b"RELOAD\n").decode()
+    assert response.startswith(f"RELOADED generation {generation + 1} in ")
+    assert session.feed(b"3;0;1;28;0;7;5;0;\n") == b"STRING EXISTS\n"
+
+def test_warm_up_builds_in_the_background(data_file):
+    release = threading.Event()
+    engine = StringIndex(["1;0;1;"])
+    watcher = EngineWatcher(str(data_file), lambda: release.wait() and engine)
+    watcher.warm_up()
+    assert watcher.warming and not watcher.wait_ready(0.01)
+    release.set()
+    assert watcher.wait_ready(5)
+    assert watcher.engine is engine and not watcher.describe()["warming"]
+
+def test_queries_during_warm_up(data_file, monkeypatch):
+    """Probes are answered while the data loads, queries get a fast error"""
+    release = threading.Event()
+    watcher = EngineWatcher(
+        str(data_file), lambda: release.wait() and StringIndex(["1;0;1;"])
+    )
+    monkeypatch.setattr(server_module, "WATCHER", watcher)
+    session = StringSearchServer(warmup_wait=0).new_session()
+    assert session.feed(b"HEALTH\n") == b"OK\n"
+    assert session.feed(b"READY\n").startswith(b"WARMING ")
+    assert session.feed(b"1;0;1;\n") == b"SERVER WARMING\n"
+    release.set()
+    assert watcher.wait_ready(5)
+    assert session.feed(b"1;0;1;\nREADY\n") == b"STRING EXISTS\nREADY generation 1\n"
+
+def test_failed_warm_up_is_not_ready(tmp_path, monkeypatch):
+    watcher = EngineWatcher(str(tmp_path / "missing.txt"), lambda: None)
+    monkeypatch.setattr(server_module, "WATCHER", watcher)
+    session = StringSearchServer(warmup_wait=5).new_session()
+    assert session.feed(b"1;0;1;\n") == b"SERVER ERROR\n"
+    assert session.feed(b"READY\n").startswith(b"NOT READY: Failed to load")
@@ -0,0 +1,50 @@
+import pytest
+from server.server.metrics import MetricsRegistry
+from server.server.result_cache import ResultCache
+from server.server.server import StringSearchServer
+
+
+def test_lru_evicts_least_recently_used():
+    """A full LRU cache evicts the entry used longest ago"""
+    cache = ResultCache(2, "lru")
+    cache.put("a", True)
+    cache.put("b", False)
+    assert cache.get("a") is True
+    cache.put("c", True)
+    assert cache.get("b") is None
+    assert cache.get("a") is True and cache.get("c") is True
+
+def test_tinylfu_keeps_hot_entries():
+    """One-off queries do not evict strings that are queried more often"""
+    cache = ResultCache(2, "tinylfu")
+    for key in ("hot1", "hot2") * 5:
+        if cache.get(key) is None:
+            cache.put(key, True)
+    for i in range(50):
+        key = f"cold{i}"
+        assert cache.get(key) is None
+        cache.put(key, False)
+    assert cache.get("hot1") is True and cache.get("hot2") is True
+
+def test_generation_change_drops_entries():
+    """Results cached for another data generation are not returned"""
+    cache = ResultCache(4)
+    cache.get("a", generation=1)
+    cache.put("a", True, generation=1)
+    assert cache.get("a", generation=1) is True
+    assert cache.get("a", generation=2) is None
+    # A result searched before the reload is not cached
+    cache.put("a", True, generation=1)
+    assert len(cache) == 0
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ResultCache(4, "fifo")
+
+def test_server_counts_cache_hits():
+    """Repeated queries are answered from the cache and counted"""
+    server = StringSearchServer(MetricsRegistry(), result_cache_size=8)
+    for _ in range(3):
+        assert server.process_request("3;0;1;28;0;7;5;0;") == "STRING EXISTS"
+    counters = server.metrics.snapshot()["counters"]
+    assert counters["cache_misses"] == 1 and counters["cache_hits"] == 2
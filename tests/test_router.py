@@ -0,0 +1,140 @@
+import configparser
+import pytest
+
+from server.server import server as server_module
+from server.server.index import StringIndex
+from server.server.metrics import MetricsRegistry
+from server.server.router import Replica, Shard, ShardRouter, create_router
+from server.server.sharding import (
+    format_shards,
+    parse_shards,
+    shard_of,
+    split_file,
+    write_instance_config,
+)
+
+LINES = [f"{i % 7};0;{i};{i % 3};" for i in range(300)]
+
+
+class ShardServer(server_module.StringSearchServer):
+    """A search server holding one partition instead of the data file"""
+
+    def __init__(self, path):
+        super().__init__(MetricsRegistry(), result_cache_size=0)
+        with open(path) as f:
+            self.index = StringIndex(f.read().splitlines())
+
+    def start_loading(self):
+        pass
+
+    def _current_index(self):
+        return self.index
+
+    def ready_report(self):
+        return "READY generation 1"
+
+    def reload_report(self):
+        return "RELOADED generation 1 in 0.00ms"
+
+
+@pytest.fixture(scope="module")
+def shards(tmp_path_factory, start_server):
+    """Two shards of two plain replicas each, as [ROUTER] SHARDS"""
+    directory = tmp_path_factory.mktemp("shards")
+    data_file = directory / "data.txt"
+    data_file.write_text("\n".join(LINES + LINES[:10]) + "\n")
+    addresses = [
+        [("127.0.0.1", start_server(client_operation=ShardServer(path))) for _ in range(2)]
+        for path, _ in split_file(str(data_file), 2, str(directory))
+    ]
+    return format_shards(addresses)
+
+@pytest.fixture
+def router(shards):
+    router = create_router(shards, shard_ssl=False)
+    yield router
+    router.close()
+
+def test_split_file_partitions_by_stable_hash(tmp_path):
+    data_file = tmp_path / "data.txt"
+    data_file.write_text("\n".join(LINES) + "\n\n")
+    partitions = split_file(str(data_file), 3, str(tmp_path / "out"))
+    assert sum(count for _, count in partitions) == len(LINES)
+    for shard, (path, _) in enumerate(partitions):
+        for line in open(path).read().splitlines():
+            assert shard_of(line.encode(), 3) == shard
+    assert shard_of(b"1;0;1;", 3) == 1  # crc32, the same in every process
+
+def test_shard_settings_round_trip():
+    spec = "127.0.0.1:8081|127.0.0.1:8083, localhost:8082"
+    assert parse_shards(spec) == [
+        [("127.0.0.1", 8081), ("127.0.0.1", 8083)],
+        [("localhost", 8082)],
+    ]
+    assert format_shards(parse_shards(spec)) == spec
+    for spec in ("127.0.0.1", "127.0.0.1:x", "1.2.3.4:1,"):
+        with pytest.raises(ValueError):
+            parse_shards(spec)
+
+def test_instance_configs(tmp_path):
+    base = tmp_path / "base.ini"
+    base.write_text("[SERVER]\nPORT = 8080\n[SSL]\nSSL_ENABLED = True\n")
+    write_instance_config(str(base), str(tmp_path / "shard.ini"), 8081, data_file="d.txt")
+    write_instance_config(str(base), str(tmp_path / "router.ini"), 8080, shards=[[("h", 1)]])
+    shard, router = configparser.ConfigParser(), configparser.ConfigParser()
+    shard.read(tmp_path / "shard.ini")
+    router.read(tmp_path / "router.ini")
+    assert shard.getint("SERVER", "PORT") == 8081
+    assert shard.get("FILES", "INDEX_FILE").endswith("d.idx")
+    assert router.get("SERVER", "ROLE") == "router"
+    assert router.get("ROUTER", "SHARDS") == "h:1"
+    assert router.getboolean("ROUTER", "SHARD_SSL")
+
+def test_router_answers_like_one_server(router):
+    session = router.new_session()
+    assert session.feed(b"1;0;1;1;\n0;0;0;\n") == b"STRING EXISTS\nSTRING NOT EXIST\n"
+    queries = LINES[::7] + ["9;9;9;", "x"]
+    batch = "".join(query + "\n" for query in queries)
+    answer = session.feed(f"BATCH {len(queries)}\n{batch}".encode()).decode()
+    assert answer.splitlines()[1:] == (
+        ["STRING EXISTS"] * len(LINES[::7]) + ["STRING NOT EXIST"] * 2
+    )
+    # Counts are summed over the shards
+    assert session.feed(b"PREFIX 3;0;\n") == b"STRING EXISTS 43\n"
+    assert session.feed(b"FIELD 4=2\n") == b"STRING EXISTS 100\n"
+    assert session.feed(b"FIELD x\n").startswith(b"ERROR")
+    assert session.feed(b"READY\n") == b"READY 2 shards\n"
+    assert session.feed(b"RELOAD\n") == b"RELOADED 4 of 4 replicas\n"
+
+def test_router_fails_over_to_another_replica(shards, unused_port):
+    """A replica that is down is skipped and reported in STATS"""
+    addresses = parse_shards(shards)
+    down = ("127.0.0.1", unused_port)
+    router = ShardRouter(
+        [
+            Shard(number, [Replica(address, timeout=1) for address in [down] + replicas])
+            for number, replicas in enumerate(addresses)
+        ],
+        MetricsRegistry(),
+    )
+    try:
+        assert router.process_batch(LINES[:20] + ["0;0;0;"]) == [True] * 20 + [False]
+        assert router.process_request(LINES[0]) == "STRING EXISTS"
+        stats = router.stats_report()
+        assert '"failovers":1' in stats and '"down":true' in stats
+        dead = ShardRouter([Shard(0, [Replica(down, timeout=1)])], MetricsRegistry())
+        assert dead.process_request(LINES[0]) == "SERVER ERROR"
+    finally:
+        router.close()
+
+def test_fan_out_threads_match_the_replica_connections():
+    """Concurrent clients can use every pooled replica connection at once"""
+    shards = [
+        Shard(number, [Replica(("127.0.0.1", 1), pool_size=4) for _ in range(2)])
+        for number in range(3)
+    ]
+    router = ShardRouter(shards, MetricsRegistry())
+    try:
+        assert router._executor._max_workers == 3 * 2 * 4
+    finally:
+        router.close()
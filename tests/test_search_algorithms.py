@@ -0,0 +1,38 @@
+import pytest
+from server.server.index import StringIndex
+from server.server.search_algorithms import (
+    binary_search,
+    exponential_search,
+    jump_search,
+    linear_search,
+    search_in_set,
+)
+
+LINES = ["3;0;1;28;0;7;5;0;", "10;0;1;26;0;8;3;0;", "18;0;6;28;0;23;5;0;", "3;0;1;28;0;7;5;0;"]
+ALGORITHMS = [linear_search, binary_search, jump_search, exponential_search, search_in_set]
+
+
+@pytest.fixture
+def index():
+    return StringIndex(LINES)
+
+def test_index_is_deduplicated_and_presorted(index):
+    """The index keeps one sorted copy of the unique lines"""
+    assert len(index) == 3
+    assert index.sorted_lines == sorted(set(LINES))
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_algorithms_find_existing_lines(index, algorithm):
+    """Every algorithm finds each line against the prebuilt index"""
+    for line in LINES:
+        assert index.contains(line, algorithm)
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_algorithms_reject_missing_lines(index, algorithm):
+    """Every algorithm rejects strings that are not in the index"""
+    assert not index.contains("0;0;0;", algorithm)
+    assert not index.contains("99;0;1;", algorithm)
+
+def test_exponential_search_empty_content():
+    """Exponential search on an empty index does not fail"""
+    assert not exponential_search("1;0;", [])
@@ -0,0 +1,38 @@
+import pytest
+from server.server.metrics import MetricsRegistry
+from server.server.search_engines import SEARCH_ENGINES, build_engine, get_engine
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    source = tmp_path / "data.txt"
+    source.write_text("2;0;2;\n1;0;1;\n3;0;3;\n1;0;1;\n")
+    return source
+
+@pytest.mark.parametrize("name", sorted(SEARCH_ENGINES))
+def test_engines_answer_the_same(data_file, tmp_path, name):
+    """Every registered engine finds the same strings"""
+    engine = build_engine(
+        name,
+        str(data_file),
+        filter_path=str(tmp_path / "data.bloom"),
+        metrics=MetricsRegistry(),
+    )
+    assert len(engine) == 3
+    assert engine.contains("1;0;1;") and not engine.contains("1;0;")
+    assert engine.contains_many(["3;0;3;", "4;0;4;"]) == [True, False]
+    stats = engine.describe()
+    assert stats["records"] == 3 and stats["build_time_ms"] >= 0
+    assert stats["memory_bytes"] + stats["mapped_bytes"] > 0
+
+def test_unknown_algorithm(data_file):
+    with pytest.raises(ValueError, match="Unknown search algorithm"):
+        build_engine("quantum", str(data_file))
+    # As checked when the server module is imported
+    with pytest.raises(ValueError, match="expected one of .*mmap"):
+        get_engine("quantum")
+
+def test_missing_file(tmp_path):
+    """Engines report a data file that cannot be loaded as None"""
+    assert build_engine("set", str(tmp_path / "missing.txt")) is None
+    assert build_engine("mmap", str(tmp_path / "missing.txt")) is None
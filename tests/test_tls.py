@@ -0,0 +1,64 @@
+import os
+import ssl
+import pytest
+from server.server.metrics import MetricsRegistry
+from server.server.tls import create_server_context, record_handshake
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CERT_FILE = os.path.join(BASE_DIR, "security/server.crt")
+KEY_FILE = os.path.join(BASE_DIR, "security/server.key")
+# Sessions can only be resumed from the context that created them
+CLIENT_CONTEXT = ssl._create_unverified_context()
+
+
+def handshake(server_context, session=None):
+    """Run a client/server handshake in memory and return both ends"""
+    server_in, server_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    client_in, client_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    server = server_context.wrap_bio(server_in, server_out, server_side=True)
+    client = CLIENT_CONTEXT.wrap_bio(
+        client_in, client_out, server_hostname="localhost", session=session
+    )
+    for _ in range(10):
+        for end in (client, server):
+            try:
+                end.do_handshake()
+            except ssl.SSLWantReadError:
+                pass
+        server_in.write(client_out.read())
+        client_in.write(server_out.read())
+    # Process the TLS 1.3 session tickets sent after the handshake
+    try:
+        client.read(1)
+    except ssl.SSLWantReadError:
+        pass
+    return client, server
+
+def test_sessions_are_resumed_and_counted():
+    """A client offering its previous session skips the full handshake"""
+    context = create_server_context(CERT_FILE, KEY_FILE, ecdh_curve="X25519")
+    metrics = MetricsRegistry()
+    client, server = handshake(context)
+    record_handshake(metrics, server, 0.002)
+    client, server = handshake(context, client.session)
+    assert server.session_reused
+    record_handshake(metrics, server, 0.001)
+    record_handshake(metrics, None)
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["tls_handshakes"] == 1
+    assert snapshot["counters"]["tls_resumed"] == 1
+    assert snapshot["latency_us"]["tls"]["count"] == 1
+    assert snapshot["latency_us"]["tls_resumed"]["count"] == 1
+
+def test_tickets_can_be_disabled():
+    """Without tickets a TLS 1.3 session cannot be resumed"""
+    context = create_server_context(CERT_FILE, KEY_FILE, session_tickets=False)
+    client, _ = handshake(context)
+    _, server = handshake(context, client.session)
+    assert not server.session_reused
+
+def test_invalid_tuning_is_rejected():
+    with pytest.raises(ssl.SSLError):
+        create_server_context(CERT_FILE, KEY_FILE, ciphers="NO-SUCH-CIPHER")
+    with pytest.raises(ValueError):
+        create_server_context(CERT_FILE, KEY_FILE, ecdh_curve="no-such-curve")
@@ -0,0 +1,74 @@
+import socket
+import time
+import pytest
+from server.server.metrics import MetricsRegistry
+from server.server.server import StringSearchServer, WorkerPool, server_context
+
+
+@pytest.fixture
+def pool():
+    return WorkerPool(StringSearchServer(MetricsRegistry()), workers=2, queue_size=4)
+
+def test_pool_serves_queued_connections(pool):
+    """Queued connections are answered by the pool workers"""
+    client, server_side = socket.socketpair()
+    client.sendall(b"3;0;1;28;0;7;5;0;")
+    assert pool.submit(server_side, ("127.0.0.1", 0))
+    assert client.recv(1024) == b"STRING EXISTS"
+    client.close()
+
+def test_pool_rejects_with_busy_response(pool):
+    """Rejected connections get the busy response and are counted"""
+    client, server_side = socket.socketpair()
+    pool.reject(server_side)
+    assert client.recv(1024) == b"SERVER BUSY"
+    assert pool.client_operation.metrics.counters["rejected_connections"].value == 1
+    client.close()
+
+def test_pool_rejects_silent_tls_clients_without_waiting(pool):
+    """A rejected TLS connection is closed at once, not after its handshake"""
+    listener = server_context().wrap_socket(
+        socket.create_server(("127.0.0.1", 0)),
+        server_side=True,
+        do_handshake_on_connect=False,
+    )
+    client = socket.create_connection(listener.getsockname())
+    server_side, _ = listener.accept()
+    server_side.settimeout(5)
+    start = time.monotonic()
+    pool.reject(server_side)
+    assert time.monotonic() - start < 1
+    assert client.recv(1024) == b""
+    client.close()
+    listener.close()
+
+def test_idle_persistent_connections_do_not_hold_workers():
+    """More idle persistent clients than workers are all served"""
+    pool = WorkerPool(StringSearchServer(MetricsRegistry()), workers=1, queue_size=4)
+    clients = []
+    for _ in range(3):
+        client, server_side = socket.socketpair()
+        client.settimeout(5)
+        client.sendall(b"3;0;1;28;0;7;5;0;\n")
+        assert pool.submit(server_side, ("127.0.0.1", 0))
+        assert client.recv(1024) == b"STRING EXISTS\n"
+        clients.append(client)
+    for client in clients:
+        client.sendall(b"0;0;0;\n")
+        assert client.recv(1024) == b"STRING NOT EXIST\n"
+        client.close()
+
+def test_idle_persistent_connections_expire():
+    """A parked connection is closed once idle for the idle timeout"""
+    metrics = MetricsRegistry()
+    pool = WorkerPool(StringSearchServer(metrics), 1, 4, idle_timeout=0.2)
+    client, server_side = socket.socketpair()
+    client.settimeout(5)
+    client.sendall(b"3;0;1;28;0;7;5;0;\n")
+    assert pool.submit(server_side, ("127.0.0.1", 0))
+    assert client.recv(1024) == b"STRING EXISTS\n"
+    start = time.monotonic()
+    assert client.recv(1024) == b""
+    assert 0.1 < time.monotonic() - start < 2
+    assert metrics.gauges["active_connections"].value == 0
+    client.close()